@@ -10,16 +10,35 @@ Double-click this file to run the application.
 
 import os
 import sys
-import zipfile
-import shutil
-import re
+import time
 import threading
-import json
-from pathlib import Path
+import collections
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import logging
 
+from extractor import engine as extractor_engine
+from extractor.engine import ExtractorEngine, SETTINGS_FILE
+from extractor.report import format_size
+from extractor.progress import format_rate, format_eta
+from extractor.planner import plan_extraction
+from extractor.tags import TAG_PROBE_MODES
+
+# Found Files table: rows are inserted in slices of at most this many
+# milliseconds so a large scan never blocks the event loop for long
+TREE_SLICE_MS = 15
+
+# How often the status bar shows extraction progress, in milliseconds
+PROGRESS_POLL_MS = 250
+
+# Sort keys for the Found Files columns
+TREE_SORT_KEYS = {
+    'Artist': lambda zip_info: zip_info['artist'].casefold(),
+    'Album': lambda zip_info: zip_info['album'].casefold(),
+    'Filename': lambda zip_info: zip_info['filename'].casefold(),
+    'Status': lambda zip_info: bool(zip_info.get('in_library'))
+}
+
 # Suppress console window on Windows when running as GUI
 if sys.platform.startswith('win'):
     import ctypes
@@ -197,16 +216,66 @@ def configure_styles():
 
 # Create a custom logging handler for the GUI
 class GUILogHandler(logging.Handler):
-    def __init__(self, text_widget):
+    """Show log records in a text widget without flooding the Tk event loop
+
+    emit() only queues the formatted line, so it is cheap and safe to call
+    from worker threads. The queue is drained into the widget in one insert
+    every flush_interval milliseconds, and the widget keeps at most
+    max_lines lines, dropping the oldest. Lines that never reach the widget
+    are counted and reported in a single notice; use a file sink for the
+    full history.
+    """
+
+    def __init__(self, text_widget, max_lines=5000, flush_interval=100):
         super().__init__()
         self.text_widget = text_widget
-        
+        self.max_lines = max(1, int(max_lines))
+        self.flush_interval = flush_interval
+        # Anything older than max_lines would be trimmed from the view anyway
+        self.pending = collections.deque(maxlen=self.max_lines)
+        self.dropped = 0
+        self.pending_lock = threading.Lock()
+        self.text_widget.after(self.flush_interval, self._drain_pending)
+
     def emit(self, record):
-        msg = self.format(record)
-        def append():
-            self.text_widget.insert(tk.END, msg + '\n')
-            self.text_widget.see(tk.END)
-        self.text_widget.after(0, append)
+        try:
+            msg = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self.pending_lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(msg)
+
+    def flush(self):
+        """Do nothing: queued lines are written by the Tk event loop
+
+        logging.shutdown() and others call flush() from any thread, where
+        touching the widget or scheduling more callbacks is not safe.
+        """
+
+    def _drain_pending(self):
+        """Write queued lines to the widget and schedule the next drain"""
+        with self.pending_lock:
+            lines = list(self.pending)
+            self.pending.clear()
+            dropped, self.dropped = self.dropped, 0
+        try:
+            if lines:
+                if dropped:
+                    notice = f"... {dropped} earlier log lines not shown ..."
+                    lines = [notice] + lines[len(lines) - self.max_lines + 1:]
+                self.text_widget.insert(tk.END, '\n'.join(lines) + '\n')
+                # The text always ends with an empty line after the last newline
+                line_count = int(self.text_widget.index('end-1c').split('.')[0]) - 1
+                if line_count > self.max_lines:
+                    self.text_widget.delete('1.0', f"{line_count - self.max_lines + 1}.0")
+                self.text_widget.see(tk.END)
+            self.text_widget.after(self.flush_interval, self._drain_pending)
+        except tk.TclError:
+            # The window is being destroyed
+            pass
 
 class MusicExtractorGUI:
     def __init__(self, root):
@@ -222,33 +291,32 @@ class MusicExtractorGUI:
         # Center the window on screen
         self.center_window()
         
-        # Configuration - user can modify these
-        self.downloads_folder = os.path.expanduser("~/Downloads")
-        self.music_library_path = os.path.expanduser("~/Music")  # Changed to just /Music for cleaner structure
-        
         # Settings file path
-        self.settings_file = os.path.join(os.path.expanduser("~"), ".music_extractor_settings.json")
+        self.settings_file = SETTINGS_FILE
         
         # Setup logging first (before load_settings which might use logger)
         self.setup_logging()
         
-        # Format patterns - user can select from dropdown (define before load_settings)
-        self.format_patterns = {
-            "Artist - Album.zip": r"^(.+?)\s*-\s*(.+?)\.zip$",
-            "Artist_Album.zip": r"^(.+?)_(.+?)\.zip$",
-            "Artist.Album.zip": r"^(.+?)\.(.+?)\.zip$",
-            "Album by Artist.zip": r"^(.+?)\s+by\s+(.+?)\.zip$",
-            "Artist - Album - Year.zip": r"^(.+?)\s*-\s*(.+?)\s*-\s*\d{4}\.zip$"
-        }
-        self.current_pattern = "Artist - Album.zip"
-        self.zip_pattern = self.format_patterns[self.current_pattern]
-        
-        # Load saved settings (after patterns are defined)
+        # Load saved settings and create the extraction engine the GUI drives
         self.load_settings()
+        self.engine = ExtractorEngine.from_settings(self.settings, logger=self.logger)
+        
+        # Format names - user can select from dropdown, including custom formats
+        self.format_patterns = self.engine.format_names()
         
         # Create GUI
         self.create_widgets()
         
+        # Finish or clean up after an extraction that was killed part way,
+        # once the window (and its log) is showing
+        self.root.after(100, self.recover_interrupted)
+        
+    def recover_interrupted(self):
+        """Resume or undo archives left behind by an interrupted extraction"""
+        completed = self.engine.recover()
+        if completed:
+            self.show_success(f"Completed {completed} albums from an interrupted extraction")
+        
     def setup_logging(self):
         """Setup logging to display in GUI"""
         # Configure logging
@@ -288,7 +356,7 @@ class MusicExtractorGUI:
         ttk.Label(header_frame, text="Format:", font=('Segoe UI', 9)).grid(row=0, column=1, sticky=tk.W, padx=(0, 5))
         self.format_var = tk.StringVar(value=self.current_pattern)
         format_combo = ttk.Combobox(header_frame, textvariable=self.format_var, 
-                                   values=list(self.format_patterns.keys()),
+                                   values=self.format_patterns,
                                    state='readonly', style='Modern.TCombobox', width=20)
         format_combo.grid(row=0, column=2, sticky=tk.W, padx=(0, 5))
         format_combo.bind('<<ComboboxSelected>>', self.on_format_change)
@@ -320,11 +388,40 @@ class MusicExtractorGUI:
                   command=self.browse_music_library).grid(row=1, column=2, pady=(5, 0))
         
         # Auto delete checkbox
-        self.auto_delete_var = tk.BooleanVar(value=True)  # Checked by default
+        self.auto_delete_var = tk.BooleanVar(value=self.settings.get('auto_delete_zip', True))
         auto_delete_check = ttk.Checkbutton(settings_frame, text="Auto delete zip after extracting", 
                                           variable=self.auto_delete_var, 
                                           command=self.on_auto_delete_change)
-        auto_delete_check.grid(row=2, column=0, columnspan=3, sticky=tk.W, pady=(10, 0))
+        auto_delete_check.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(10, 0))
+        
+        # Parallel extraction workers
+        jobs_frame = ttk.Frame(settings_frame)
+        jobs_frame.grid(row=2, column=1, columnspan=2, sticky=tk.E, pady=(10, 0))
+        ttk.Label(jobs_frame, text="Parallel jobs:", font=('Segoe UI', 9)).pack(side=tk.LEFT, padx=(0, 5))
+        self.jobs_var = tk.StringVar(value=str(self.settings.get('jobs', 1)))
+        jobs_combo = ttk.Combobox(jobs_frame, textvariable=self.jobs_var,
+                                  values=[str(n) for n in range(1, max(8, os.cpu_count() or 1) + 1)],
+                                  state='readonly', style='Modern.TCombobox', width=4)
+        jobs_combo.pack(side=tk.LEFT)
+        jobs_combo.bind('<<ComboboxSelected>>', self.on_jobs_change)
+        
+        # Recursive scan checkbox; depth and globs are in the settings file
+        self.recursive_var = tk.BooleanVar(value=self.settings.get('recursive', False))
+        recursive_check = ttk.Checkbutton(settings_frame, text="Scan subfolders of the downloads folder",
+                                          variable=self.recursive_var,
+                                          command=self.on_recursive_change)
+        recursive_check.grid(row=3, column=0, columnspan=3, sticky=tk.W, pady=(5, 0))
+        
+        # Artist/album from audio tags inside the zip
+        tags_frame = ttk.Frame(settings_frame)
+        tags_frame.grid(row=3, column=1, columnspan=2, sticky=tk.E, pady=(5, 0))
+        ttk.Label(tags_frame, text="Read tags:", font=('Segoe UI', 9)).pack(side=tk.LEFT, padx=(0, 5))
+        self.tag_probe_var = tk.StringVar(value=self.settings.get('tag_probe', 'off'))
+        tags_combo = ttk.Combobox(tags_frame, textvariable=self.tag_probe_var,
+                                  values=list(TAG_PROBE_MODES),
+                                  state='readonly', style='Modern.TCombobox', width=8)
+        tags_combo.pack(side=tk.LEFT)
+        tags_combo.bind('<<ComboboxSelected>>', self.on_tag_probe_change)
         
         # Compact action area
         action_frame = ttk.Frame(self.main_frame)
@@ -387,10 +484,22 @@ class MusicExtractorGUI:
         self.create_expandable_section()
         
         # Setup GUI logging handler (after log_text is created)
-        self.gui_handler = GUILogHandler(self.log_text)
-        self.gui_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        self.gui_handler = GUILogHandler(self.log_text,
+                                         max_lines=self.settings.get('log_max_lines', 5000))
+        self.gui_handler.setFormatter(log_formatter)
         self.logger.addHandler(self.gui_handler)
         
+        # Optional file sink keeping the full history the log view trims
+        if self.settings.get('log_file'):
+            try:
+                file_handler = logging.FileHandler(os.path.expanduser(self.settings['log_file']),
+                                                   encoding='utf-8')
+                file_handler.setFormatter(log_formatter)
+                self.logger.addHandler(file_handler)
+            except OSError as e:
+                self.logger.error(f"Could not open log file: {e}")
+        
         # Store found music zips
         self.music_zips = []
         
@@ -417,18 +526,34 @@ class MusicExtractorGUI:
         files_frame = ttk.Frame(notebook)
         notebook.add(files_frame, text="📋 Found Files")
         
+        # Filter box; filtering and sorting work on self.music_zips, and the
+        # table only ever shows the result
+        filter_frame = ttk.Frame(files_frame)
+        filter_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 3))
+        ttk.Label(filter_frame, text="Filter:", font=('Segoe UI', 9)).pack(side=tk.LEFT, padx=(0, 5))
+        self.tree_filter_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.tree_filter_var,
+                  style='Modern.TEntry').pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.tree_filter_var.trace_add('write', lambda *args: self.on_tree_filter_change())
+        self.tree_filter_job = None
+        self.tree_sort_column = None
+        self.tree_sort_reverse = False
+        self.tree_generation = 0
+        self.tree_rows = []
+        
         # Create treeview for file preview
-        columns = ('Artist', 'Album', 'Filename')
+        columns = ('Artist', 'Album', 'Filename', 'Status')
         self.file_tree = ttk.Treeview(files_frame, columns=columns, show='headings', height=3)
         
-        # Configure columns
-        self.file_tree.heading('Artist', text='Artist')
-        self.file_tree.heading('Album', text='Album')
-        self.file_tree.heading('Filename', text='Filename')
+        # Configure columns; clicking a heading sorts by it
+        for column in columns:
+            self.file_tree.heading(column, text=column,
+                                   command=lambda c=column: self.sort_file_tree(c))
         
         self.file_tree.column('Artist', width=120, minwidth=100)
         self.file_tree.column('Album', width=150, minwidth=120)
         self.file_tree.column('Filename', width=200, minwidth=150)
+        self.file_tree.column('Status', width=90, minwidth=80)
         
         # Add scrollbar for treeview
         tree_scroll = ttk.Scrollbar(files_frame, orient=tk.VERTICAL, command=self.file_tree.yview)
@@ -468,45 +593,35 @@ class MusicExtractorGUI:
         
     def save_settings(self):
         """Save current settings to file"""
-        settings = {
+        self.settings.update({
             'downloads_folder': self.downloads_folder,
             'music_library_path': self.music_library_path,
             'current_pattern': self.current_pattern,
-            'auto_delete_zip': self.auto_delete_var.get()
-        }
-        try:
-            with open(self.settings_file, 'w') as f:
-                json.dump(settings, f, indent=2)
-        except Exception as e:
-            if hasattr(self, 'logger'):
-                self.logger.error(f"Could not save settings: {e}")
-            else:
-                print(f"Could not save settings: {e}")
+            'auto_delete_zip': self.auto_delete_var.get(),
+            'jobs': int(self.jobs_var.get()),
+            'recursive': self.recursive_var.get(),
+            'tag_probe': self.tag_probe_var.get()
+        })
+        extractor_engine.save_settings(self.settings, self.settings_file, logger=self.logger)
             
     def load_settings(self):
         """Load settings from file"""
-        try:
-            if os.path.exists(self.settings_file):
-                with open(self.settings_file, 'r') as f:
-                    settings = json.load(f)
-                    self.downloads_folder = settings.get('downloads_folder', self.downloads_folder)
-                    self.music_library_path = settings.get('music_library_path', self.music_library_path)
-                    
-                    # Load pattern setting and update zip_pattern
-                    saved_pattern = settings.get('current_pattern', self.current_pattern)
-                    if saved_pattern in self.format_patterns:
-                        self.current_pattern = saved_pattern
-                        self.zip_pattern = self.format_patterns[self.current_pattern]
-                    
-                    # Load auto_delete setting, default to True if not found
-                    auto_delete_setting = settings.get('auto_delete_zip', True)
-                    if hasattr(self, 'auto_delete_var'):
-                        self.auto_delete_var.set(auto_delete_setting)
-        except Exception as e:
-            if hasattr(self, 'logger'):
-                self.logger.error(f"Could not load settings: {e}")
-            else:
-                print(f"Could not load settings: {e}")
+        self.settings = extractor_engine.load_settings(self.settings_file, logger=self.logger)
+        self.downloads_folder = self.settings['downloads_folder']
+        self.music_library_path = self.settings['music_library_path']
+        self.current_pattern = self.settings['current_pattern']
+        
+    def sync_engine(self):
+        """Push the current GUI settings into the extraction engine"""
+        self.downloads_folder = self.downloads_var.get()
+        self.music_library_path = self.music_lib_var.get()
+        self.engine.downloads_folder = self.downloads_folder
+        self.engine.music_library_path = self.music_library_path
+        self.engine.set_pattern(self.current_pattern)
+        self.engine.auto_delete = self.auto_delete_var.get()
+        self.engine.jobs = int(self.jobs_var.get())
+        self.engine.recursive = self.recursive_var.get()
+        self.engine.tag_probe = self.tag_probe_var.get()
         
     def center_window(self):
         """Center the window on the screen"""
@@ -533,11 +648,29 @@ class MusicExtractorGUI:
             self.music_library_path = folder
             self.save_settings()
             
+    def on_jobs_change(self, event):
+        """Handle parallel jobs selection change"""
+        self.engine.jobs = int(self.jobs_var.get())
+        self.logger.info(f"Parallel extraction jobs: {self.engine.jobs}")
+        self.save_settings()
+            
     def on_auto_delete_change(self):
         """Handle auto delete checkbox change"""
         auto_delete = self.auto_delete_var.get()
         self.logger.info(f"Auto delete zip files: {'Enabled' if auto_delete else 'Disabled'}")
         self.save_settings()
+        
+    def on_recursive_change(self):
+        """Handle recursive scan checkbox change"""
+        recursive = self.recursive_var.get()
+        self.logger.info(f"Scan subfolders: {'Enabled' if recursive else 'Disabled'}")
+        self.save_settings()
+        
+    def on_tag_probe_change(self, event):
+        """Handle tag reading mode selection change"""
+        self.engine.tag_probe = self.tag_probe_var.get()
+        self.logger.info(f"Read artist/album from tags: {self.engine.tag_probe}")
+        self.save_settings()
             
     def open_extract_folder(self):
         """Open the extract folder in file manager"""
@@ -557,18 +690,68 @@ class MusicExtractorGUI:
             
         
     def populate_file_tree(self):
-        """Populate the file preview tree with found music zips"""
-        # Clear existing items
-        for item in self.file_tree.get_children():
-            self.file_tree.delete(item)
-            
-        # Add found files to tree
-        for zip_info in self.music_zips:
+        """Show the found music zips, filtered and sorted, in the file preview tree"""
+        rows = self.music_zips
+        query = self.tree_filter_var.get().strip().casefold()
+        if query:
+            rows = [zip_info for zip_info in rows
+                    if query in zip_info['artist'].casefold()
+                    or query in zip_info['album'].casefold()]
+        if self.tree_sort_column:
+            rows = sorted(rows, key=TREE_SORT_KEYS[self.tree_sort_column],
+                          reverse=self.tree_sort_reverse)
+        self.tree_rows = rows
+        
+        # Clear existing items in one call; a newer generation cancels any
+        # insertion still in progress
+        self.tree_generation += 1
+        self.file_tree.delete(*self.file_tree.get_children())
+        self.insert_tree_rows(self.tree_generation, 0)
+        
+    def insert_tree_rows(self, generation, start):
+        """Insert tree rows from start for one time slice, then yield to Tk"""
+        if generation != self.tree_generation:
+            return
+        rows = self.tree_rows
+        deadline = time.perf_counter() + TREE_SLICE_MS / 1000
+        index = start
+        while index < len(rows):
+            zip_info = rows[index]
             self.file_tree.insert('', 'end', values=(
                 zip_info['artist'],
                 zip_info['album'],
-                zip_info['filename']
+                zip_info['filename'],
+                'In library' if zip_info.get('in_library') else 'New'
             ))
+            index += 1
+            if index % 100 == 0 and time.perf_counter() > deadline:
+                break
+        if index < len(rows):
+            self.root.after(1, lambda: self.insert_tree_rows(generation, index))
+            
+    def sort_file_tree(self, column):
+        """Sort the file preview by column, toggling the order on repeated clicks"""
+        if self.tree_sort_column == column:
+            self.tree_sort_reverse = not self.tree_sort_reverse
+        else:
+            self.tree_sort_column = column
+            self.tree_sort_reverse = False
+        for name in TREE_SORT_KEYS:
+            arrow = ''
+            if name == column:
+                arrow = ' ▼' if self.tree_sort_reverse else ' ▲'
+            self.file_tree.heading(name, text=name + arrow)
+        self.populate_file_tree()
+        
+    def on_tree_filter_change(self):
+        """Refilter the file preview once typing pauses"""
+        if self.tree_filter_job is not None:
+            self.root.after_cancel(self.tree_filter_job)
+        self.tree_filter_job = self.root.after(200, self.apply_tree_filter)
+        
+    def apply_tree_filter(self):
+        self.tree_filter_job = None
+        self.populate_file_tree()
         
     def update_status(self, icon, message, color='black'):
         """Update the status notification"""
@@ -643,7 +826,7 @@ class MusicExtractorGUI:
         if hasattr(self, 'loading_dialog') and self.loading_dialog.winfo_exists():
             self.loading_dialog.destroy()
         
-    def show_success_dialog(self, processed, failed, extracted_files=None):
+    def show_success_dialog(self, processed, failed, report=None):
         """Show a custom success dialog with green styling and countdown timer"""
         dialog = tk.Toplevel(self.root)
         dialog.title("Extraction Complete")
@@ -689,56 +872,47 @@ class MusicExtractorGUI:
                                    bg='#28a745', fg='#ffcccb')  # Light red on green
             failed_label.pack(pady=(0, 10))
         
-        # Extracted files list
-        if extracted_files and len(extracted_files) > 0:
-            # Header for extracted files
-            files_header = tk.Label(main_frame, text="Extracted files:", 
+        # Per-album results; a single Treeview handles thousands of rows
+        if report and report.rows:
+            files_header = tk.Label(main_frame, text="Results:", 
                                    font=('Segoe UI', 11, 'bold'), 
                                    bg='#28a745', fg='#ffffff')
             files_header.pack(pady=(10, 5), anchor='w')
             
-            # Create a frame for the scrollable list
             list_frame = tk.Frame(main_frame, bg='#28a745')
-            list_frame.pack(fill=tk.X, pady=(0, 10))
+            list_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
             
-            # Create a canvas and scrollbar for the file list
-            canvas = tk.Canvas(list_frame, bg='#28a745', highlightthickness=0, height=120)
-            scrollbar = tk.Scrollbar(list_frame, orient="vertical", command=canvas.yview)
-            scrollable_frame = tk.Frame(canvas, bg='#28a745')
+            columns = ('Status', 'Album', 'Size', 'Time', 'Destination')
+            results_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=5)
+            for column in columns:
+                results_tree.heading(column, text=column)
+            results_tree.column('Status', width=70, minwidth=60)
+            results_tree.column('Album', width=150, minwidth=100)
+            results_tree.column('Size', width=70, minwidth=60, anchor='e')
+            results_tree.column('Time', width=50, minwidth=45, anchor='e')
+            results_tree.column('Destination', width=200, minwidth=100)
             
-            scrollable_frame.bind(
-                "<Configure>",
-                lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-            )
+            for row in report.rows:
+                results_tree.insert('', 'end', values=(
+                    row['status'].capitalize(),
+                    f"{row['artist']} - {row['album']}",
+                    format_size(row['bytes']),
+                    f"{row['duration']:.1f}s",
+                    row['destination']
+                ))
             
-            canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-            canvas.configure(yscrollcommand=scrollbar.set)
+            scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=results_tree.yview)
+            results_tree.configure(yscrollcommand=scrollbar.set)
+            results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
             
-            # Add extracted files to the list
-            for i, file_info in enumerate(extracted_files):
-                # Create destination path
-                dest_path = os.path.join(self.music_library_path, file_info['artist'], file_info['album'])
-                
-                # File info frame
-                file_frame = tk.Frame(scrollable_frame, bg='#28a745')
-                file_frame.pack(fill=tk.X, pady=2)
-                
-                # Artist - Album
-                artist_album = f"{file_info['artist']} - {file_info['album']}"
-                artist_label = tk.Label(file_frame, text=artist_album, 
-                                      font=('Segoe UI', 9, 'bold'), 
-                                      bg='#28a745', fg='#ffffff', anchor='w')
-                artist_label.pack(fill=tk.X, padx=(0, 5))
-                
-                # Destination path
-                path_label = tk.Label(file_frame, text=f"→ {dest_path}", 
-                                    font=('Segoe UI', 8), 
-                                    bg='#28a745', fg='#e8f5e8', anchor='w')  # Light green
-                path_label.pack(fill=tk.X, padx=(10, 5))
-            
-            # Pack canvas and scrollbar
-            canvas.pack(side="left", fill="both", expand=True)
-            scrollbar.pack(side="right", fill="y")
+            export_button = tk.Button(main_frame, text="Export Report...", 
+                                     command=lambda: self.export_report(report, dialog),
+                                     font=('Segoe UI', 9),
+                                     bg='#28a745', fg='#000000',
+                                     relief='flat', borderwidth=1,
+                                     padx=10, pady=4)
+            export_button.pack(anchor='e')
         
         # Close button below the output section
         close_button = tk.Button(main_frame, text="Close", 
@@ -756,12 +930,26 @@ class MusicExtractorGUI:
         dialog.bind('<Return>', lambda e: dialog.destroy())
         dialog.bind('<Escape>', lambda e: dialog.destroy())
         
+    def export_report(self, report, parent=None):
+        """Save an extraction report as JSON or CSV"""
+        path = filedialog.asksaveasfilename(
+            parent=parent, title="Export Report", defaultextension='.json',
+            filetypes=[('JSON', '*.json'), ('CSV', '*.csv')])
+        if not path:
+            return
+        try:
+            report.export(path)
+            self.logger.info(f"Report saved to: {path}")
+        except OSError as e:
+            self.logger.error(f"Could not save report: {e}")
+            messagebox.showerror("Error", f"Could not save report: {e}", parent=parent)
+            
     def on_format_change(self, event):
         """Handle format dropdown selection change"""
         selected_format = self.format_var.get()
         if selected_format in self.format_patterns:
             self.current_pattern = selected_format
-            self.zip_pattern = self.format_patterns[selected_format]
+            self.engine.set_pattern(selected_format)
             self.logger.info(f"Format changed to: {selected_format}")
             self.show_success(f"Format updated to: {selected_format}")
             self.save_settings()
@@ -794,35 +982,12 @@ class MusicExtractorGUI:
         self.files_processed_label.config(text=f"Processed: {processed}")
         self.files_failed_label.config(text=f"Failed: {failed}")
         
-    def validate_paths(self):
-        """Validate that the configured paths exist and are accessible"""
-        errors = []
-        
-        # Check downloads folder
-        if not os.path.exists(self.downloads_folder):
-            errors.append(f"Downloads folder does not exist: {self.downloads_folder}")
-        elif not os.access(self.downloads_folder, os.R_OK):
-            errors.append(f"No read access to downloads folder: {self.downloads_folder}")
-            
-        # Check music library path
-        if not os.path.exists(self.music_library_path):
-            try:
-                os.makedirs(self.music_library_path, exist_ok=True)
-                self.logger.info(f"Created music library directory: {self.music_library_path}")
-            except Exception as e:
-                errors.append(f"Cannot create music library directory: {self.music_library_path} - {e}")
-        elif not os.access(self.music_library_path, os.W_OK):
-            errors.append(f"No write access to music library folder: {self.music_library_path}")
-            
-        return errors
-        
     def scan_music_zips(self):
         """Scan for music zip files"""
-        self.downloads_folder = self.downloads_var.get()
-        self.music_library_path = self.music_lib_var.get()
+        self.sync_engine()
         
         # Validate paths first
-        path_errors = self.validate_paths()
+        path_errors = self.engine.validate_paths()
         if path_errors:
             error_msg = "Path validation failed:\n" + "\n".join(path_errors)
             self.logger.error(error_msg)
@@ -832,11 +997,17 @@ class MusicExtractorGUI:
         
         self.show_processing("Scanning for music zip files...")
         self.logger.info("Scanning for music zip files...")
-        self.music_zips = self.find_music_zips()
+        self.music_zips = self.engine.find_music_zips()
         
         if self.music_zips:
             self.logger.info(f"Found {len(self.music_zips)} music zip files")
-            self.show_success(f"Found {len(self.music_zips)} files ready to extract")
+            # Mark archives that are already in the library unchanged
+            self.engine.mark_processed(self.music_zips)
+            in_library = sum(1 for zip_info in self.music_zips if zip_info['in_library'])
+            if in_library:
+                self.show_success(f"Found {len(self.music_zips)} files, {in_library} already in library")
+            else:
+                self.show_success(f"Found {len(self.music_zips)} files ready to extract")
             self.extract_button.config(state=tk.NORMAL, style='Success.TButton')
             self.update_statistics(found=len(self.music_zips))
             # Populate the file preview tree
@@ -847,85 +1018,146 @@ class MusicExtractorGUI:
             self.extract_button.config(state=tk.DISABLED, style='Disabled.TButton')
             self.update_statistics(found=0)
             # Clear the file tree
-            for item in self.file_tree.get_children():
-                self.file_tree.delete(item)
+            self.populate_file_tree()
             
-    def find_music_zips(self):
-        """Find all zip files matching the pattern in Downloads folder"""
-        if not os.path.exists(self.downloads_folder):
-            self.logger.error(f"Downloads folder not found: {self.downloads_folder}")
-            return []
-        
-        music_zips = []
-        for file in os.listdir(self.downloads_folder):
-            if file.lower().endswith('.zip'):
-                match = re.match(self.zip_pattern, file, re.IGNORECASE)
-                if match:
-                    artist_name = match.group(1).strip()
-                    album_name = match.group(2).strip()
-                    zip_path = os.path.join(self.downloads_folder, file)
-                    music_zips.append({
-                        'zip_path': zip_path,
-                        'filename': file,
-                        'artist': artist_name,
-                        'album': album_name
-                    })
-                    self.logger.info(f"Found: {file} -> Artist: '{artist_name}', Album: '{album_name}'")
-        
-        return music_zips
-        
     def extract_all(self):
-        """Extract all found music zip files"""
+        """Plan the extraction of all found music zip files, then confirm it"""
         if not self.music_zips:
             self.show_error("No music zip files found. Please scan first.")
             messagebox.showwarning("No Files", "No music zip files found. Please scan first.")
             return
             
+        self.sync_engine()
+        self.show_processing("Checking archives and free space...")
+        self.extract_button.config(state=tk.DISABLED, style='Disabled.TButton')
+        # Reading central directories may be slow on network folders
+        thread = threading.Thread(target=self._plan_thread)
+        thread.daemon = True
+        thread.start()
+        
+    def _plan_thread(self):
+        """Build the extraction plan in a separate thread"""
+        try:
+            plan = plan_extraction(self.engine, self.music_zips)
+        except Exception as e:
+            self.logger.error(f"Could not plan extraction: {e}")
+            self.root.after(0, self.start_extraction)
+            return
+        for line in plan.summary_lines():
+            self.logger.info(f"Plan: {line}")
+        self.root.after(0, lambda: self.show_plan_dialog(plan))
+        
+    def show_plan_dialog(self, plan):
+        """Show what Extract will do and let the user start or cancel it"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Extraction Plan")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        x = self.root.winfo_x() + (self.root.winfo_width() // 2) - 275
+        y = self.root.winfo_y() + (self.root.winfo_height() // 2) - 200
+        dialog.geometry(f"550x400+{x}+{y}")
+        
+        main_frame = ttk.Frame(dialog, padding=15)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        summary = plan.summary_lines()
+        ttk.Label(main_frame, text=summary[0], font=('Segoe UI', 11, 'bold')).pack(anchor='w')
+        ttk.Label(main_frame, text=summary[1], font=('Segoe UI', 9)).pack(anchor='w', pady=(2, 8))
+        for fs in plan.filesystems:
+            text = f"{fs['path']}: needs {format_size(fs['required'])}, {format_size(fs['free'])} free"
+            if not fs['fits']:
+                text += " — not enough space"
+            ttk.Label(main_frame, text=text, font=('Segoe UI', 9),
+                      foreground='#000000' if fs['fits'] else '#dc3545').pack(anchor='w')
+        
+        # Archives that replace an album or will fail
+        issues = [(entry, entry['problem'] or entry['conflict'])
+                  for entry in plan.archives if entry['problem'] or entry['conflict']]
+        if issues:
+            ttk.Label(main_frame, text="Check before extracting:",
+                      font=('Segoe UI', 9, 'bold')).pack(anchor='w', pady=(10, 3))
+            list_frame = ttk.Frame(main_frame)
+            list_frame.pack(fill=tk.BOTH, expand=True)
+            columns = ('Archive', 'Issue')
+            issues_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=6)
+            for column in columns:
+                issues_tree.heading(column, text=column)
+            issues_tree.column('Archive', width=200, minwidth=100)
+            issues_tree.column('Issue', width=300, minwidth=100)
+            for entry, issue in issues:
+                prefix = "Will fail: " if entry['problem'] else f"{entry['action'].capitalize()}: "
+                issues_tree.insert('', 'end', values=(entry['filename'], prefix + issue))
+            scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=issues_tree.yview)
+            issues_tree.configure(yscrollcommand=scrollbar.set)
+            issues_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        def cancel():
+            dialog.destroy()
+            self.extract_button.config(state=tk.NORMAL, style='Success.TButton')
+            self.update_status("ℹ️", "Extraction cancelled")
+            
+        def confirm():
+            dialog.destroy()
+            self.start_extraction()
+        
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(12, 0))
+        ttk.Button(button_frame, text="Cancel", command=cancel).pack(side=tk.RIGHT)
+        extract_button = ttk.Button(button_frame,
+                                    text="Extract" if plan.fits else "Extract Anyway",
+                                    command=confirm)
+        extract_button.pack(side=tk.RIGHT, padx=(0, 8))
+        extract_button.focus_set()
+        dialog.protocol("WM_DELETE_WINDOW", cancel)
+        dialog.bind('<Escape>', lambda e: cancel())
+        
+    def start_extraction(self):
+        """Extract all found music zip files"""
         self.show_processing("Starting extraction process...")
         # Show loading dialog
         self.show_extraction_loading()
         # Run extraction in a separate thread to prevent GUI freezing
+        self.engine.progress = None
+        self.current_file = None
         thread = threading.Thread(target=self._extract_all_thread)
         thread.daemon = True
         thread.start()
+        self.root.after(PROGRESS_POLL_MS, lambda: self.poll_progress(thread))
+        
+    def poll_progress(self, thread):
+        """Show bytes extracted, throughput and ETA while thread runs"""
+        if not thread.is_alive():
+            return
+        progress = self.engine.progress
+        if progress is not None and progress.total:
+            done, total, rate, eta = progress.snapshot()
+            self.progress_var.set(done * 100 / total)
+            status = f"{done * 100 // total}% · {format_size(done)} of {format_size(total)} · " \
+                     f"{format_rate(rate)} · ETA {format_eta(eta)}"
+            if self.current_file:
+                status = f"Processing {self.current_file} — {status}"
+            self.show_processing(status)
+        self.root.after(PROGRESS_POLL_MS, lambda: self.poll_progress(thread))
         
     def _extract_all_thread(self):
         """Extract all files in a separate thread"""
         self.extract_button.config(state=tk.DISABLED, style='Disabled.TButton')
         self.scan_button.config(state=tk.DISABLED)
         
-        try:
-            # Ensure music library exists
-            self.ensure_music_library_exists()
+        def on_start(i, total_files, zip_info):
+            # Shown with the byte progress by poll_progress
+            self.current_file = zip_info['filename']
             
-            total_files = len(self.music_zips)
-            processed = 0
-            failed = 0
-            
-            for i, zip_info in enumerate(self.music_zips):
-                progress_percent = (i / total_files) * 100
-                self.progress_var.set(progress_percent)
-                
-                # Update status with current file being processed
-                current_file = zip_info['filename']
-                self.root.after(0, lambda f=current_file, p=progress_percent: 
-                    self.show_processing(f"Processing {f} ({p:.1f}%)"))
-                
-                self.root.update_idletasks()
-                
-                if self.process_music_zip(zip_info):
-                    processed += 1
-                    self.logger.info(f"✓ Successfully processed: {current_file}")
-                else:
-                    failed += 1
-                    self.logger.error(f"✗ Failed to process: {current_file}")
-                    
-                # Update statistics in real-time
-                self.root.after(0, lambda p=processed, f=failed: 
-                    self.update_statistics(processed=p, failed=f))
-                    
+        def on_done(zip_info, ok, processed, failed):
+            # The progress bar follows bytes extracted (see poll_progress);
+            # update statistics in real-time
+            self.root.after(0, lambda p=processed, f=failed: 
+                self.update_statistics(processed=p, failed=f))
+        
+        try:
+            processed, failed = self.engine.extract_all(self.music_zips, on_start, on_done)
             self.progress_var.set(100)
-            self.logger.info(f"Processing complete. Successfully processed: {processed}, Failed: {failed}")
             
             # Update statistics
             self.root.after(0, lambda: self.update_statistics(
@@ -933,7 +1165,7 @@ class MusicExtractorGUI:
             
             # Hide loading dialog and show completion message
             self.root.after(0, lambda: self.hide_extraction_loading())
-            self.root.after(0, lambda: self.show_success_dialog(processed, failed, self.music_zips))
+            self.root.after(0, lambda: self.show_success_dialog(processed, failed, self.engine.report))
             self.root.after(0, lambda: self.show_success("Extraction completed successfully"))
                 
         except Exception as e:
@@ -946,102 +1178,6 @@ class MusicExtractorGUI:
             self.extract_button.config(state=tk.NORMAL)
             self.scan_button.config(state=tk.NORMAL)
             self.progress_var.set(0)
-            
-    def ensure_music_library_exists(self):
-        """Ensure the music library directory exists"""
-        Path(self.music_library_path).mkdir(parents=True, exist_ok=True)
-        self.logger.info(f"Music library directory ensured: {self.music_library_path}")
-        
-    def extract_album_folder(self, zip_path):
-        """Extract the album folder from the zip file"""
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                file_list = zip_ref.namelist()
-                
-                album_folders = set()
-                for file_path in file_list:
-                    parts = file_path.split('/')
-                    if len(parts) > 1 and parts[0]:
-                        album_folders.add(parts[0])
-                
-                if len(album_folders) == 1:
-                    album_folder_name = list(album_folders)[0]
-                    self.logger.info(f"Found album folder in zip: {album_folder_name}")
-                    return album_folder_name
-                else:
-                    self.logger.warning(f"Unexpected zip structure in {zip_path}. Found folders: {album_folders}")
-                    return None
-                    
-        except zipfile.BadZipFile:
-            self.logger.error(f"Bad zip file: {zip_path}")
-            return None
-        except Exception as e:
-            self.logger.error(f"Error reading zip file {zip_path}: {e}")
-            return None
-            
-    def process_music_zip(self, zip_info):
-        """Process a single music zip file"""
-        zip_path = zip_info['zip_path']
-        artist_name = zip_info['artist']
-        album_name = zip_info['album']
-        
-        self.logger.info(f"Processing: {zip_info['filename']}")
-        
-        # Create artist directory - always organize as /Music/Artist/Album/
-        artist_dir = os.path.join(self.music_library_path, artist_name)
-        Path(artist_dir).mkdir(parents=True, exist_ok=True)
-        
-        # Extract album folder from zip
-        album_folder_name = self.extract_album_folder(zip_path)
-        if not album_folder_name:
-            self.logger.error(f"Could not extract album folder from {zip_path}")
-            return False
-        
-        # Create temporary extraction directory
-        temp_dir = os.path.join(self.downloads_folder, f"temp_extract_{os.getpid()}")
-        
-        try:
-            # Extract zip to temporary directory
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # Source and destination paths
-            # Output structure: /Music/Artist/Album/songs
-            source_album_path = os.path.join(temp_dir, album_folder_name)
-            dest_album_path = os.path.join(artist_dir, album_name)
-            
-            # Check if album already exists
-            if os.path.exists(dest_album_path):
-                self.logger.warning(f"Album already exists: {dest_album_path}")
-                # In GUI mode, we'll overwrite by default
-                if os.path.exists(dest_album_path):
-                    shutil.rmtree(dest_album_path)
-            
-            # Move album folder to destination
-            if os.path.exists(source_album_path):
-                shutil.move(source_album_path, dest_album_path)
-                self.logger.info(f"Successfully moved album to: {dest_album_path}")
-            else:
-                self.logger.error(f"Album folder not found after extraction: {source_album_path}")
-                return False
-            
-            # Delete the zip file if auto_delete is enabled
-            if self.auto_delete_var.get():
-                os.remove(zip_path)
-                self.logger.info(f"Deleted zip file: {zip_path}")
-            else:
-                self.logger.info(f"Kept zip file: {zip_path} (auto-delete disabled)")
-            
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Error processing {zip_path}: {e}")
-            return False
-        
-        finally:
-            # Clean up temporary directory
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
 
 def main():
     """Main function to run the GUI application"""
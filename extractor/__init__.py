@@ -0,0 +1,23 @@
+"""
+Music Library Extractor - headless engine package
+
+Importing this package does not import tkinter; the GUI lives in
+Music_Extractor.py and drives the engine defined here.
+"""
+
+from .engine import (ExtractorEngine, DEFAULT_PATTERN, DEFAULT_SETTINGS,
+                     SETTINGS_FILE, load_settings, save_settings)
+from .matching import FORMAT_PATTERNS, FORMAT_PRIORITY, AUTO_FORMAT, FilenameMatcher
+
+__all__ = [
+    'ExtractorEngine',
+    'FORMAT_PATTERNS',
+    'FORMAT_PRIORITY',
+    'AUTO_FORMAT',
+    'FilenameMatcher',
+    'DEFAULT_PATTERN',
+    'DEFAULT_SETTINGS',
+    'SETTINGS_FILE',
+    'load_settings',
+    'save_settings',
+]
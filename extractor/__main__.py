@@ -0,0 +1,7 @@
+"""Allow running the CLI with python3 -m extractor"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,341 @@
+"""
+Music Library Extractor - benchmark suite
+
+Generates a deterministic corpus of album zips and times each ingest stage
+separately, so changes to scanning or extraction can be compared across
+commits:
+
+    python3 -m extractor.bench --workdir /tmp/mx-bench --albums 200 -o before.json
+    python3 -m extractor.bench --workdir /tmp/mx-bench --albums 200 -o after.json \\
+        --compare before.json
+
+The corpus depends only on the generator options and the seed; it is kept
+in the work folder and only rebuilt when those change. Zip names cycle
+through every built-in naming format, so scans run with the Auto format.
+
+Stages:
+    scan               find_music_zips without the scan index
+    scan_indexed       find_music_zips with a warm scan index
+    central_directory  open every zip and locate its album folder
+    extract            extract_all into an empty library
+    move               move every extracted album to a second library
+    delete             remove the album folders and copies of the zips
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import logging
+import zipfile
+import argparse
+import platform
+import statistics
+import subprocess
+
+from .engine import ExtractorEngine
+from .ledger import Ledger
+from .matching import FORMAT_PATTERNS, AUTO_FORMAT
+from .report import format_size
+from .progress import format_rate
+from .scanindex import ScanIndex
+
+# Bump when the generator changes in a way that alters the corpus
+CORPUS_VERSION = 1
+
+STAGES = ('scan', 'scan_indexed', 'central_directory', 'extract', 'move', 'delete')
+
+# Files that are not album zips, left in the downloads folder as noise
+_DOWNLOAD_JUNK = ('setup-{n}.exe', 'notes-{n}.txt', 'photo-{n}.jpg', 'backup{n}.zip')
+
+# Files found next to the tracks in real album zips
+_ALBUM_JUNK = ('cover.jpg', 'album.nfo', 'album.cue', 'scans/back.jpg', 'info.txt')
+
+
+def archive_name(format_name, artist, album, year):
+    """Return a zip file name in one of the built-in naming formats"""
+    if format_name == "Artist - Album.zip":
+        return f"{artist} - {album}.zip"
+    if format_name == "Artist_Album.zip":
+        return f"{artist}_{album}.zip"
+    if format_name == "Artist.Album.zip":
+        return f"{artist}.{album}.zip"
+    if format_name == "Album by Artist.zip":
+        return f"{album} by {artist}.zip"
+    if format_name == "Artist - Album - Year.zip":
+        return f"{artist} - {album} - {year}.zip"
+    raise ValueError(f"No generator for format {format_name!r}")
+
+
+def _random_bytes(rng, size):
+    # getrandbits is much faster than one choice per byte and works on 3.6
+    return rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+
+def generate_corpus(folder, albums=50, tracks=10, track_size=1024 * 1024,
+                    deflated=0.0, nesting=0, junk=2, download_junk=20, seed=1):
+    """Write a deterministic corpus of album zips into folder
+
+    deflated is the share of tracks compressed with ZIP_DEFLATED (the rest
+    are stored); nesting puts tracks that many folders below the album
+    root (Disc 1/...); junk adds that many non-track files per album and
+    download_junk adds files that are not album zips to the folder.
+    Returns a dict describing the corpus.
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    formats = sorted(FORMAT_PATTERNS)
+    digest = hashlib.sha1()
+    total_bytes = 0
+
+    for n in range(albums):
+        artist = f"Artist{n % max(1, albums // 3):04d}"
+        album = f"Album{n:05d}"
+        name = archive_name(formats[n % len(formats)], artist, album, 1960 + n % 60)
+        with zipfile.ZipFile(os.path.join(folder, name), 'w') as zip_ref:
+            root = album
+            for depth in range(nesting):
+                root += f"/Disc {depth + 1}"
+            for t in range(tracks):
+                # Vary sizes by +-25% so members do not all line up
+                size = max(1, int(track_size * rng.uniform(0.75, 1.25)))
+                compress = zipfile.ZIP_DEFLATED if rng.random() < deflated else zipfile.ZIP_STORED
+                zip_ref.writestr(f"{root}/{t + 1:02d} Track {t + 1}.flac",
+                                 _random_bytes(rng, size), compress_type=compress)
+                total_bytes += size
+            for j in range(junk):
+                zip_ref.writestr(f"{album}/{_ALBUM_JUNK[j % len(_ALBUM_JUNK)]}",
+                                 _random_bytes(rng, 4096), compress_type=zipfile.ZIP_DEFLATED)
+                total_bytes += 4096
+        digest.update(f"{name}\0{os.path.getsize(os.path.join(folder, name))}\0".encode())
+
+    for n in range(download_junk):
+        name = _DOWNLOAD_JUNK[n % len(_DOWNLOAD_JUNK)].format(n=n)
+        if name.endswith('.zip'):
+            # A zip that matches no naming format
+            with zipfile.ZipFile(os.path.join(folder, name), 'w') as zip_ref:
+                zip_ref.writestr('data.bin', _random_bytes(rng, 1024))
+        else:
+            with open(os.path.join(folder, name), 'wb') as f:
+                f.write(_random_bytes(rng, 1024))
+
+    return {'albums': albums, 'uncompressed_bytes': total_bytes, 'digest': digest.hexdigest()}
+
+
+def ensure_corpus(workdir, params):
+    """Return the corpus folder in workdir, generating it if params changed"""
+    folder = os.path.join(workdir, 'corpus')
+    meta_file = os.path.join(workdir, 'corpus.json')
+    wanted = dict(params, version=CORPUS_VERSION)
+    try:
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+        if meta.get('params') == wanted and os.path.isdir(folder):
+            return folder, meta['corpus']
+    except (OSError, ValueError):
+        pass
+
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    print(f"Generating corpus in {folder}...", file=sys.stderr)
+    corpus = generate_corpus(folder, **params)
+    with open(meta_file, 'w') as f:
+        json.dump({'params': wanted, 'corpus': corpus}, f, indent=2)
+    return folder, corpus
+
+
+def _stage(seconds, items, nbytes=0):
+    return {'seconds': seconds, 'items': items, 'bytes': nbytes}
+
+
+def _make_engine(workdir, downloads, library, args, logger):
+    engine = ExtractorEngine(downloads, library, AUTO_FORMAT, auto_delete=False,
+                             jobs=args.jobs, streaming=not args.no_streaming,
+                             zero_copy=not args.no_zero_copy, scan_index=False,
+                             skip_processed=False, journal=False, logger=logger)
+    # Keep the user's ledger, journal and scan index out of it
+    engine.ledger = Ledger(os.path.join(workdir, 'ledger.json'), logger=logger)
+    return engine
+
+
+def run_once(workdir, corpus_folder, args, logger):
+    """Run every stage once and return {stage: result}"""
+    library = os.path.join(workdir, 'library')
+    moved = os.path.join(args.move_to or workdir, 'library-moved')
+    for folder in (library, moved):
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+    engine = _make_engine(workdir, corpus_folder, library, args, logger)
+    results = {}
+
+    start = time.perf_counter()
+    music_zips = engine.find_music_zips()
+    results['scan'] = _stage(time.perf_counter() - start, len(music_zips))
+
+    index_file = os.path.join(workdir, 'scan_index.json')
+    engine.scan_index = ScanIndex(index_file, logger=logger)
+    engine.find_music_zips()
+    engine.scan_index.save()
+    engine.scan_index = ScanIndex(index_file, logger=logger)
+    start = time.perf_counter()
+    found = engine.find_music_zips()
+    results['scan_indexed'] = _stage(time.perf_counter() - start, len(found))
+    engine.scan_index = None
+
+    start = time.perf_counter()
+    for zip_info in music_zips:
+        engine.extract_album_folder(zip_info['zip_path'])
+    results['central_directory'] = _stage(time.perf_counter() - start, len(music_zips))
+
+    start = time.perf_counter()
+    processed, failed = engine.extract_all(music_zips)
+    if failed:
+        raise RuntimeError(f"{failed} archives failed to extract")
+    results['extract'] = _stage(time.perf_counter() - start, processed,
+                                engine.report.total_bytes())
+
+    albums = [engine.album_destination(zip_info) for zip_info in music_zips]
+    start = time.perf_counter()
+    for album in albums:
+        target = os.path.join(moved, os.path.relpath(album, library))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(album, target)
+    results['move'] = _stage(time.perf_counter() - start, len(albums),
+                             results['extract']['bytes'])
+
+    # Delete copies so the corpus survives for the next run
+    copies = os.path.join(workdir, 'delete')
+    os.makedirs(copies, exist_ok=True)
+    copied = []
+    for zip_info in music_zips:
+        copy = os.path.join(copies, zip_info['filename'])
+        shutil.copyfile(zip_info['zip_path'], copy)
+        copied.append(copy)
+    zip_bytes = sum(os.path.getsize(path) for path in copied)
+    start = time.perf_counter()
+    for album in albums:
+        shutil.rmtree(os.path.join(moved, os.path.relpath(album, library)))
+    for path in copied:
+        os.remove(path)
+    results['delete'] = _stage(time.perf_counter() - start, len(albums) + len(copied),
+                               results['extract']['bytes'] + zip_bytes)
+    shutil.rmtree(moved, ignore_errors=True)
+    return results
+
+
+def summarize(runs):
+    """Combine per-run stage results into best/median figures"""
+    summary = {}
+    for stage in STAGES:
+        seconds = [run[stage]['seconds'] for run in runs]
+        best = min(seconds)
+        last = runs[-1][stage]
+        summary[stage] = {
+            'best': best,
+            'median': statistics.median(seconds),
+            'runs': seconds,
+            'items': last['items'],
+            'bytes': last['bytes'],
+            'bytes_per_second': last['bytes'] / best if last['bytes'] and best else None
+        }
+    return summary
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_summary(summary, baseline=None):
+    """Print one line per stage, with the change against baseline if given"""
+    for stage in STAGES:
+        result = summary[stage]
+        line = f"{stage:<18} {result['best'] * 1000:10.1f} ms best {result['median'] * 1000:10.1f} ms median"
+        if result['bytes_per_second']:
+            line += f"  {format_rate(result['bytes_per_second']):>12}"
+        if baseline and stage in baseline:
+            before = baseline[stage]['best']
+            if before:
+                line += f"  {(result['best'] - before) / before * 100:+6.1f}% vs baseline"
+        print(line)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python3 -m extractor.bench',
+                                     description="Benchmark scanning and extraction on a synthetic corpus.")
+    parser.add_argument('--workdir', required=True, metavar='DIR',
+                        help="folder for the corpus and scratch libraries")
+    parser.add_argument('-o', '--output', metavar='FILE', help="write results as JSON to FILE")
+    parser.add_argument('--compare', metavar='FILE', help="show changes against an earlier results file")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage (default: 3)")
+    corpus = parser.add_argument_group('corpus')
+    corpus.add_argument('--albums', type=int, default=50)
+    corpus.add_argument('--tracks', type=int, default=10, help="tracks per album")
+    corpus.add_argument('--track-kb', type=int, default=1024, help="average track size in KiB")
+    corpus.add_argument('--deflated', type=float, default=0.0,
+                        help="share of tracks stored with ZIP_DEFLATED, 0 to 1")
+    corpus.add_argument('--nesting', type=int, default=0, help="folder depth of tracks below the album root")
+    corpus.add_argument('--junk', type=int, default=2, help="non-track files per album")
+    corpus.add_argument('--download-junk', type=int, default=20,
+                        help="files in the downloads folder that are not album zips")
+    corpus.add_argument('--seed', type=int, default=1)
+    engine = parser.add_argument_group('engine')
+    engine.add_argument('-j', '--jobs', type=int, default=1)
+    engine.add_argument('--no-streaming', action='store_true')
+    engine.add_argument('--no-zero-copy', action='store_true')
+    engine.add_argument('--move-to', metavar='DIR',
+                        help="folder to move albums to in the move stage, e.g. on another filesystem")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    params = {'albums': args.albums, 'tracks': args.tracks, 'track_size': args.track_kb * 1024,
+              'deflated': args.deflated, 'nesting': args.nesting, 'junk': args.junk,
+              'download_junk': args.download_junk, 'seed': args.seed}
+    os.makedirs(args.workdir, exist_ok=True)
+    corpus_folder, corpus = ensure_corpus(args.workdir, params)
+
+    logger = logging.getLogger(f"{__name__}.engine")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    runs = []
+    for n in range(args.repeat):
+        print(f"Run {n + 1}/{args.repeat}...", file=sys.stderr)
+        runs.append(run_once(args.workdir, corpus_folder, args, logger))
+    summary = summarize(runs)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f).get('stages')
+    print(f"Corpus: {corpus['albums']} albums, {format_size(corpus['uncompressed_bytes'])} "
+          f"uncompressed")
+    print_summary(summary, baseline)
+
+    if args.output:
+        results = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': dict(params, **corpus),
+            'engine': {'jobs': args.jobs, 'streaming': not args.no_streaming,
+                       'zero_copy': not args.no_zero_copy, 'move_to': args.move_to},
+            'stages': summary
+        }
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
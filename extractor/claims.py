@@ -0,0 +1,297 @@
+"""
+Music Library Extractor - work claiming across processes and hosts
+
+With coordination on, several extractors (processes on one machine or
+hosts sharing a NAS) can work through the same downloads folder without
+extracting an archive twice or racing on one album. Before an archive is
+extracted, two claims are taken in CLAIMS_DIR_NAME inside the downloads
+folder: one on the archive and one on its destination album. A claim is a
+lock file created with O_CREAT | O_EXCL, which succeeds for exactly one
+claimant, holding the owner's host, pid and a random token.
+
+Claims are leases. While it holds claims, a Coordinator refreshes their
+modification time every lease / 4 seconds from a heartbeat thread; a
+claim whose mtime is older than the lease belongs to a process or host
+that died and is broken by renaming it aside, which again only one
+claimant can do. Ages are measured against the shared filesystem's clock
+(the mtime of a freshly touched probe file), so clock skew between hosts
+does not matter.
+
+When an archive is done, its claim is replaced by a marker recording the
+outcome, keyed by the archive's path, size and mtime, so other hosts skip
+it even when zips are kept. Markers of archives that are gone are removed
+by prune_markers(). To retry a failed archive, touch it or delete its
+marker.
+
+A claim can still be lost, when its holder stalls for longer than the
+lease and another extractor breaks it. The heartbeat notices and flags it;
+holds() then returns False, and the engine checks it before renaming an
+album into the library, so the job is abandoned instead of committed
+twice.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import threading
+
+CLAIMS_DIR_NAME = '.music_extractor_claims'
+
+# Seconds without a heartbeat after which a claim is considered abandoned
+DEFAULT_LEASE = 60.0
+
+LOCK_SUFFIX = '.lock'
+MARKER_SUFFIX = '.done'
+
+# Outcomes recorded in markers
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+
+class LostClaim(Exception):
+    """A claim was broken by another extractor while this one held it"""
+
+
+def host_name():
+    """Return this machine's name, as recorded in claims and temp folder names"""
+    return socket.gethostname() or 'localhost'
+
+
+def claim_key(*parts):
+    """Return a file-name-safe key for a claim"""
+    return hashlib.sha1('\0'.join(str(part) for part in parts).encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+class Coordinator:
+    """Take, refresh and release claims in a shared claims folder"""
+
+    def __init__(self, claims_dir, lease=DEFAULT_LEASE, logger=None):
+        self.claims_dir = claims_dir
+        self.lease = float(lease)
+        self.logger = logger or logging.getLogger(__name__)
+        self.host = host_name()
+        self.lock = threading.Lock()
+        # key -> token of the claims this process holds
+        self.held = {}
+        # key -> token of held claims the heartbeat found broken
+        self.lost = {}
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def _path(self, key, suffix=LOCK_SUFFIX):
+        return os.path.join(self.claims_dir, key + suffix)
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def server_now(self):
+        """Return the current time on the shared filesystem's clock"""
+        probe = os.path.join(self.claims_dir, f".clock_{self.host}_{os.getpid()}")
+        with open(probe, 'a'):
+            pass
+        os.utime(probe)
+        return os.stat(probe).st_mtime
+
+    def claim(self, key, **info):
+        """Try to claim key; return (True, None) or (False, the holder's record)"""
+        os.makedirs(self.claims_dir, exist_ok=True)
+        path = self._path(key)
+        token = uuid.uuid4().hex
+        record = dict(info, host=self.host, pid=os.getpid(), token=token, claimed_at=time.time())
+        for attempt in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if attempt == 0 and self._break_if_stale(path):
+                    continue
+                return False, self._read(path) or {}
+            try:
+                os.write(fd, json.dumps(record).encode('utf-8'))
+            finally:
+                os.close(fd)
+            with self.lock:
+                self.held[key] = token
+            self._start_heartbeat()
+            return True, None
+        return False, self._read(path) or {}
+
+    def _break_if_stale(self, path):
+        """Remove the lock at path if its lease expired; True if it is gone"""
+        try:
+            st = os.stat(path)
+            age = self.server_now() - st.st_mtime
+        except FileNotFoundError:
+            return True
+        if age < self.lease:
+            return False
+        holder = self._read(path) or {}
+        stale = f"{path}.stale_{uuid.uuid4().hex[:8]}"
+        try:
+            # Only one claimant can move it; the others see it vanish
+            os.rename(path, stale)
+        except FileNotFoundError:
+            return True
+        # Between the stat and the rename, another claimant may have broken
+        # the stale claim and taken a fresh one, or the holder may have sent a
+        # heartbeat: only remove the claim that was judged stale
+        try:
+            moved_st = os.stat(stale)
+        except FileNotFoundError:
+            return True
+        moved = self._read(stale) or {}
+        if (moved.get('token') != holder.get('token')
+                or (moved_st.st_ino, moved_st.st_mtime_ns) != (st.st_ino, st.st_mtime_ns)):
+            self._restore(stale, path)
+            return False
+        os.remove(stale)
+        self.logger.warning(f"Broke abandoned claim of {holder.get('host', '?')} "
+                            f"(pid {holder.get('pid', '?')}) on {holder.get('archive', path)}, "
+                            f"idle for {age:.0f}s")
+        return True
+
+    def _restore(self, stale, path):
+        """Put a live claim moved aside by mistake back at path"""
+        try:
+            # Unlike rename, link never replaces a claim taken in the meantime
+            os.link(stale, path)
+        except FileExistsError:
+            self.logger.warning(f"Could not restore claim {os.path.basename(path)}: "
+                                f"it was claimed again")
+        except OSError:
+            # No hard links on this filesystem
+            if not os.path.exists(path):
+                os.rename(stale, path)
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    def token(self, key):
+        """Return the token of the claim this process holds on key, or None"""
+        with self.lock:
+            return self.held.get(key)
+
+    def holds(self, key, token):
+        """Return True if the claim on key with this token is still in place
+
+        Reads the lock file, so it also works in a worker process that did
+        not take the claim itself.
+        """
+        with self.lock:
+            if self.lost.get(key) == token:
+                return False
+        record = self._read(self._path(key))
+        return record is not None and record.get('token') == token
+
+    def release(self, key):
+        """Give up a claim this process holds"""
+        with self.lock:
+            self.lost.pop(key, None)
+            token = self.held.pop(key, None)
+        if token is None:
+            return
+        path = self._path(key)
+        record = self._read(path)
+        if record is not None and record.get('token') == token:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def finish(self, key, state, **info):
+        """Record the outcome of a claimed archive, then release its claim
+
+        Nothing is recorded for a claim that was lost: the extractor that
+        broke it records the outcome instead.
+        """
+        token = self.token(key)
+        if token is None or not self.holds(key, token):
+            self.release(key)
+            return
+        record = dict(info, state=state, host=self.host, finished_at=time.time())
+        marker = self._path(key, MARKER_SUFFIX)
+        tmp = f"{marker}.{self.host}_{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(tmp, marker)
+        except OSError as e:
+            self.logger.error(f"Could not record the outcome of {info.get('archive', key)}: {e}")
+        self.release(key)
+
+    def finished(self, key):
+        """Return the marker of an archive another run has finished, or None"""
+        return self._read(self._path(key, MARKER_SUFFIX))
+
+    def prune_markers(self, exists):
+        """Remove markers whose archive is gone; exists(archive) checks one"""
+        try:
+            names = os.listdir(self.claims_dir)
+        except OSError:
+            return 0
+        removed = 0
+        for name in names:
+            if not name.endswith(MARKER_SUFFIX):
+                continue
+            path = os.path.join(self.claims_dir, name)
+            record = self._read(path)
+            if record and record.get('archive') and not exists(record['archive']):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _start_heartbeat(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._heartbeat, name='claims', daemon=True)
+            self.thread.start()
+
+    def _heartbeat(self):
+        """Refresh the mtime of every held claim until none are left"""
+        while not self.stop_event.wait(self.lease / 4):
+            with self.lock:
+                held = dict(self.held)
+                if not held:
+                    self.thread = None
+                    return
+            for key, token in held.items():
+                if self.lost.get(key) == token:
+                    continue
+                path = self._path(key)
+                record = self._read(path)
+                if record is None or record.get('token') != token:
+                    with self.lock:
+                        if self.held.get(key) != token:
+                            # Released in the meantime
+                            continue
+                        self.lost[key] = token
+                    self.logger.error(f"Lost claim on {key}: it was broken by another "
+                                      f"extractor after missing heartbeats")
+                    continue
+                try:
+                    os.utime(path)
+                except OSError as e:
+                    self.logger.warning(f"Could not refresh claim {key}: {e}")
+
+    def close(self):
+        """Release every claim and stop the heartbeat"""
+        with self.lock:
+            keys = list(self.held)
+        for key in keys:
+            self.release(key)
+        self.stop_event.set()
+        try:
+            os.remove(os.path.join(self.claims_dir, f".clock_{self.host}_{os.getpid()}"))
+        except OSError:
+            pass
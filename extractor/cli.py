@@ -0,0 +1,337 @@
+"""
+Music Library Extractor - Command Line Interface
+
+    music-extractor scan     list the music zips found in the downloads folder
+    music-extractor plan     scan and print the extraction plan as JSON
+    music-extractor extract  scan, then extract everything into the library
+    music-extractor watch    keep running and extract zips as they arrive
+
+Options given on the command line override the saved GUI settings for
+this run only; the settings file is never written by the CLI.
+"""
+
+import sys
+import json
+import signal
+import logging
+import argparse
+import threading
+
+from .engine import ExtractorEngine, SETTINGS_FILE, load_settings
+from .planner import plan_extraction
+from .claims import DEFAULT_LEASE
+from .tags import TAG_PROBE_MODES
+from .matching import AUTO_FORMAT
+from .watch import WatchService, DEFAULT_SETTLE_SECONDS, DEFAULT_POLL_INTERVAL
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Seconds between progress lines during 'extract'
+DEFAULT_PROGRESS_INTERVAL = 5.0
+
+
+def build_parser():
+    """Build the argument parser for the music-extractor command"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--settings', default=SETTINGS_FILE,
+                        help="settings file to read (default: %(default)s)")
+    common.add_argument('--downloads', metavar='DIR',
+                        help="folder to scan for music zips")
+    common.add_argument('--library', metavar='DIR',
+                        help="music library to extract into")
+    common.add_argument('--format', dest='pattern', metavar='NAME',
+                        help="zip file naming format, or 'auto' to try every format "
+                             "(see --list-formats)")
+    common.add_argument('--no-index', dest='scan_index', action='store_false', default=None,
+                        help="ignore the scan index and parse every file name again")
+    common.add_argument('-r', '--recursive', action='store_true', default=None,
+                        help="also scan the subfolders of the downloads folder")
+    common.add_argument('--depth', type=int, metavar='N',
+                        help="with --recursive, descend at most N subfolder levels")
+    common.add_argument('--include', action='append', metavar='GLOB',
+                        help="with --recursive, only pick up archives whose path below the "
+                             "downloads folder matches GLOB (repeatable)")
+    common.add_argument('--exclude', action='append', metavar='GLOB',
+                        help="with --recursive, skip folders and archives matching GLOB "
+                             "(repeatable)")
+    common.add_argument('--scan-workers', type=int, metavar='N',
+                        help="folders listed at once during a recursive scan")
+    common.add_argument('--tags', dest='tag_probe', choices=TAG_PROBE_MODES,
+                        help="read artist and album from the audio tags inside zips: "
+                             "'fallback' for names no format matches, 'prefer' over the "
+                             "name, 'off' to go by names only")
+    common.add_argument('--log-file', metavar='FILE',
+                        help="also write the log to FILE")
+    common.add_argument('-q', '--quiet', action='store_true',
+                        help="only log warnings and errors")
+
+    parser = argparse.ArgumentParser(
+        prog='music-extractor',
+        description="Extract music zip files into an Artist/Album library.")
+    parser.add_argument('--list-formats', action='store_true',
+                        help="list the available naming formats and exit")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    scan = commands.add_parser('scan', parents=[common],
+                               help="list music zips found in the downloads folder")
+    scan.add_argument('--json', action='store_true',
+                      help="print the matches as JSON")
+
+    extracting = argparse.ArgumentParser(add_help=False)
+    extracting.add_argument('-j', '--jobs', type=int, metavar='N',
+                            help="extract N archives in parallel (default: saved setting or 1)")
+    extracting.add_argument('--no-streaming', dest='streaming', action='store_false', default=None,
+                            help="extract through a temporary folder in the downloads folder "
+                                 "instead of streaming into the library")
+    extracting.add_argument('--no-zero-copy', dest='zero_copy', action='store_false', default=None,
+                            help="copy stored members through Python buffers instead of "
+                                 "kernel-side copies")
+    extracting.add_argument('--force', dest='skip_processed', action='store_false', default=None,
+                            help="re-extract archives that are already in the library unchanged")
+    extracting.add_argument('--sync', dest='existing_album', action='store_const', const='sync',
+                            help="update existing albums in place, writing only files that changed")
+    extracting.add_argument('--prune', dest='prune_stale', action='store_true', default=None,
+                            help="with --sync, remove files that are no longer in the archive")
+    extracting.add_argument('--no-verify', dest='verify_writes', action='store_false', default=None,
+                            help="do not check written files against the archive's CRC-32s "
+                                 "before deleting it")
+    extracting.add_argument('--hash', dest='verify_hash', metavar='ALGORITHM',
+                            help="also hash every written file (e.g. sha256) and record it in "
+                                 "the library's hash log")
+    extracting.add_argument('--coordinate', action='store_true', default=None,
+                            help="share the downloads folder with other extractors (processes "
+                                 "or hosts): claim each archive before extracting it")
+    extracting.add_argument('--lease', type=float, metavar='SECONDS',
+                            help="with --coordinate, how long a claim outlives a silent "
+                                 f"extractor (default: {DEFAULT_LEASE:g})")
+    delete = extracting.add_mutually_exclusive_group()
+    delete.add_argument('--delete-zips', dest='auto_delete', action='store_true', default=None,
+                        help="delete each zip after it was extracted")
+    delete.add_argument('--keep-zips', dest='auto_delete', action='store_false',
+                        help="keep zips after extracting them")
+
+    commands.add_parser('plan', parents=[common, extracting],
+                        help="print what extract would do, the space it needs and how long "
+                             "it would take, as JSON")
+
+    extract = commands.add_parser('extract', parents=[common, extracting],
+                                  help="scan and extract all music zips")
+    extract.add_argument('--no-space-check', dest='space_check', action='store_false',
+                         help="start even if the plan shows too little free space")
+    extract.add_argument('--pipeline', action='store_true',
+                         help="start extracting while the downloads folder is still being "
+                              "scanned, instead of planning the whole run first")
+    extract.add_argument('--report', metavar='FILE',
+                         help="write per-album results to FILE (CSV if it ends in .csv, "
+                              "JSON otherwise)")
+    extract.add_argument('--profile', action='store_true', default=None,
+                         help="profile the run with cProfile and tracemalloc and write a "
+                              "report next to the log file")
+    extract.add_argument('--progress', type=float, metavar='SECONDS',
+                         default=DEFAULT_PROGRESS_INTERVAL,
+                         help="log bytes extracted, throughput and ETA every SECONDS "
+                              f"(default: {DEFAULT_PROGRESS_INTERVAL:g}, 0 to disable)")
+
+    watch = commands.add_parser('watch', parents=[common, extracting],
+                                help="extract music zips as they finish downloading")
+    watch.add_argument('--settle', type=float, metavar='SECONDS',
+                       help="how long a zip must stop changing before it is extracted "
+                            f"(default: {DEFAULT_SETTLE_SECONDS:g})")
+    watch.add_argument('--poll', action='store_true',
+                       help="poll the folder instead of using inotify "
+                            "(needed for network mounts)")
+    watch.add_argument('--interval', type=float, metavar='SECONDS',
+                       help=f"polling interval (default: {DEFAULT_POLL_INTERVAL:g})")
+    return parser
+
+
+def settings_from_args(args):
+    """Merge command line overrides into the saved settings"""
+    settings = load_settings(args.settings)
+    if args.downloads:
+        settings['downloads_folder'] = args.downloads
+    if args.library:
+        settings['music_library_path'] = args.library
+    if args.pattern:
+        settings['current_pattern'] = AUTO_FORMAT if args.pattern.lower() == 'auto' else args.pattern
+    if args.scan_index is not None:
+        settings['scan_index'] = args.scan_index
+    if args.tag_probe:
+        settings['tag_probe'] = args.tag_probe
+    if getattr(args, 'auto_delete', None) is not None:
+        settings['auto_delete_zip'] = args.auto_delete
+    if getattr(args, 'streaming', None) is not None:
+        settings['streaming'] = args.streaming
+    if getattr(args, 'zero_copy', None) is not None:
+        settings['zero_copy'] = args.zero_copy
+    if getattr(args, 'skip_processed', None) is not None:
+        settings['skip_processed'] = args.skip_processed
+    if getattr(args, 'existing_album', None):
+        settings['existing_album'] = args.existing_album
+    if getattr(args, 'prune_stale', None) is not None:
+        settings['prune_stale'] = args.prune_stale
+    if getattr(args, 'verify_writes', None) is not None:
+        settings['verify_writes'] = args.verify_writes
+    if getattr(args, 'verify_hash', None):
+        settings['verify_hash'] = args.verify_hash
+    if getattr(args, 'coordinate', None):
+        settings['coordinate'] = True
+    if getattr(args, 'lease', None):
+        settings['claim_lease'] = args.lease
+    if args.recursive:
+        settings['recursive'] = True
+    if args.depth is not None:
+        settings['scan_depth'] = args.depth
+    if args.include:
+        settings['scan_include'] = args.include
+    if args.exclude:
+        settings['scan_exclude'] = args.exclude
+    if args.scan_workers:
+        settings['scan_workers'] = args.scan_workers
+    if args.log_file:
+        settings['log_file'] = args.log_file
+    if getattr(args, 'profile', None):
+        settings['profile'] = True
+    if getattr(args, 'jobs', None):
+        settings['jobs'] = args.jobs
+    if getattr(args, 'settle', None) is not None:
+        settings['watch_settle_seconds'] = args.settle
+    if getattr(args, 'interval', None) is not None:
+        settings['watch_poll_interval'] = args.interval
+    return settings
+
+
+def cmd_scan(engine, args):
+    """Print the music zips found in the downloads folder"""
+    music_zips = engine.find_music_zips()
+    engine.mark_processed(music_zips)
+    if args.json:
+        json.dump(music_zips, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        for zip_info in music_zips:
+            status = 'in library' if zip_info['in_library'] else 'new'
+            print(f"{zip_info['artist']}\t{zip_info['album']}\t{zip_info['filename']}\t"
+                  f"{zip_info['format']}\t{status}")
+    return 0
+
+
+def cmd_plan(engine, args):
+    """Print the extraction plan for the music zips found as JSON"""
+    plan = plan_extraction(engine, engine.find_music_zips())
+    json.dump(plan.to_dict(), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0 if plan.fits else 2
+
+
+def cmd_extract(engine, args):
+    """Scan the downloads folder and extract every match"""
+    if args.pipeline:
+        # No up-front plan: each archive's space is checked as it comes up
+        music_zips = None
+    else:
+        music_zips = engine.find_music_zips()
+        if not music_zips:
+            engine.logger.info("No music zip files found")
+            return 0
+
+        plan = plan_extraction(engine, music_zips)
+        for line in plan.summary_lines():
+            engine.logger.info(f"Plan: {line}")
+        if not plan.fits and args.space_check:
+            engine.logger.error("Not enough free space for this run; free some space or pass "
+                                "--no-space-check")
+            return 2
+
+    stop = threading.Event()
+
+    def report_progress():
+        while not stop.wait(args.progress):
+            if engine.progress is not None:
+                engine.logger.info(f"Progress: {engine.progress.describe()}")
+
+    if args.progress > 0:
+        threading.Thread(target=report_progress, daemon=True).start()
+    try:
+        if music_zips is None:
+            processed, failed = engine.ingest(space_check=args.space_check)
+        else:
+            processed, failed = engine.extract_all(music_zips)
+    finally:
+        stop.set()
+    if engine.trash is not None:
+        # Replaced albums and deleted zips are removed in the background;
+        # finish before exiting rather than leaving them for the next start
+        engine.trash.wait()
+    if args.report:
+        try:
+            engine.report.export(args.report)
+        except OSError as e:
+            engine.logger.error(f"Could not write report: {e}")
+            return 1
+    return 1 if failed else 0
+
+
+def cmd_watch(engine, args, settings):
+    """Extract zips as they land until interrupted"""
+    if engine.recursive:
+        engine.logger.warning("Watch mode only watches the top of the downloads folder; "
+                              "subfolders are not scanned")
+    service = WatchService(engine,
+                           settle_seconds=settings.get('watch_settle_seconds', DEFAULT_SETTLE_SECONDS),
+                           poll_interval=settings.get('watch_poll_interval', DEFAULT_POLL_INTERVAL),
+                           use_inotify=not args.poll)
+    signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        service.stop()
+    return 0
+
+
+def main(argv=None):
+    """Entry point for the music-extractor command"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.list_formats:
+        settings = load_settings()
+        for name in ExtractorEngine.from_settings(settings).format_names():
+            print(name)
+        return 0
+    if not args.command:
+        parser.error("a command is required")
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format=LOG_FORMAT)
+    if args.log_file:
+        try:
+            file_handler = logging.FileHandler(args.log_file, encoding='utf-8')
+        except OSError as e:
+            parser.error(f"cannot open log file: {e}")
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logging.getLogger().addHandler(file_handler)
+
+    settings = settings_from_args(args)
+    try:
+        engine = ExtractorEngine.from_settings(settings)
+    except ValueError as e:
+        parser.error(str(e))
+    path_errors = engine.validate_paths()
+    if path_errors:
+        for error in path_errors:
+            engine.logger.error(error)
+        return 2
+
+    if args.command == 'scan':
+        return cmd_scan(engine, args)
+    if args.command == 'plan':
+        return cmd_plan(engine, args)
+    # Finish or clean up after runs that were killed part way
+    engine.recover()
+    if args.command == 'watch':
+        return cmd_watch(engine, args, settings)
+    return cmd_extract(engine, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1587 @@
+"""
+Music Library Extractor - Extraction Engine
+
+Headless scan and extract logic shared by the GUI and the command-line
+interface. Nothing in this module may import tkinter, so it can run on
+machines without a display.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import tarfile
+import logging
+import zlib
+import uuid
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from . import fastcopy
+from . import tarstream
+from . import nested
+from . import verify
+from . import tags
+from .scanindex import ScanIndex
+from .walk import walk_archives, DEFAULT_SCAN_WORKERS
+from .timing import StageTimer
+from . import profiling
+from .ledger import Ledger
+from . import journal as journal_states
+from .journal import Journal
+from .trash import Trash
+from .claims import (Coordinator, CLAIMS_DIR_NAME, DEFAULT_LEASE, STATE_DONE, STATE_FAILED,
+                     LostClaim, claim_key, host_name)
+from .planner import album_root
+from .pipeline import IngestPipeline
+from .progress import ByteProgress, format_rate
+from .report import (ExtractionReport, STATUS_EXTRACTED, STATUS_FAILED, STATUS_SKIPPED,
+                     format_size)
+from .matching import (FORMAT_PATTERNS, AUTO_FORMAT, ARCHIVE_SUFFIXES,
+                       FilenameMatcher, format_list)
+
+# Settings file shared by the GUI and the CLI
+SETTINGS_FILE = os.path.join(os.path.expanduser("~"), ".music_extractor_settings.json")
+
+# Format selected in the GUI dropdown or with --format. Built-in formats are
+# in matching.FORMAT_PATTERNS; users can add their own under 'custom_formats'
+DEFAULT_PATTERN = "Artist - Album.zip"
+
+DEFAULT_SETTINGS = {
+    'downloads_folder': os.path.expanduser("~/Downloads"),
+    'music_library_path': os.path.expanduser("~/Music"),
+    'current_pattern': DEFAULT_PATTERN,
+    'custom_formats': {},
+    'auto_delete_zip': True,
+    'jobs': 1,
+    'streaming': True,
+    'zero_copy': True,
+    'scan_index': True,
+    'recursive': False,
+    'scan_depth': None,
+    'scan_include': [],
+    'scan_exclude': [],
+    'scan_workers': DEFAULT_SCAN_WORKERS,
+    'nested_archives': True,
+    'deferred_delete': True,
+    'verify_writes': True,
+    'verify_hash': '',
+    'tag_probe': 'off',
+    'coordinate': False,
+    'claim_lease': DEFAULT_LEASE,
+    'skip_processed': True,
+    'existing_album': 'replace',
+    'prune_stale': False,
+    'log_max_lines': 5000,
+    'log_file': '',
+    'profile': False,
+    'journal': True
+}
+
+# What to do when the destination album already exists: 'replace' swaps in
+# a fresh copy, 'sync' only rewrites files whose size or CRC-32 differ
+EXISTING_ALBUM_MODES = ('replace', 'sync')
+
+# Buffer size used when streaming members out of an archive
+COPY_BUFSIZE = 1024 * 1024
+
+# Archives whose uncompressed bytes are mostly deflated are CPU bound and are
+# sent to worker processes; mostly stored archives are I/O bound and use threads
+DEFLATE_HEAVY_RATIO = 0.5
+
+# Start methods for worker processes, in order of preference. Forking would
+# copy the parent's threads' held locks (Tk, logging handlers, the thread
+# pool) into a child where nothing will ever release them
+PROCESS_START_METHODS = ('forkserver', 'spawn')
+
+# Runs shorter than this are dominated by overhead and do not update the
+# measured throughput
+MIN_MEASURED_SECONDS = 1.0
+
+
+def load_settings(settings_file=SETTINGS_FILE, logger=None):
+    """Load settings from file, falling back to the defaults"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        if os.path.exists(settings_file):
+            with open(settings_file, 'r') as f:
+                settings.update(json.load(f))
+    except Exception as e:
+        (logger or logging.getLogger(__name__)).error(f"Could not load settings: {e}")
+
+    known_formats = set(FORMAT_PATTERNS) | set(settings.get('custom_formats') or {}) | {AUTO_FORMAT}
+    if settings.get('current_pattern') not in known_formats:
+        settings['current_pattern'] = DEFAULT_PATTERN
+    return settings
+
+
+def save_settings(settings, settings_file=SETTINGS_FILE, logger=None):
+    """Save settings to file"""
+    try:
+        with open(settings_file, 'w') as f:
+            json.dump(settings, f, indent=2)
+    except Exception as e:
+        (logger or logging.getLogger(__name__)).error(f"Could not save settings: {e}")
+
+
+class ExtractorEngine:
+    """Find music zips in a downloads folder and extract them into a library"""
+
+    def __init__(self, downloads_folder, music_library_path,
+                 current_pattern=DEFAULT_PATTERN, auto_delete=True, jobs=1,
+                 streaming=True, zero_copy=True, scan_index=True, custom_formats=None,
+                 skip_processed=True, existing_album='replace', prune_stale=False,
+                 profile=False, log_file=None, journal=True, recursive=False, scan_depth=None,
+                 scan_include=None, scan_exclude=None, scan_workers=DEFAULT_SCAN_WORKERS,
+                 nested_archives=True, deferred_delete=True, coordinate=False,
+                 claim_lease=DEFAULT_LEASE, verify_writes=True, verify_hash=None, tag_probe='off',
+                 logger=None):
+        self.downloads_folder = downloads_folder
+        self.music_library_path = music_library_path
+        self.auto_delete = auto_delete
+        self.jobs = max(1, int(jobs))
+        self.streaming = streaming
+        self.zero_copy = zero_copy
+        # Expand zips inside the album (e.g. one per disc) into subfolders
+        self.nested_archives = nested_archives
+        self.logger = logger or logging.getLogger(__name__)
+        # Check every written file against the archive before the source
+        # may be deleted, optionally hashing it too (see verify)
+        self.verify_writes = verify_writes
+        self.verify_hash = verify.check_algorithm(verify_hash)
+        self.scan_index = ScanIndex(logger=self.logger) if scan_index else None
+        # Artist and album read from audio tags inside the archive: 'off',
+        # 'fallback' for names no format matches, or 'prefer' (see tags)
+        if tag_probe not in tags.TAG_PROBE_MODES:
+            raise ValueError(f"Unknown tag probe mode: {tag_probe}")
+        self.tag_probe = tag_probe
+        self.tag_cache = tags.TagCache(logger=self.logger)
+        # Recursive scan of the downloads folder's subfolders
+        self.recursive = recursive
+        self.scan_depth = None if scan_depth is None else max(0, int(scan_depth))
+        self.scan_include = list(scan_include or [])
+        self.scan_exclude = list(scan_exclude or [])
+        self.scan_workers = max(1, int(scan_workers))
+        # Per-archive results and byte progress of the last extract_all run
+        self.report = None
+        self.progress = None
+        self.skip_processed = skip_processed
+        if existing_album not in EXISTING_ALBUM_MODES:
+            raise ValueError(f"Unknown existing album mode: {existing_album}")
+        self.existing_album = existing_album
+        self.prune_stale = prune_stale
+        self.profile = profile
+        self.log_file = log_file or None
+        self.ledger = Ledger(logger=self.logger)
+        self.journal = Journal(logger=self.logger) if journal else None
+        # Replaced albums and consumed zips are deleted in the background
+        self.trash = Trash(logger=self.logger) if deferred_delete else None
+        # Claims shared with other extractors working on the same downloads folder
+        self.claim_lease = float(claim_lease)
+        self.coordinate = coordinate
+        self._coordinator = None
+        # Archives left to other extractors in the last extract_all run
+        self.claimed_elsewhere = 0
+        self.custom_formats = self._valid_custom_formats(custom_formats or {})
+        if current_pattern in (custom_formats or {}) and current_pattern not in self.custom_formats:
+            self.logger.warning(f"Format '{current_pattern}' is invalid, using '{DEFAULT_PATTERN}'")
+            current_pattern = DEFAULT_PATTERN
+        self.set_pattern(current_pattern)
+
+    @classmethod
+    def from_settings(cls, settings, logger=None):
+        """Create an engine from a settings dictionary"""
+        return cls(settings.get('downloads_folder', DEFAULT_SETTINGS['downloads_folder']),
+                   settings.get('music_library_path', DEFAULT_SETTINGS['music_library_path']),
+                   current_pattern=settings.get('current_pattern', DEFAULT_PATTERN),
+                   auto_delete=settings.get('auto_delete_zip', True),
+                   jobs=settings.get('jobs', 1),
+                   streaming=settings.get('streaming', True),
+                   zero_copy=settings.get('zero_copy', True),
+                   scan_index=settings.get('scan_index', True),
+                   custom_formats=settings.get('custom_formats'),
+                   skip_processed=settings.get('skip_processed', True),
+                   existing_album=settings.get('existing_album', 'replace'),
+                   prune_stale=settings.get('prune_stale', False),
+                   profile=settings.get('profile', False),
+                   log_file=settings.get('log_file'),
+                   journal=settings.get('journal', True),
+                   recursive=settings.get('recursive', False),
+                   scan_depth=settings.get('scan_depth'),
+                   scan_include=settings.get('scan_include'),
+                   scan_exclude=settings.get('scan_exclude'),
+                   scan_workers=settings.get('scan_workers', DEFAULT_SCAN_WORKERS),
+                   nested_archives=settings.get('nested_archives', True),
+                   deferred_delete=settings.get('deferred_delete', True),
+                   coordinate=settings.get('coordinate', False),
+                   claim_lease=settings.get('claim_lease', DEFAULT_LEASE),
+                   verify_writes=settings.get('verify_writes', True),
+                   verify_hash=settings.get('verify_hash'),
+                   tag_probe=settings.get('tag_probe', 'off'),
+                   logger=logger)
+
+    def to_settings(self):
+        """Return the engine configuration as a settings dictionary"""
+        return {
+            'downloads_folder': self.downloads_folder,
+            'music_library_path': self.music_library_path,
+            'current_pattern': self.current_pattern,
+            'custom_formats': self.custom_formats,
+            'auto_delete_zip': self.auto_delete,
+            'jobs': self.jobs,
+            'streaming': self.streaming,
+            'zero_copy': self.zero_copy,
+            'scan_index': self.scan_index is not None,
+            'skip_processed': self.skip_processed,
+            'existing_album': self.existing_album,
+            'prune_stale': self.prune_stale,
+            'profile': self.profile,
+            'log_file': self.log_file or '',
+            'journal': self.journal is not None,
+            'recursive': self.recursive,
+            'scan_depth': self.scan_depth,
+            'scan_include': self.scan_include,
+            'scan_exclude': self.scan_exclude,
+            'scan_workers': self.scan_workers,
+            'nested_archives': self.nested_archives,
+            'deferred_delete': self.trash is not None,
+            'verify_writes': self.verify_writes,
+            'verify_hash': self.verify_hash or '',
+            'tag_probe': self.tag_probe,
+            'coordinate': self.coordinate,
+            'claim_lease': self.claim_lease
+        }
+
+    @property
+    def coordinator(self):
+        """The Coordinator for the current downloads folder, or None when not coordinating"""
+        if not self.coordinate:
+            return None
+        claims_dir = os.path.join(self.downloads_folder, CLAIMS_DIR_NAME)
+        if self._coordinator is None or self._coordinator.claims_dir != claims_dir:
+            if self._coordinator is not None:
+                # The downloads folder changed between runs
+                self._coordinator.close()
+            self._coordinator = Coordinator(claims_dir, self.claim_lease, self.logger)
+        return self._coordinator
+
+    @property
+    def hash_log(self):
+        """Log of the checksums of files written into the current library"""
+        return verify.HashLog(self.music_library_path, logger=self.logger)
+
+    def set_pattern(self, pattern_name):
+        """Select the zip naming format used when scanning
+
+        AUTO_FORMAT tries the custom formats and then every built-in format.
+        Raises ValueError for an unknown format name.
+        """
+        self.matcher = FilenameMatcher(format_list(pattern_name, self.custom_formats))
+        self.current_pattern = pattern_name
+
+    def format_names(self):
+        """Return the selectable format names, as shown in the GUI dropdown"""
+        return [AUTO_FORMAT] + list(FORMAT_PATTERNS) + list(self.custom_formats)
+
+    def _valid_custom_formats(self, custom_formats):
+        """Drop user-defined formats whose pattern cannot be used"""
+        valid = {}
+        for name, pattern in custom_formats.items():
+            try:
+                FilenameMatcher([(name, pattern)])
+                valid[name] = pattern
+            except ValueError as e:
+                self.logger.warning(f"Ignoring custom format: {e}")
+        return valid
+
+    def validate_paths(self):
+        """Validate that the configured paths exist and are accessible"""
+        errors = []
+
+        # Check downloads folder
+        if not os.path.exists(self.downloads_folder):
+            errors.append(f"Downloads folder does not exist: {self.downloads_folder}")
+        elif not os.access(self.downloads_folder, os.R_OK):
+            errors.append(f"No read access to downloads folder: {self.downloads_folder}")
+
+        # Check music library path
+        if not os.path.exists(self.music_library_path):
+            try:
+                os.makedirs(self.music_library_path, exist_ok=True)
+                self.logger.info(f"Created music library directory: {self.music_library_path}")
+            except Exception as e:
+                errors.append(f"Cannot create music library directory: {self.music_library_path} - {e}")
+        elif not os.access(self.music_library_path, os.W_OK):
+            errors.append(f"No write access to music library folder: {self.music_library_path}")
+
+        return errors
+
+    def find_music_zips(self):
+        """Find all zip files matching the pattern in Downloads folder
+
+        In recursive mode subfolders are scanned as well and each match's
+        'filename' is its path relative to the downloads folder.
+        """
+        return list(self.iter_music_zips())
+
+    def iter_music_zips(self):
+        """Yield the zip_info of each matching archive as the folder is listed"""
+        if not os.path.exists(self.downloads_folder):
+            self.logger.error(f"Downloads folder not found: {self.downloads_folder}")
+            return
+
+        listing = self.walk_downloads() if self.recursive else None
+
+        if self.scan_index is not None:
+            yield from self._iter_music_zips_indexed(listing)
+            return
+
+        if listing is not None:
+            files = (file for file, st in listing)
+        else:
+            files = [file for file in os.listdir(self.downloads_folder)
+                     if file.lower().endswith(ARCHIVE_SUFFIXES)]
+
+        for file in files:
+            zip_info = self.match_archive(file, self.parse_filename(os.path.basename(file)))
+            if zip_info:
+                yield zip_info
+        self.save_tag_cache(complete_scan=True)
+
+    def walk_downloads(self):
+        """Return [(relative path, stat_result)] of archives below the downloads folder"""
+        start = time.perf_counter()
+        listing = walk_archives(
+            self.downloads_folder, ARCHIVE_SUFFIXES, max_depth=self.scan_depth,
+            include=self.scan_include, exclude=self.scan_exclude, workers=self.scan_workers,
+            # The library may live inside the downloads folder
+            skip_dirs=[self.music_library_path],
+            on_error=lambda path, e: self.logger.warning(f"Could not scan {path}: {e}"))
+        self.logger.info(f"Scanned subfolders of {self.downloads_folder} in "
+                         f"{time.perf_counter() - start:.2f}s: {len(listing)} archives")
+        return listing
+
+    def _iter_music_zips_indexed(self, listing=None):
+        """Yield music zips, reusing cached parses for unchanged files"""
+        found = 0
+        changed = 0
+        for file, st, parsed, is_new in self.scan_index.scan(
+                self.downloads_folder, self.matcher.signature, self.parse_filename,
+                ARCHIVE_SUFFIXES, listing):
+            if is_new:
+                changed += 1
+            zip_info = self.match_archive(file, parsed, log=is_new)
+            if zip_info:
+                found += 1
+                yield zip_info
+
+        self.scan_index.save()
+        self.save_tag_cache(complete_scan=True)
+        self.logger.info(f"Scan index: {found} matches, {changed} new or changed files")
+
+    def parse_filename(self, file):
+        """Return [artist, album, format name] parsed from a zip file name, or None"""
+        match = self.matcher.match(file)
+        return list(match) if match else None
+
+    def match_archive(self, file, parsed, log=True):
+        """Return the zip_info of an archive from its parsed name or its tags, or None
+
+        parsed is what parse_filename returned for the file's name. Tags are
+        read when the name did not match (tag_probe 'fallback') or always
+        ('prefer'), falling back to the name when the archive has none.
+        """
+        if self.tag_probe != 'off' and (parsed is None or self.tag_probe == 'prefer'):
+            found = self.probe_tags(file)
+            if found:
+                if log and parsed and tuple(parsed[:2]) != found:
+                    self.logger.info(f"Tags of {file} say '{found[0]} - {found[1]}', "
+                                     f"not '{parsed[0]} - {parsed[1]}' as named")
+                return self._found(file, *found, tags.TAG_FORMAT, log=log)
+        return self._found(file, *parsed, log=log) if parsed else None
+
+    def probe_tags(self, file):
+        """Return (artist, album) from the audio tags of an archive, or None
+
+        Results are cached by archive fingerprint, so an archive is only
+        opened again once it changes; for an unchanged one the lookup costs
+        a stat (see Ledger.fingerprint).
+        """
+        if not file.lower().endswith(tags.PROBE_SUFFIXES):
+            # Tars are not probed: reaching a member means decompressing to it
+            return None
+        zip_path = os.path.join(self.downloads_folder, file)
+        try:
+            fingerprint = self.ledger.fingerprint(zip_path)
+            hit, found = self.tag_cache.lookup(self.downloads_folder, fingerprint)
+            if not hit:
+                found = tags.probe_archive(zip_path)
+                self.tag_cache.store(self.downloads_folder, fingerprint, found)
+            return found
+        except Exception as e:
+            self.logger.debug(f"Could not read tags of {file}: {e}")
+            return None
+
+    def save_tag_cache(self, complete_scan=False):
+        """Write back tag probe results and the fingerprints they were keyed by
+
+        After a complete scan of the downloads folder, results for archives
+        it did not look up are dropped first.
+        """
+        if self.tag_probe != 'off':
+            if complete_scan:
+                self.tag_cache.prune(self.downloads_folder)
+            self.tag_cache.save()
+            self.ledger.save()
+
+    def _found(self, file, artist_name, album_name, format_name=None, log=True):
+        """Build the zip_info dictionary for a matched file"""
+        if log:
+            show_format = self.current_pattern == AUTO_FORMAT or format_name == tags.TAG_FORMAT
+            self.logger.info(f"Found: {file} -> Artist: '{artist_name}', Album: '{album_name}'"
+                             + (f" [{format_name}]" if show_format else ""))
+        return {
+            'zip_path': os.path.join(self.downloads_folder, file),
+            'filename': file,
+            'artist': artist_name,
+            'album': album_name,
+            'format': format_name
+        }
+
+    def extract_all(self, music_zips, on_start=None, on_done=None):
+        """Extract every zip in music_zips and return (processed, failed)
+
+        on_start(index, total, zip_info) is called when an archive is picked
+        up and on_done(zip_info, ok, processed, failed) when it finishes. With
+        jobs > 1 on_done is called from worker threads. The per-archive
+        results are left in self.report; self.progress tracks the bytes
+        extracted while the run is going. With profile set the run is
+        profiled and a report is written next to the log (see profiling).
+        """
+        return self._profiled(self._extract_all, music_zips, on_start, on_done)
+
+    def ingest(self, on_start=None, on_done=None, space_check=True):
+        """Scan and extract as one pipeline and return (processed, failed)
+
+        Unlike find_music_zips() followed by extract_all(), archives are
+        extracted while the downloads folder is still being listed (see
+        pipeline). on_start is called with total None, as the number of
+        archives is not known until the scan finishes; otherwise the
+        callbacks, self.report and self.progress work as in extract_all.
+        With space_check, archives that would not fit in the free space left
+        at their destination fail instead of being extracted.
+        """
+        return self._profiled(self._ingest, on_start, on_done, space_check)
+
+    def _profiled(self, run, *args):
+        """Call run(*args), under the profiler if profile is set"""
+        if not self.profile:
+            return run(*args)
+        if self.jobs > 1:
+            self.logger.warning("Profiling with several jobs: cProfile only sees the calling "
+                                "thread, use one job to profile the extraction itself")
+        with profiling.profiled(profiling.profile_report_path(self.log_file), self.logger):
+            return run(*args)
+
+    def _extract_all(self, music_zips, on_start, on_done):
+        self._begin_run()
+
+        # Leave out archives whose unchanged contents are already in the library
+        self.mark_processed(music_zips)
+        if self.skip_processed:
+            pending = []
+            for zip_info in music_zips:
+                if zip_info['in_library']:
+                    self.skip_in_library(zip_info)
+                else:
+                    pending.append(zip_info)
+            music_zips = pending
+
+        self.progress = ByteProgress({zip_info['zip_path']: self.archive_size(zip_info['zip_path'])
+                                      for zip_info in music_zips})
+        try:
+            if self.jobs > 1 and len(music_zips) > 1:
+                processed, failed = self._extract_parallel(music_zips, on_start, on_done)
+            else:
+                processed, failed = self._extract_sequential(music_zips, on_start, on_done)
+        finally:
+            self._close_run()
+        self._end_run(processed, failed)
+        return processed, failed
+
+    def _ingest(self, on_start, on_done, space_check):
+        self._begin_run()
+        self.progress = ByteProgress({})
+        pipeline = IngestPipeline(self, WorkerPool(self), on_start, on_done, space_check)
+        try:
+            processed, failed = pipeline.run()
+        finally:
+            self._close_run()
+        self._end_run(processed, failed)
+        return processed, failed
+
+    def _begin_run(self):
+        self.report = ExtractionReport()
+        self.claimed_elsewhere = 0
+
+        # Ensure music library exists
+        self.ensure_music_library_exists()
+
+    def _close_run(self):
+        self.ledger.save()
+        if self.journal is not None:
+            self.journal.close()
+        if self.coordinator is not None:
+            self.coordinator.close()
+
+    def _end_run(self, processed, failed):
+        """Log the outcome of a run and record its throughput"""
+        # Archives left to other extractors are reported as skipped too
+        skipped = self.report.count(STATUS_SKIPPED) - self.claimed_elsewhere
+        self.logger.info(f"Processing complete. Successfully processed: {processed}, Failed: {failed}"
+                         + (f", Skipped (already in library): {skipped}" if skipped else "")
+                         + (f", Left to other extractors: {self.claimed_elsewhere}"
+                            if self.claimed_elsewhere else ""))
+        elapsed = time.monotonic() - self.progress.started
+        extracted = self.report.total_bytes()
+        if extracted and elapsed > 0:
+            self.logger.info(f"Extracted {format_size(extracted)} in {elapsed:.1f}s "
+                             f"({format_rate(extracted / elapsed)})")
+            if elapsed >= MIN_MEASURED_SECONDS:
+                # Used by the planner to estimate how long a run takes
+                self.ledger.record_throughput(extracted / elapsed)
+                self.ledger.save()
+        self.log_stage_summary()
+
+    def log_stage_summary(self):
+        """Log the time and bytes of each stage summed over the last run"""
+        for name, entry in self.report.stage_summary().items():
+            line = f"Stage {name}: {entry['seconds']:.3f}s over {entry['archives']} archives"
+            if entry['bytes'] and entry['seconds'] > 0:
+                line += (f", {format_size(entry['bytes'])} "
+                         f"({format_rate(entry['bytes'] / entry['seconds'])})")
+            self.logger.info(line)
+
+    def recover(self):
+        """Finish or clean up after extraction runs that were killed part way
+
+        Rolls archives in abandoned journals forward or back, removes
+        temp_extract_* folders left in the downloads folder and starts
+        deleting what earlier runs left in the trash. Returns the number of
+        archives that were completed.
+        """
+        if self.trash is not None:
+            self.trash.reclaim([self.music_library_path, self.downloads_folder])
+        if self.coordinator is not None:
+            self.coordinator.prune_markers(
+                lambda name: os.path.exists(os.path.join(self.downloads_folder, name)))
+        if self.journal is None:
+            return 0
+        try:
+            completed = self.journal.recover(self)
+            self.remove_orphaned_temp_dirs()
+        except Exception as e:
+            self.logger.error(f"Could not recover interrupted extractions: {e}")
+            return 0
+        if completed:
+            self.logger.info(f"Completed {completed} archives from an interrupted run")
+        return completed
+
+    def remove_orphaned_temp_dirs(self):
+        """Remove temp_extract_* folders of processes that are no longer running
+
+        Folders are named after the pid and host that created them; those of
+        other hosts sharing the downloads folder are left alone.
+        """
+        if not os.path.isdir(self.downloads_folder):
+            return
+        live = self.journal.live_staging_dirs()
+        with os.scandir(self.downloads_folder) as it:
+            for entry in it:
+                if not entry.name.startswith('temp_extract_') or not entry.is_dir():
+                    continue
+                path = os.path.normpath(entry.path)
+                if path in live or os.path.normpath(os.path.abspath(entry.path)) in live:
+                    continue
+                owner = entry.name.split('_')[2] if entry.name.count('_') >= 3 else ''
+                pid, _, host = owner.partition('@')
+                if host and host != host_name():
+                    continue
+                if not pid.isdigit() or _pid_running(int(pid)):
+                    continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+                self.logger.info(f"Removed leftover temporary folder: {entry.path}")
+
+    def discard(self, path, root):
+        """Delete path, in the background when deferred deletion is on
+
+        root is the library or downloads folder path lives under.
+        """
+        if self.trash is not None:
+            self.trash.discard(path, root)
+        elif os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    def _journal(self, zip_info, state, **fields):
+        """Append an extraction step for zip_info to the journal, if enabled"""
+        if self.journal is not None:
+            self.journal.write(os.path.abspath(zip_info['zip_path']), state, **fields)
+
+    def album_destination(self, zip_info):
+        """Return the absolute library folder an archive is extracted to"""
+        return os.path.abspath(os.path.join(self.music_library_path,
+                                            zip_info['artist'], zip_info['album']))
+
+    def mark_processed(self, music_zips, save=True):
+        """Set 'fingerprint' and 'in_library' on each zip_info from the ledger"""
+        for zip_info in music_zips:
+            try:
+                fingerprint = self.ledger.fingerprint(zip_info['zip_path'])
+            except Exception:
+                # Unreadable now; extraction will report the actual error
+                fingerprint = None
+            zip_info['fingerprint'] = fingerprint
+            zip_info['in_library'] = bool(
+                fingerprint and self.ledger.lookup(fingerprint, self.album_destination(zip_info)))
+        if save:
+            self.ledger.save()
+
+    def skip_in_library(self, zip_info):
+        """Leave an archive whose unchanged contents are in the library out of this run"""
+        self.logger.info(f"Skipping {zip_info['filename']}: already in library, unchanged")
+        if self.report is not None:
+            self.report.add(zip_info, STATUS_SKIPPED, self.album_destination(zip_info))
+
+    def report_result(self, zip_info, ok):
+        """Log the outcome of one archive and record successes in the ledger"""
+        destination = self.album_destination(zip_info)
+        if ok:
+            self.logger.info(f"✓ Successfully processed: {zip_info['filename']}")
+            if zip_info.get('fingerprint'):
+                self.ledger.record(zip_info['fingerprint'], zip_info, destination)
+        else:
+            self.logger.error(f"✗ Failed to process: {zip_info['filename']}")
+        if self.progress is not None:
+            self.progress.finish(zip_info['zip_path'])
+        if self.report is not None:
+            self.report.add(zip_info, STATUS_EXTRACTED if ok else STATUS_FAILED, destination)
+        self.release_claims(zip_info, ok)
+
+    def claim_archive(self, zip_info):
+        """Claim an archive and its destination album for this process
+
+        Returns None when the archive may be extracted (always, unless
+        coordinating with other extractors), or the reason it may not. When
+        another extractor is still busy with it, its claim record is left in
+        zip_info['claimed_by'].
+        """
+        if self.coordinator is None:
+            return None
+        try:
+            st = os.stat(zip_info['zip_path'])
+        except OSError:
+            return "no longer in the downloads folder"
+        name = zip_info['filename'].replace(os.sep, '/')
+        archive_key = claim_key(name, st.st_size, st.st_mtime_ns)
+        destination = os.path.relpath(self.album_destination(zip_info),
+                                      os.path.abspath(self.music_library_path))
+        destination_key = claim_key('dest', destination.replace(os.sep, '/').casefold())
+
+        def finished_elsewhere():
+            if not self.skip_processed:
+                # --force: extract it again whatever its marker says
+                return None
+            marker = self.coordinator.finished(archive_key)
+            if marker is None:
+                return None
+            if marker.get('state') == STATE_FAILED and marker.get('host') == self.coordinator.host:
+                # Failures are retried by the host they happened on
+                return None
+            return f"already {marker.get('state', 'handled')} by {marker.get('host', '?')}"
+
+        reason = finished_elsewhere()
+        if reason:
+            return reason
+        ok, holder = self.coordinator.claim(archive_key, archive=name)
+        if not ok:
+            zip_info['claimed_by'] = holder
+            return f"being extracted by {holder.get('host', '?')} (pid {holder.get('pid', '?')})"
+        # Another extractor may have finished it just before the claim
+        reason = finished_elsewhere()
+        if reason:
+            self.coordinator.release(archive_key)
+            return reason
+        ok, holder = self.coordinator.claim(destination_key, archive=name, destination=destination)
+        if not ok:
+            self.coordinator.release(archive_key)
+            zip_info['claimed_by'] = holder
+            return (f"{destination} is being written by {holder.get('host', '?')} "
+                    f"(pid {holder.get('pid', '?')}) from {holder.get('archive', '?')}")
+        zip_info['claims'] = ((archive_key, self.coordinator.token(archive_key)),
+                              (destination_key, self.coordinator.token(destination_key)))
+        return None
+
+    def check_claims(self, zip_info):
+        """Raise LostClaim if another extractor broke one of the archive's claims
+
+        Called just before an album is renamed into the library. Works in
+        worker processes too, since zip_info carries the claims' tokens.
+        """
+        claims = zip_info.get('claims')
+        if self.coordinator is None or not claims:
+            return
+        for key, token in claims:
+            if not self.coordinator.holds(key, token):
+                raise LostClaim(f"claim on {zip_info['filename']} was taken over by another "
+                                f"extractor, leaving the album to it")
+
+    def release_claims(self, zip_info, ok):
+        """Record the outcome of a claimed archive and release its claims"""
+        claims = zip_info.pop('claims', None)
+        if self.coordinator is None or not claims:
+            return
+        (archive_key, _), (destination_key, _) = claims
+        self.coordinator.finish(archive_key, STATE_DONE if ok else STATE_FAILED,
+                                archive=zip_info['filename'].replace(os.sep, '/'))
+        self.coordinator.release(destination_key)
+
+    def skip_claimed(self, zip_info, reason):
+        """Leave an archive claimed by another extractor out of this run"""
+        self.logger.info(f"Skipping {zip_info['filename']}: {reason}")
+        self.claimed_elsewhere += 1
+        if self.progress is not None:
+            self.progress.drop(zip_info['zip_path'])
+        if self.report is not None:
+            self.report.add(zip_info, STATUS_SKIPPED, self.album_destination(zip_info))
+
+    def _extract_sequential(self, music_zips, on_start, on_done):
+        """Extract archives one at a time in the calling thread"""
+        total_files = len(music_zips)
+        processed = 0
+        failed = 0
+
+        for i, zip_info in enumerate(music_zips):
+            reason = self.claim_archive(zip_info)
+            if reason:
+                self.skip_claimed(zip_info, reason)
+                continue
+            if on_start:
+                on_start(i, total_files, zip_info)
+
+            ok = self.process_music_zip(zip_info)
+            self.report_result(zip_info, ok)
+            if ok:
+                processed += 1
+            else:
+                failed += 1
+
+            if on_done:
+                on_done(zip_info, ok, processed, failed)
+
+        return processed, failed
+
+    def _extract_parallel(self, music_zips, on_start, on_done):
+        """Extract archives on a pool of self.jobs workers
+
+        Mostly stored archives run on threads, deflate-heavy ones in worker
+        processes. At most self.jobs archives are in flight across both pools.
+        Archives sharing a destination album run in separate rounds, in their
+        original order, so they never race on the same folder.
+        """
+        total_files = len(music_zips)
+        counts = {'processed': 0, 'failed': 0}
+        lock = threading.Lock()
+        slots = threading.BoundedSemaphore(self.jobs)
+
+        def finished(zip_info, future):
+            try:
+                ok = pool.result(zip_info, future)
+            finally:
+                slots.release()
+
+            with lock:
+                self.report_result(zip_info, ok)
+                if ok:
+                    counts['processed'] += 1
+                else:
+                    counts['failed'] += 1
+                processed, failed = counts['processed'], counts['failed']
+                if on_done:
+                    on_done(zip_info, ok, processed, failed)
+
+        self.logger.info(f"Extracting {total_files} archives with {self.jobs} workers")
+        pool = WorkerPool(self)
+        index = 0
+        try:
+            for batch in self._destination_rounds(music_zips):
+                futures = []
+                for zip_info in batch:
+                    slots.acquire()
+                    reason = self.claim_archive(zip_info)
+                    if reason:
+                        slots.release()
+                        with lock:
+                            self.skip_claimed(zip_info, reason)
+                        continue
+                    if on_start:
+                        on_start(index, total_files, zip_info)
+                    index += 1
+
+                    future = pool.submit(zip_info)
+                    future.add_done_callback(lambda f, z=zip_info: finished(z, f))
+                    futures.append(future)
+
+                # Wait for the round before starting the next one
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception:
+                        pass  # reported by finished()
+        finally:
+            pool.shutdown()
+
+        return counts['processed'], counts['failed']
+
+    def _destination_rounds(self, music_zips):
+        """Split archives into rounds with no duplicate destination per round"""
+        rounds = []
+        seen = {}
+        for zip_info in music_zips:
+            key = (zip_info['artist'].lower(), zip_info['album'].lower())
+            n = seen.get(key, 0)
+            seen[key] = n + 1
+            if n == len(rounds):
+                rounds.append([])
+            rounds[n].append(zip_info)
+        return rounds
+
+    def archive_size(self, zip_path):
+        """Return the total uncompressed size of an archive's members
+
+        Tar archives are measured by their file size: their members are
+        only known once the whole stream has been read. With
+        nested_archives, inner zips count as the members they expand to.
+        """
+        try:
+            if tarstream.is_tar_archive(zip_path):
+                return os.path.getsize(zip_path)
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                return sum(nested.nested_size(zip_ref, info)
+                           if self.nested_archives and nested.is_nested_archive(info.filename)
+                           else info.file_size
+                           for info in zip_ref.infolist())
+        except Exception:
+            # Unreadable archives fail in process_music_zip with a proper log
+            return 0
+
+    def is_deflate_heavy(self, zip_path):
+        """Return True if most of the archive's bytes need decompressing"""
+        if tarstream.is_tar_archive(zip_path):
+            return tarstream.is_compressed_tar(zip_path)
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                total = 0
+                deflated = 0
+                for info in zip_ref.infolist():
+                    total += info.file_size
+                    if info.compress_type != zipfile.ZIP_STORED:
+                        deflated += info.file_size
+        except Exception:
+            # Unreadable archives fail in process_music_zip with a proper log
+            return False
+        return total > 0 and deflated / total > DEFLATE_HEAVY_RATIO
+
+    def ensure_music_library_exists(self):
+        """Ensure the music library directory exists"""
+        Path(self.music_library_path).mkdir(parents=True, exist_ok=True)
+        self.logger.info(f"Music library directory ensured: {self.music_library_path}")
+
+    def extract_album_folder(self, zip_path):
+        """Extract the album folder from the zip file"""
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                return self.find_album_root(zip_ref.namelist(), zip_path)
+
+        except zipfile.BadZipFile:
+            self.logger.error(f"Bad zip file: {zip_path}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Error reading zip file {zip_path}: {e}")
+            return None
+
+    def find_album_root(self, file_list, zip_path):
+        """Return the single top-level folder of an archive listing, or None
+
+        With nested_archives, an archive holding no folders but one zip per
+        disc at its top level is an album of its own; '' is returned for it.
+        """
+        album_folder_name, album_folders = album_root(file_list, self.nested_archives)
+        if album_folder_name:
+            self.logger.info(f"Found album folder in zip: {album_folder_name}")
+            return album_folder_name
+        elif album_folder_name == '':
+            self.logger.info(f"Found nested archives at the top of {zip_path}")
+            return ''
+        else:
+            self.logger.warning(f"Unexpected zip structure in {zip_path}. Found folders: {album_folders}")
+            return None
+
+    def process_music_zip(self, zip_info):
+        """Process a single music zip file
+
+        Sets zip_info['bytes'] to the bytes written into the library,
+        zip_info['duration'] to the seconds it took and zip_info['stages']
+        to the time and bytes of each stage (see timing.StageTimer).
+        """
+        start = time.perf_counter()
+        zip_info['bytes'] = 0
+        zip_info['stages'] = {}
+        ok = False
+        try:
+            if tarstream.is_tar_archive(zip_info['zip_path']):
+                ok = self.process_tar_streaming(zip_info)
+            elif self.streaming or self.existing_album == 'sync':
+                ok = self.process_music_zip_streaming(zip_info)
+            else:
+                ok = self.process_music_zip_tempdir(zip_info)
+            return ok
+        finally:
+            zip_info['duration'] = time.perf_counter() - start
+            if not ok and self.journal is not None:
+                self.journal.fail(os.path.abspath(zip_info['zip_path']))
+
+    def process_music_zip_tempdir(self, zip_info):
+        """Process a single music zip file through a temporary folder in downloads"""
+        timer = StageTimer(zip_info['stages'])
+        zip_path = zip_info['zip_path']
+        artist_name = zip_info['artist']
+        album_name = zip_info['album']
+
+        self.logger.info(f"Processing: {zip_info['filename']}")
+
+        # Create artist directory - always organize as /Music/Artist/Album/
+        artist_dir = os.path.join(self.music_library_path, artist_name)
+        Path(artist_dir).mkdir(parents=True, exist_ok=True)
+
+        # Extract album folder from zip
+        with timer.stage('central_directory'):
+            album_folder_name = self.extract_album_folder(zip_path)
+        # '' is an album of nested archives at the top of the zip
+        if album_folder_name is None:
+            self.logger.error(f"Could not extract album folder from {zip_path}")
+            return False
+
+        # Create a temporary extraction directory, unique per archive so
+        # parallel workers never share one
+        temp_dir = tempfile.mkdtemp(prefix=f"temp_extract_{os.getpid()}@{host_name()}_",
+                                    dir=self.downloads_folder)
+        self._journal(zip_info, journal_states.PLANNED, mode=journal_states.MODE_TEMPDIR,
+                      staging=os.path.abspath(temp_dir), dest=self.album_destination(zip_info),
+                      delete_source=self.auto_delete, fingerprint=zip_info.get('fingerprint'))
+
+        try:
+            # Source and destination paths
+            # Output structure: /Music/Artist/Album/songs
+            source_album_path = os.path.join(temp_dir, album_folder_name or album_name)
+
+            # Extract zip to temporary directory
+            hashes = []
+            with timer.stage('extract'), zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                if self.nested_archives:
+                    # Only the album, with inner zips expanded as in the
+                    # streaming path; '' makes the whole archive the album
+                    os.mkdir(source_album_path)
+                    album_bytes = self.stage_album(zip_ref, album_folder_name, source_album_path,
+                                                   hashes)
+                    extracted_bytes = album_bytes
+                else:
+                    if self.verify_writes:
+                        self.extract_checked(zip_ref, temp_dir, album_folder_name, hashes)
+                    else:
+                        zip_ref.extractall(temp_dir)
+                    infos = zip_ref.infolist()
+                    extracted_bytes = sum(info.file_size for info in infos)
+                    album_bytes = sum(info.file_size for info in infos
+                                      if info.filename.startswith(album_folder_name + '/'))
+            timer.add_bytes('extract', extracted_bytes)
+            self._journal(zip_info, journal_states.STAGED)
+
+            dest_album_path = os.path.join(artist_dir, album_name)
+            self.check_claims(zip_info)
+
+            # Check if album already exists - overwrite by default
+            if os.path.exists(dest_album_path):
+                self.logger.warning(f"Album already exists: {dest_album_path}")
+                with timer.stage('remove_old'):
+                    self.discard(dest_album_path, self.music_library_path)
+
+            # Move album folder to destination
+            if os.path.exists(source_album_path):
+                with timer.stage('move', album_bytes):
+                    shutil.move(source_album_path, dest_album_path)
+                self._journal(zip_info, journal_states.COMMITTED)
+                zip_info['bytes'] = album_bytes
+                self.logger.info(f"Successfully moved album to: {dest_album_path}")
+                self.record_hashes(zip_info, dest_album_path, hashes)
+            else:
+                self.logger.error(f"Album folder not found after extraction: {source_album_path}")
+                return False
+
+            self.remove_source(zip_path, timer)
+            if self.auto_delete:
+                self._journal(zip_info, journal_states.SOURCE_DELETED)
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Error processing {zip_path}: {e}")
+            return False
+
+        finally:
+            # Clean up temporary directory
+            if os.path.exists(temp_dir):
+                with timer.stage('cleanup'):
+                    shutil.rmtree(temp_dir)
+
+    def extract_checked(self, zip_ref, temp_dir, album_folder_name, hashes):
+        """Extract every member into temp_dir like extractall, verifying each file
+
+        The checksums of the files in the album folder are appended to hashes.
+        """
+        prefix = f"{album_folder_name}/"
+        for info in zip_ref.infolist():
+            target = member_target(temp_dir, info.filename)
+            if target is None:
+                continue
+            if info.filename.endswith('/'):
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            check = self.member_check(info.filename[len(prefix):], info)
+            self.write_member(zip_ref, info, target, check=check)
+            if info.filename.startswith(prefix):
+                hashes.append(check.record())
+
+    def process_music_zip_streaming(self, zip_info):
+        """Process a single music zip file in one pass over the archive
+
+        The zip is opened once: the album root comes from the central
+        directory and members are written straight into a staging folder
+        next to the destination album, which is then renamed into place.
+        Nothing is written to the downloads folder and nothing crosses
+        filesystems after extraction.
+
+        In 'sync' mode an existing album is updated in place instead, see
+        sync_album.
+        """
+        timer = StageTimer(zip_info['stages'])
+        zip_path = zip_info['zip_path']
+        artist_name = zip_info['artist']
+        album_name = zip_info['album']
+
+        self.logger.info(f"Processing: {zip_info['filename']}")
+
+        # Create artist directory - always organize as /Music/Artist/Album/
+        artist_dir = os.path.join(self.music_library_path, artist_name)
+        Path(artist_dir).mkdir(parents=True, exist_ok=True)
+        dest_album_path = os.path.join(artist_dir, album_name)
+
+        staging_dir = None
+        # Checksums of the files written, once each matched the archive
+        hashes = []
+        try:
+            start = time.perf_counter()
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                album_folder_name = self.find_album_root(zip_ref.namelist(), zip_path)
+                timer.add('central_directory', time.perf_counter() - start)
+                if album_folder_name is None:
+                    self.logger.error(f"Could not extract album folder from {zip_path}")
+                    return False
+
+                planned = {'dest': self.album_destination(zip_info),
+                           'delete_source': self.auto_delete,
+                           'fingerprint': zip_info.get('fingerprint')}
+                if self.existing_album == 'sync' and os.path.isdir(dest_album_path):
+                    self._journal(zip_info, journal_states.PLANNED,
+                                  mode=journal_states.MODE_SYNC, **planned)
+                    with timer.stage('sync'):
+                        album_bytes = self.sync_album(zip_ref, album_folder_name, dest_album_path,
+                                                      hashes)
+                    timer.add_bytes('sync', album_bytes)
+                else:
+                    with timer.stage('extract'):
+                        staging_dir = make_unique_dir(artist_dir, '.staging_')
+                        self._journal(zip_info, journal_states.PLANNED,
+                                      mode=journal_states.MODE_STAGING,
+                                      staging=os.path.abspath(staging_dir),
+                                      replaced=os.path.abspath(replaced_dir_for(staging_dir)),
+                                      **planned)
+                        album_bytes = self.stage_album(zip_ref, album_folder_name, staging_dir,
+                                                       hashes)
+                    timer.add_bytes('extract', album_bytes)
+                    self._journal(zip_info, journal_states.STAGED)
+
+            self.check_claims(zip_info)
+            if staging_dir:
+                self.commit_album(staging_dir, dest_album_path, timer)
+                staging_dir = None
+            self._journal(zip_info, journal_states.COMMITTED)
+            self.record_hashes(zip_info, dest_album_path, hashes)
+            zip_info['bytes'] = album_bytes
+            self.remove_source(zip_path, timer)
+            if self.auto_delete:
+                self._journal(zip_info, journal_states.SOURCE_DELETED)
+            return True
+
+        except zipfile.BadZipFile as e:
+            self.logger.error(f"Bad zip file: {zip_path} ({e})")
+            return False
+        except Exception as e:
+            self.logger.error(f"Error processing {zip_path}: {e}")
+            return False
+
+        finally:
+            if staging_dir and os.path.exists(staging_dir):
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def process_tar_streaming(self, zip_info):
+        """Process a single tar archive in one sequential read
+
+        Members are written into a staging folder next to the destination
+        album as the stream goes past (see tarstream), then the folder is
+        renamed into place as for zips. Tar archives carry no checksums to
+        compare against, so 'sync' mode replaces the album instead.
+        """
+        timer = StageTimer(zip_info['stages'])
+        tar_path = zip_info['zip_path']
+        artist_name = zip_info['artist']
+        album_name = zip_info['album']
+
+        self.logger.info(f"Processing: {zip_info['filename']}")
+
+        # Create artist directory - always organize as /Music/Artist/Album/
+        artist_dir = os.path.join(self.music_library_path, artist_name)
+        Path(artist_dir).mkdir(parents=True, exist_ok=True)
+        dest_album_path = os.path.join(artist_dir, album_name)
+        if self.existing_album == 'sync' and os.path.isdir(dest_album_path):
+            self.logger.info(f"Tar archives cannot be synced, replacing album: {dest_album_path}")
+
+        def advance(nbytes):
+            if self.progress is not None:
+                self.progress.advance(tar_path, nbytes)
+
+        staging_dir = None
+        hashes = []
+        try:
+            with timer.stage('extract'):
+                staging_dir = make_unique_dir(artist_dir, '.staging_')
+                self._journal(zip_info, journal_states.PLANNED, mode=journal_states.MODE_STAGING,
+                              staging=os.path.abspath(staging_dir),
+                              replaced=os.path.abspath(replaced_dir_for(staging_dir)),
+                              dest=self.album_destination(zip_info),
+                              delete_source=self.auto_delete,
+                              fingerprint=zip_info.get('fingerprint'))
+                _, album_bytes = tarstream.stream_album(
+                    tar_path, staging_dir, member_target, advance, self.logger,
+                    self.tar_member_check if self.verify_writes else None, hashes)
+            timer.add_bytes('extract', album_bytes)
+            self._journal(zip_info, journal_states.STAGED)
+
+            self.check_claims(zip_info)
+            self.commit_album(staging_dir, dest_album_path, timer)
+            staging_dir = None
+            self._journal(zip_info, journal_states.COMMITTED)
+            self.record_hashes(zip_info, dest_album_path, hashes)
+            zip_info['bytes'] = album_bytes
+            self.remove_source(tar_path, timer)
+            if self.auto_delete:
+                self._journal(zip_info, journal_states.SOURCE_DELETED)
+            return True
+
+        except tarstream.UnexpectedStructure as e:
+            self.logger.warning(str(e))
+            self.logger.error(f"Could not extract album folder from {tar_path}")
+            return False
+        except (tarfile.TarError, EOFError) as e:
+            self.logger.error(f"Bad tar archive: {tar_path} ({e})")
+            return False
+        except Exception as e:
+            self.logger.error(f"Error processing {tar_path}: {e}")
+            return False
+
+        finally:
+            if staging_dir and os.path.exists(staging_dir):
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def album_members(self, zip_ref, album_folder_name, spool_dir=None):
+        """Yield (path in album, archive, ZipInfo) for the album's members
+
+        album_folder_name '' means the whole archive is the album. With
+        nested_archives, zips inside the album are expanded into subfolders
+        and archive is the inner ZipFile for their members (see nested).
+        """
+        prefix = f"{album_folder_name}/" if album_folder_name else ''
+        if self.nested_archives:
+            return nested.album_members(zip_ref, prefix, spool_dir)
+        return ((info.filename[len(prefix):], zip_ref, info) for info in zip_ref.infolist()
+                if info.filename.startswith(prefix))
+
+    def stage_album(self, zip_ref, album_folder_name, staging_dir, hashes=None):
+        """Write the members under album_folder_name into staging_dir
+
+        Returns the number of bytes written. With verify_writes, the
+        checksums of the files written are appended to hashes.
+        """
+        bytes_written = 0
+        for name, archive, info in self.album_members(zip_ref, album_folder_name,
+                                                      os.path.dirname(staging_dir)):
+            target = member_target(staging_dir, name)
+            if target is None:
+                continue
+
+            if info.filename.endswith('/'):
+                os.makedirs(target, exist_ok=True)
+                continue
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            check = self.member_check(name, info)
+            self.write_member(archive, info, target, zip_ref.filename, check)
+            if check is not None and hashes is not None:
+                hashes.append(check.record())
+            bytes_written += info.file_size
+        return bytes_written
+
+    def write_member(self, zip_ref, info, target, progress_key=None, check=None):
+        """Write one zip member to target
+
+        progress_key is the archive progress is counted against, when
+        zip_ref is an archive nested inside it. With a check (see
+        member_check), what was written is verified against the archive and
+        verify.VerifyError is raised if it does not match.
+        """
+        if self.zero_copy and fastcopy.can_fast_copy(zip_ref, info):
+            # Stored member: kernel-side copy of its byte range
+            fastcopy.copy_stored_member(zip_ref, info, target, check)
+        else:
+            with zip_ref.open(info) as source, open(target, 'wb') as dest:
+                if check is None:
+                    shutil.copyfileobj(source, dest, COPY_BUFSIZE)
+                else:
+                    verify.copy_checked(source, dest, check, COPY_BUFSIZE)
+        if check is not None:
+            check.verify()
+        if self.progress is not None:
+            self.progress.advance(progress_key or zip_ref.filename, info.file_size)
+
+    def member_check(self, name, info):
+        """Return a verify.MemberCheck for a zip member, or None when not verifying"""
+        if not self.verify_writes:
+            return None
+        return verify.MemberCheck(name, info.file_size, info.CRC, self.verify_hash)
+
+    def tar_member_check(self, name, size):
+        """Return a verify.MemberCheck for a tar member, which has no CRC-32"""
+        return verify.MemberCheck(name, size, None, self.verify_hash)
+
+    def record_hashes(self, zip_info, dest_album_path, hashes):
+        """Append the checksums of an album's written files to the hash log"""
+        if not self.verify_writes or not hashes:
+            return
+        self.logger.info(f"Verified {len(hashes)} written files against {zip_info['filename']}")
+        self.hash_log.append(zip_info['filename'].replace(os.sep, '/'), dest_album_path, hashes)
+
+    def sync_album(self, zip_ref, album_folder_name, dest_album_path, hashes=None):
+        """Update an existing album in place from the archive
+
+        Only members whose size or CRC-32 (from the central directory)
+        differ from the file already in the album are written, each through
+        a temporary file and a rename. With prune_stale, files and folders
+        in the album that are not in the archive are removed. Returns the
+        number of bytes written; with verify_writes, the checksums of the
+        files written are appended to hashes.
+        """
+        self.logger.info(f"Album already exists, syncing changed files: {dest_album_path}")
+        expected = {os.path.normpath(dest_album_path)}
+        written = 0
+        unchanged = 0
+        bytes_written = 0
+
+        for name, archive, info in self.album_members(zip_ref, album_folder_name,
+                                                      os.path.dirname(dest_album_path)):
+            target = member_target(dest_album_path, name)
+            if target is None:
+                continue
+            expected.add(os.path.normpath(target))
+
+            if info.filename.endswith('/'):
+                os.makedirs(target, exist_ok=True)
+                continue
+
+            if file_matches_member(target, info):
+                unchanged += 1
+                if self.progress is not None:
+                    self.progress.advance(zip_ref.filename, info.file_size)
+                continue
+
+            parent = os.path.dirname(target)
+            os.makedirs(parent, exist_ok=True)
+            # Parent folders of synced files must survive pruning
+            while len(parent) > len(dest_album_path):
+                expected.add(os.path.normpath(parent))
+                parent = os.path.dirname(parent)
+
+            partial = journal_states.partial_path(target, os.getpid())
+            try:
+                check = self.member_check(name, info)
+                self.write_member(archive, info, partial, zip_ref.filename, check)
+                os.replace(partial, target)
+                if check is not None and hashes is not None:
+                    hashes.append(check.record())
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+            written += 1
+            bytes_written += info.file_size
+
+        removed = self.prune_album(dest_album_path, expected) if self.prune_stale else 0
+        self.logger.info(f"Synced album {dest_album_path}: {written} written ({bytes_written} bytes), "
+                         f"{unchanged} unchanged, {removed} removed")
+        return bytes_written
+
+    def prune_album(self, dest_album_path, expected):
+        """Remove files and folders below dest_album_path not in expected"""
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(dest_album_path, topdown=False):
+            for name in filenames:
+                path = os.path.normpath(os.path.join(dirpath, name))
+                if path not in expected:
+                    os.remove(path)
+                    removed += 1
+                    self.logger.info(f"Removed stale file: {path}")
+            for name in dirnames:
+                path = os.path.normpath(os.path.join(dirpath, name))
+                if path not in expected and not os.listdir(path):
+                    os.rmdir(path)
+        return removed
+
+    def commit_album(self, staging_dir, dest_album_path, timer=None):
+        """Rename a staged album into place, replacing any existing copy"""
+        timer = timer or StageTimer()
+        replaced_dir = None
+        with timer.stage('move'):
+            if os.path.exists(dest_album_path):
+                self.logger.warning(f"Album already exists: {dest_album_path}")
+                # Move the old copy aside first so the new album appears with a
+                # single rename and the old one is never half deleted in place
+                replaced_dir = replaced_dir_for(staging_dir)
+                try:
+                    os.mkdir(replaced_dir)
+                except FileExistsError:
+                    # A run killed before the rename below left it behind and
+                    # journal recovery is committing its album
+                    pass
+                os.rename(dest_album_path, os.path.join(replaced_dir, 'album'))
+
+            os.rename(staging_dir, dest_album_path)
+        self.logger.info(f"Successfully moved album to: {dest_album_path}")
+
+        if replaced_dir:
+            with timer.stage('remove_old'):
+                self.discard(replaced_dir, self.music_library_path)
+
+    def remove_source(self, zip_path, timer=None):
+        """Delete the zip file if auto_delete is enabled"""
+        if self.auto_delete:
+            timer = timer or StageTimer()
+            with timer.stage('delete_source', os.path.getsize(zip_path)):
+                self.discard(zip_path, self.downloads_folder)
+            self.logger.info(f"Deleted zip file: {zip_path}")
+        else:
+            self.logger.info(f"Kept zip file: {zip_path} (auto-delete disabled)")
+
+
+def file_matches_member(path, info):
+    """Return True if the file at path has the member's size and CRC-32"""
+    try:
+        if not os.path.isfile(path) or os.path.getsize(path) != info.file_size:
+            return False
+        crc = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(COPY_BUFSIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+        return crc == info.CRC
+    except OSError:
+        return False
+
+
+def make_unique_dir(parent, prefix):
+    """Create a new uniquely named directory in parent and return its path
+
+    Unlike tempfile.mkdtemp the directory gets the normal umask-derived
+    permissions, since staged folders are renamed into the library as is.
+    """
+    while True:
+        path = os.path.join(parent, f"{prefix}{os.getpid()}_{uuid.uuid4().hex[:8]}")
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            continue
+
+
+def replaced_dir_for(staging_dir):
+    """Return where commit_album moves the album that staging_dir replaces
+
+    It is derived from the staging folder's name so the journal can find
+    it again after a crash.
+    """
+    name = os.path.basename(staging_dir)
+    if name.startswith('.staging_'):
+        name = name[len('.staging_'):]
+    return os.path.join(os.path.dirname(staging_dir), f".replaced_{name}")
+
+
+def _pid_running(pid):
+    """Return True if a process with this pid exists (POSIX only)"""
+    if os.name != 'posix':
+        # os.kill would terminate the process on Windows; assume it runs
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def member_target(base_dir, member_name):
+    """Return the path a zip member should be written to below base_dir
+
+    Absolute paths, drive letters and '..' components are dropped the same
+    way ZipFile.extract does, so a member can never escape base_dir.
+    Returns None when nothing of the name is left.
+    """
+    parts = []
+    for part in member_name.split('/'):
+        part = os.path.splitdrive(part)[1]
+        if part in ('', '.', '..'):
+            continue
+        parts.append(part)
+    if not parts:
+        return None
+    return os.path.join(base_dir, *parts)
+
+
+class WorkerPool:
+    """Run process_music_zip for an engine on threads or worker processes
+
+    Mostly stored archives are I/O bound and run on a thread pool;
+    deflate-heavy archives are CPU bound and go to a process pool that is
+    only started once one is needed. The caller bounds how many archives
+    are in flight.
+    """
+
+    def __init__(self, engine, jobs=None):
+        self.engine = engine
+        self.jobs = jobs or engine.jobs
+        self.thread_pool = ThreadPoolExecutor(max_workers=self.jobs)
+        self.process_pool = None
+
+    def submit(self, zip_info, deflate_heavy=None):
+        """Start processing zip_info and return a future for it
+
+        deflate_heavy, when already known, saves reading the archive again.
+        """
+        if deflate_heavy is None:
+            deflate_heavy = self.engine.is_deflate_heavy(zip_info['zip_path'])
+        if deflate_heavy:
+            if self.process_pool is None:
+                self.process_pool = ProcessPoolExecutor(max_workers=self.jobs,
+                                                        **_process_pool_context())
+            return self.process_pool.submit(_process_in_worker, self.engine.to_settings(), zip_info)
+        return self.thread_pool.submit(self.engine.process_music_zip, zip_info)
+
+    def result(self, zip_info, future):
+        """Return whether a finished future succeeded, logging any error"""
+        try:
+            ok = future.result()
+            if isinstance(ok, tuple):
+                # Result from a worker process: replay its log records here,
+                # copy back what it set on its copy of zip_info and delete
+                # what it moved to the trash on this process's thread
+                ok, records, stats = ok
+                for levelno, message in records:
+                    self.engine.logger.log(levelno, message)
+                trashed = stats.pop('trashed', [])
+                if trashed and self.engine.trash is not None:
+                    self.engine.trash.delete_later(trashed)
+                zip_info.update(stats)
+            return ok
+        except Exception as e:
+            self.engine.logger.error(f"Error processing {zip_info['zip_path']}: {e}")
+            return False
+
+    def shutdown(self):
+        """Wait for running archives and stop the pools"""
+        self.thread_pool.shutdown(wait=True)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=True)
+
+
+class _RecordCollector(logging.Handler):
+    """Collect (levelno, message) pairs so a worker process can return them"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+
+def _process_pool_context():
+    """Return the keyword arguments selecting a safe start method for a process pool"""
+    if sys.version_info < (3, 7):
+        # No mp_context before Python 3.7: the platform default is used
+        return {}
+    available = multiprocessing.get_all_start_methods()
+    method = next(m for m in PROCESS_START_METHODS if m in available)
+    return {'mp_context': multiprocessing.get_context(method)}
+
+
+def _process_in_worker(settings, zip_info):
+    """Process one archive in a worker process
+
+    Returns (ok, records, stats) where records are the log messages
+    produced, so the parent can replay them into its own handlers, and
+    stats holds the 'bytes', 'duration' and 'stages' set on the worker's
+    zip_info, and the paths it moved to the trash as 'trashed'.
+    """
+    collector = _RecordCollector()
+    logger = logging.getLogger(f"{__name__}.worker")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [collector]
+    engine = ExtractorEngine.from_settings(settings, logger=logger)
+    if engine.trash is not None:
+        # Pool processes may exit before a deletion thread would finish
+        engine.trash.background = False
+    try:
+        ok = engine.process_music_zip(zip_info)
+    except Exception as e:
+        logger.error(f"Error processing {zip_info['zip_path']}: {e}")
+        ok = False
+    finally:
+        if engine.journal is not None:
+            engine.journal.close()
+    stats = {key: zip_info[key] for key in ('bytes', 'duration', 'stages') if key in zip_info}
+    if engine.trash is not None:
+        stats['trashed'] = engine.trash.take_pending()
+    return ok, collector.records, stats
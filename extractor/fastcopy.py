@@ -0,0 +1,199 @@
+"""
+Music Library Extractor - zero-copy extraction of stored zip members
+
+Most album zips keep FLAC/MP3 tracks uncompressed (ZIP_STORED), so a member
+is just a byte range of the archive. Instead of pushing it through Python
+read/write buffers, copy_stored_member asks the kernel to copy the range
+(os.copy_file_range, then os.sendfile) and only falls back to writing
+slices of an mmap of the archive. The CRC-32 is still checked, computed by
+zlib directly over the mapped archive pages, or over the written file's
+pages when verifying what was written (see verify).
+"""
+
+import os
+import mmap
+import zlib
+import errno
+import struct
+import zipfile
+import tempfile
+from contextlib import contextmanager
+
+# Local file header: signature, ..., file name length, extra field length
+_LOCAL_HEADER = struct.Struct('<4s22xHH')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+
+# Largest range handed to the kernel or to zlib in one call
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Errors meaning "this copy method cannot handle these files", as opposed to
+# real I/O errors such as ENOSPC which must propagate
+_FALLBACK_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTSOCK,
+                    errno.EOPNOTSUPP, getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+
+# Copy methods the platform does not provide are not retried
+_unsupported = set()
+
+
+def can_fast_copy(zip_ref, info):
+    """Return True if info can be copied straight out of the archive file"""
+    if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+        return False
+    if not hasattr(os, 'pread'):
+        return False
+    if isinstance(zip_ref.fp, tempfile.SpooledTemporaryFile) and not zip_ref.fp._rolled:
+        # An inner archive still in memory (see nested): fileno() would
+        # spill it to disk
+        return False
+    try:
+        zip_ref.fp.fileno()
+    except (AttributeError, OSError, ValueError):
+        return False
+    return True
+
+
+def member_data_offset(fd, info):
+    """Return the offset of a member's data from its local file header"""
+    header = os.pread(fd, _LOCAL_HEADER.size, info.header_offset)
+    if len(header) != _LOCAL_HEADER.size:
+        raise zipfile.BadZipFile(f"Truncated file header for {info.filename!r}")
+    signature, name_length, extra_length = _LOCAL_HEADER.unpack(header)
+    if signature != _LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad magic number for file header of {info.filename!r}")
+    offset = info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+    if offset + info.compress_size > os.fstat(fd).st_size:
+        raise zipfile.BadZipFile(f"Truncated data for file {info.filename!r}")
+    return offset
+
+
+def copy_stored_member(zip_ref, info, target, check=None):
+    """Copy a ZIP_STORED member to target without Python-level buffering
+
+    Raises zipfile.BadZipFile if the data does not match the CRC-32 from
+    the central directory; target is removed in that case. With a
+    verify.MemberCheck, the written file is fed to it instead and checking
+    is left to the caller.
+    """
+    src_fd = zip_ref.fp.fileno()
+    offset = member_data_offset(src_fd, info)
+    size = info.file_size
+
+    with open(target, 'wb') as dest:
+        try:
+            _copy_range(src_fd, dest.fileno(), offset, size)
+        except Exception:
+            dest.close()
+            os.remove(target)
+            raise
+
+    if check is not None:
+        with open(target, 'rb') as written:
+            # A short file is reported by the check, not by mmap
+            feed_range(written.fileno(), 0, min(size, os.fstat(written.fileno()).st_size),
+                       check.update)
+        return
+
+    crc = range_crc32(src_fd, offset, size)
+    if crc != info.CRC:
+        os.remove(target)
+        raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+
+
+def range_crc32(fd, offset, size):
+    """Compute the CRC-32 of size bytes at offset in fd through an mmap"""
+    if size == 0:
+        return 0
+    with _map_range(fd, offset, size) as (view, start):
+        crc = 0
+        for pos in range(start, start + size, CHUNK_SIZE):
+            crc = zlib.crc32(view[pos:min(pos + CHUNK_SIZE, start + size)], crc)
+        return crc
+
+
+def feed_range(fd, offset, size, update):
+    """Call update with successive chunks of size bytes at offset in fd"""
+    if size == 0:
+        return
+    with _map_range(fd, offset, size) as (view, start):
+        for pos in range(start, start + size, CHUNK_SIZE):
+            update(view[pos:min(pos + CHUNK_SIZE, start + size)])
+
+
+def _copy_range(src_fd, dst_fd, offset, size):
+    """Copy size bytes at offset in src_fd to the start of dst_fd"""
+    if size == 0:
+        return
+    for method in (_copy_file_range, _sendfile):
+        if method.__name__ in _unsupported:
+            continue
+        try:
+            copied = method(src_fd, dst_fd, offset, size)
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+            if e.errno in (errno.ENOSYS, errno.ENOTSOCK):
+                _unsupported.add(method.__name__)
+            copied = 0
+        if copied == size:
+            return
+        if copied:
+            # Partial copy (e.g. short count from the kernel): finish the rest
+            _copy_mmap(src_fd, dst_fd, offset + copied, size - copied, copied)
+            return
+    _copy_mmap(src_fd, dst_fd, offset, size, 0)
+
+
+def _copy_file_range(src_fd, dst_fd, offset, size):
+    """Copy with os.copy_file_range (Linux 4.5+, Python 3.8+)"""
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, "copy_file_range not available")
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src_fd, dst_fd, min(size - copied, CHUNK_SIZE),
+                               offset + copied, copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _sendfile(src_fd, dst_fd, offset, size):
+    """Copy with os.sendfile, which accepts a regular file as output on Linux"""
+    if not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOSYS, "sendfile not available")
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, offset + copied, min(size - copied, CHUNK_SIZE))
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_mmap(src_fd, dst_fd, offset, size, dst_offset):
+    """Write slices of an mmap of the source range to dst_fd"""
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    with _map_range(src_fd, offset, size) as (view, start):
+        pos = start
+        end = start + size
+        while pos < end:
+            pos += os.write(dst_fd, view[pos:min(pos + CHUNK_SIZE, end)])
+
+
+@contextmanager
+def _map_range(fd, offset, size):
+    """Map the pages covering [offset, offset + size) of fd read-only
+
+    Yields (memoryview, start) where start is the index of offset in the
+    view, since mmap offsets must be aligned to the allocation granularity.
+    """
+    aligned = offset - offset % mmap.ALLOCATIONGRANULARITY
+    start = offset - aligned
+    mapped = mmap.mmap(fd, start + size, access=mmap.ACCESS_READ, offset=aligned)
+    view = memoryview(mapped)
+    try:
+        yield view, start
+    finally:
+        view.release()
+        mapped.close()
@@ -0,0 +1,281 @@
+"""
+Music Library Extractor - crash-safe extraction journal
+
+Before and after each step of extracting an archive, a line is appended
+to a write-ahead journal and flushed to disk:
+
+    planned         the staging folder exists and is being filled
+    staged          every member is written; the album only needs renaming
+    committed       the album is in the library
+    source_deleted  the zip was deleted (only when auto-delete is on)
+    failed          extraction failed and was cleaned up
+
+Each process writes its own file in JOURNAL_DIR, named after its pid and
+a random token so a later process that reuses the pid never appends to
+it, and holds a lock on it while it runs. On startup, files whose lock is
+free belong to runs that were killed; recover() takes their lock, rolls
+their archives forward (rename a complete staged album into place, delete
+the zip, record it in the ledger) or cleans up after them (remove a
+half-filled staging or temp folder, or the partial files of a sync), so
+an interrupted batch resumes with the archives that were not finished.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".music_extractor_journal")
+
+PLANNED = 'planned'
+STAGED = 'staged'
+COMMITTED = 'committed'
+SOURCE_DELETED = 'source_deleted'
+FAILED = 'failed'
+
+# Values of the 'mode' field of a planned record
+MODE_STAGING = 'staging'
+MODE_TEMPDIR = 'tempdir'
+MODE_SYNC = 'sync'
+
+if os.name == 'posix':
+    import fcntl
+
+    def _try_lock(fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+else:
+    import msvcrt
+
+    def _try_lock(fd):
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+
+def partial_path(target, pid):
+    """Return the file a sync writes target to before renaming it into place"""
+    return os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.partial_{pid}")
+
+
+def journal_pid(path):
+    """Return the pid of the process that wrote a journal file, or None"""
+    pid = os.path.basename(path).split('-')[0].split('.')[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def read_journal(path):
+    """Return {zip_path: (planned record, last record)} from a journal file
+
+    A line cut short by a crash is ignored.
+    """
+    archives = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            zip_path = record.get('zip')
+            if record.get('state') == PLANNED or zip_path not in archives:
+                archives[zip_path] = (record, record)
+            else:
+                archives[zip_path] = (archives[zip_path][0], record)
+    return archives
+
+
+class Journal:
+    """Per-process write-ahead journal of archive extraction steps"""
+
+    def __init__(self, journal_dir=JOURNAL_DIR, logger=None):
+        self.journal_dir = journal_dir
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.fd = None
+        self.pid = None
+        self.path = None
+        # zip_path -> (delete_source, last state) for archives of this process
+        self.states = {}
+
+    def _open(self):
+        # A forked worker process gets its own file
+        if self.fd is not None and self.pid == os.getpid():
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.pid = os.getpid()
+        self.path = os.path.join(self.journal_dir, f"{self.pid}-{uuid.uuid4().hex[:12]}.jsonl")
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        self.states = {}
+        _try_lock(self.fd)
+
+    def write(self, zip_path, state, **fields):
+        """Append a record and flush it to disk before returning"""
+        record = dict(fields, zip=zip_path, state=state, t=time.time())
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self.lock:
+            self._open()
+            os.write(self.fd, line)
+            os.fsync(self.fd)
+            delete_source = fields.get('delete_source', self.states.get(zip_path, (False,))[0])
+            self.states[zip_path] = (delete_source, state)
+
+    def fail(self, zip_path):
+        """Record a failure for an archive this process has started on"""
+        with self.lock:
+            started = zip_path in self.states and self.pid == os.getpid()
+        if started:
+            self.write(zip_path, FAILED)
+
+    def close(self):
+        """Close this process's journal, removing it if every archive is done"""
+        with self.lock:
+            if self.fd is None or self.pid != os.getpid():
+                return
+            finished = all(state in (SOURCE_DELETED, FAILED) or
+                           (state == COMMITTED and not delete_source)
+                           for delete_source, state in self.states.values())
+            os.close(self.fd)
+            self.fd = None
+            if finished:
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+
+    def _journal_files(self):
+        """Return the journal files of other processes"""
+        try:
+            names = os.listdir(self.journal_dir)
+        except FileNotFoundError:
+            return []
+        own = self.path if self.fd is not None else None
+        return [os.path.join(self.journal_dir, name) for name in names
+                if name.endswith('.jsonl') and os.path.join(self.journal_dir, name) != own]
+
+    def _lock_abandoned(self, path):
+        """Return an fd holding the lock on path if its owner has exited, else None"""
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except OSError:
+            return None
+        # The owner holds the lock until it exits. Another process may
+        # have recovered and removed the file while this one waited
+        try:
+            if _try_lock(fd) and os.path.samestat(os.fstat(fd), os.stat(path)):
+                return fd
+        except OSError:
+            pass
+        os.close(fd)
+        return None
+
+    def live_staging_dirs(self):
+        """Return staging folders named in the journals of running processes"""
+        dirs = set()
+        for path in self._journal_files():
+            fd = self._lock_abandoned(path)
+            if fd is not None:
+                os.close(fd)
+                continue
+            try:
+                archives = read_journal(path)
+            except OSError:
+                continue
+            for planned, last in archives.values():
+                if planned.get('staging'):
+                    dirs.add(os.path.normpath(planned['staging']))
+        return dirs
+
+    def recover(self, engine):
+        """Finish or undo the archives left behind by killed runs
+
+        Returns the number of archives that were rolled forward.
+        """
+        rolled_forward = 0
+        for path in self._journal_files():
+            fd = self._lock_abandoned(path)
+            if fd is None:
+                continue
+            ok = True
+            pid = journal_pid(path)
+            try:
+                for zip_path, (planned, last) in read_journal(path).items():
+                    # Committed archives are still visited: the run may have
+                    # died before recording them in the ledger
+                    if last['state'] in (SOURCE_DELETED, FAILED):
+                        continue
+                    try:
+                        if planned.get('mode') == MODE_SYNC and pid is not None:
+                            self._remove_partials(planned.get('dest'), pid)
+                        if self._recover_archive(engine, zip_path, planned, last):
+                            rolled_forward += 1
+                    except Exception as e:
+                        ok = False
+                        self.logger.error(f"Could not recover {zip_path}: {e}")
+            except OSError as e:
+                ok = False
+                self.logger.error(f"Could not read journal {path}: {e}")
+            try:
+                if ok and os.name == 'posix':
+                    # Removed while still locked, so no other process recovers it again
+                    os.remove(path)
+            finally:
+                os.close(fd)
+            if ok and os.name != 'posix':
+                # Open files cannot be removed on Windows
+                os.remove(path)
+        if rolled_forward:
+            engine.ledger.save()
+        return rolled_forward
+
+    def _remove_partials(self, dest, pid):
+        """Remove the files a sync by process pid left half-written below dest"""
+        if not dest or not os.path.isdir(dest):
+            return
+        suffix = f".partial_{pid}"
+        for dirpath, dirnames, filenames in os.walk(dest):
+            for name in filenames:
+                if name.startswith('.') and name.endswith(suffix):
+                    os.remove(os.path.join(dirpath, name))
+                    self.logger.info(f"Removed partial file: {os.path.join(dirpath, name)}")
+
+    def _recover_archive(self, engine, zip_path, planned, last):
+        """Roll one interrupted archive forward or back; True if rolled forward"""
+        state = last['state']
+        staging = planned.get('staging')
+        dest = planned.get('dest')
+        name = os.path.basename(zip_path)
+
+        if state == STAGED and planned.get('mode') == MODE_STAGING:
+            if staging and os.path.isdir(staging):
+                # Every member was written: the rename is all that is missing
+                engine.commit_album(staging, dest)
+                self.logger.info(f"Recovered {name}: committed staged album to {dest}")
+            state = COMMITTED
+        elif state == PLANNED or state == STAGED:
+            # Half-written or not yet moved; the archive is extracted again
+            # on the next run
+            if staging and os.path.exists(staging):
+                shutil.rmtree(staging, ignore_errors=True)
+            self.logger.info(f"Recovered {name}: removed unfinished extraction, "
+                             f"it will be extracted again")
+            return False
+
+        # Committed: clean up and finish the remaining steps
+        if staging and os.path.exists(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+        if planned.get('replaced') and os.path.exists(planned['replaced']):
+            shutil.rmtree(planned['replaced'], ignore_errors=True)
+        if planned.get('fingerprint') and os.path.isdir(dest):
+            engine.ledger.record(planned['fingerprint'], {'filename': name}, dest)
+        if planned.get('delete_source') and os.path.exists(zip_path):
+            os.remove(zip_path)
+            self.logger.info(f"Recovered {name}: deleted zip file")
+        return True
@@ -0,0 +1,155 @@
+"""
+Music Library Extractor - processed archive ledger
+
+Records which archives have already been extracted into the library, so a
+scan with auto-delete off does not re-extract (and rewrite) every album
+each time. Archives are identified by a fingerprint of their size, mtime
+and the names, sizes and CRC-32s from the zip's central directory (tar
+archives have none, so the head and tail of the file are hashed instead); the
+fingerprint of a path is cached against its (size, mtime, inode) so
+rescanning unchanged zips only costs a stat.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import zipfile
+import threading
+
+from .tarstream import is_tar_archive
+
+LEDGER_FILE = os.path.join(os.path.expanduser("~"), ".music_extractor_ledger.json")
+
+# Bump when the on-disk layout or the fingerprint changes
+LEDGER_VERSION = 1
+
+# Bytes read from each end of a tar archive for its fingerprint
+TAR_SAMPLE_SIZE = 64 * 1024
+
+
+def archive_fingerprint(zip_path, st=None):
+    """Return a hex fingerprint of an archive from its central directory"""
+    st = st or os.stat(zip_path)
+    digest = hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    if is_tar_archive(zip_path):
+        with open(zip_path, 'rb') as f:
+            digest.update(f.read(TAR_SAMPLE_SIZE))
+            if st.st_size > TAR_SAMPLE_SIZE:
+                f.seek(-TAR_SAMPLE_SIZE, os.SEEK_END)
+                digest.update(f.read())
+        return digest.hexdigest()
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            digest.update(f"\0{info.filename}\0{info.file_size}\0{info.CRC}".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+class Ledger:
+    """On-disk record of archives already extracted into the library"""
+
+    def __init__(self, ledger_file=LEDGER_FILE, logger=None):
+        self.ledger_file = ledger_file
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.archives = None
+        self.paths = None
+        # Extraction throughput of recent runs in bytes per second
+        self.rate = None
+        self.dirty = False
+
+    def load(self):
+        """Read the ledger file; a missing or unreadable ledger starts empty"""
+        self.archives = {}
+        self.paths = {}
+        self.rate = None
+        try:
+            if os.path.exists(self.ledger_file):
+                with open(self.ledger_file, 'r') as f:
+                    data = json.load(f)
+                if data.get('version') == LEDGER_VERSION:
+                    self.archives = data.get('archives', {})
+                    self.paths = data.get('paths', {})
+                    self.rate = data.get('throughput')
+        except Exception as e:
+            self.logger.warning(f"Could not read processed archive ledger: {e}")
+
+    def _ensure_loaded(self):
+        if self.archives is None:
+            self.load()
+
+    def save(self):
+        """Write the ledger back if it changed, replacing the file atomically"""
+        with self.lock:
+            if not self.dirty:
+                return
+            # Forget cached fingerprints of zips that are gone
+            for path in [p for p in self.paths if not os.path.exists(p)]:
+                del self.paths[path]
+            data = {'version': LEDGER_VERSION, 'archives': self.archives, 'paths': self.paths,
+                    'throughput': self.rate}
+            tmp_file = f"{self.ledger_file}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_file, 'w') as f:
+                    json.dump(data, f, separators=(',', ':'))
+                os.replace(tmp_file, self.ledger_file)
+                self.dirty = False
+            except Exception as e:
+                self.logger.error(f"Could not save processed archive ledger: {e}")
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+
+    def fingerprint(self, zip_path):
+        """Return the archive's fingerprint, reading the zip only if it changed"""
+        st = os.stat(zip_path)
+        key = [st.st_size, st.st_mtime_ns, st.st_ino]
+        path = os.path.abspath(zip_path)
+        with self.lock:
+            self._ensure_loaded()
+            cached = self.paths.get(path)
+            if cached is not None and cached[:3] == key:
+                return cached[3]
+
+        fingerprint = archive_fingerprint(zip_path, st)
+        with self.lock:
+            self.paths[path] = key + [fingerprint]
+            self.dirty = True
+        return fingerprint
+
+    def lookup(self, fingerprint, destination):
+        """Return the ledger entry if this archive is already at destination"""
+        with self.lock:
+            self._ensure_loaded()
+            entry = self.archives.get(fingerprint)
+        if entry and entry.get('destination') == destination and os.path.isdir(destination):
+            return entry
+        return None
+
+    def record(self, fingerprint, zip_info, destination):
+        """Remember that an archive was extracted to destination"""
+        with self.lock:
+            self._ensure_loaded()
+            # The destination now only holds this archive's contents
+            for other in [fp for fp, entry in self.archives.items()
+                          if entry.get('destination') == destination]:
+                del self.archives[other]
+            self.archives[fingerprint] = {
+                'filename': zip_info['filename'],
+                'destination': destination,
+                'processed_at': time.time()
+            }
+            self.dirty = True
+
+    def throughput(self):
+        """Return the measured extraction throughput in bytes per second, or None"""
+        with self.lock:
+            self._ensure_loaded()
+            return self.rate
+
+    def record_throughput(self, rate):
+        """Blend the throughput of a finished run into the measured figure"""
+        with self.lock:
+            self._ensure_loaded()
+            self.rate = rate if not self.rate else (self.rate + rate) / 2
+            self.dirty = True
@@ -0,0 +1,126 @@
+"""
+Music Library Extractor - file name matching
+
+All naming formats are compiled into one regular expression, one
+alternative per format in priority order, so a file name is classified
+with a single match call no matter how many formats are enabled. The
+alternative that matched tells which format it was.
+
+Format patterns are matched against the file name without its archive
+extension and name their groups 'artist' and 'album'. Patterns without
+named groups use group 1 for the artist and group 2 for the album.
+"""
+
+import re
+
+from .tarstream import TAR_SUFFIXES
+
+# Built-in naming formats, keyed by the label shown in the GUI
+FORMAT_PATTERNS = {
+    "Artist - Album.zip": r"^(?P<artist>.+?)\s*-\s*(?P<album>.+?)$",
+    "Artist_Album.zip": r"^(?P<artist>.+?)_(?P<album>.+?)$",
+    "Artist.Album.zip": r"^(?P<artist>.+?)\.(?P<album>.+?)$",
+    "Album by Artist.zip": r"^(?P<album>.+?)\s+by\s+(?P<artist>.+?)$",
+    "Artist - Album - Year.zip": r"^(?P<artist>.+?)\s*-\s*(?P<album>.+?)\s*-\s*\d{4}$"
+}
+
+# Order the built-in formats are tried in when all formats are enabled:
+# the most specific first, so e.g. "A - B - 1969" is not read as album "B - 1969"
+FORMAT_PRIORITY = [
+    "Artist - Album - Year.zip",
+    "Artist - Album.zip",
+    "Album by Artist.zip",
+    "Artist_Album.zip",
+    "Artist.Album.zip"
+]
+
+# Pseudo format that tries user-defined formats, then every built-in one
+AUTO_FORMAT = "Auto (all formats)"
+
+# Longest first, so '.tar.gz' is split off whole
+ARCHIVE_SUFFIXES = ('.zip',) + TAR_SUFFIXES
+
+_NAMED_GROUP = re.compile(r'\(\?P<(\w+)>')
+_NAMED_BACKREF = re.compile(r'\(\?P=(\w+)\)')
+
+
+def split_archive_name(filename):
+    """Split a file name into (stem, suffix) for known archive suffixes
+
+    Returns (filename, '') when the name has no archive suffix.
+    """
+    lower = filename.lower()
+    for suffix in ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix):
+            return filename[:-len(suffix)], filename[-len(suffix):]
+    return filename, ''
+
+
+def format_list(selected, custom_formats=None):
+    """Return [(name, pattern)] to try for the selected format, in priority order"""
+    custom_formats = custom_formats or {}
+    if selected == AUTO_FORMAT:
+        formats = list(custom_formats.items())
+        formats += [(name, FORMAT_PATTERNS[name]) for name in FORMAT_PRIORITY]
+        return formats
+    if selected in custom_formats:
+        return [(selected, custom_formats[selected])]
+    if selected in FORMAT_PATTERNS:
+        return [(selected, FORMAT_PATTERNS[selected])]
+    raise ValueError(f"Unknown format: {selected}")
+
+
+class FilenameMatcher:
+    """Classify archive file names against several formats in one pass"""
+
+    def __init__(self, formats):
+        """formats is a list of (name, pattern) pairs in priority order
+
+        Raises ValueError if a pattern does not compile or does not define
+        an artist and an album group.
+        """
+        alternatives = []
+        self.alternatives = {}
+        group_count = 0
+        for i, (name, pattern) in enumerate(formats):
+            try:
+                compiled = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern for format {name!r}: {e}")
+
+            if 'artist' in compiled.groupindex and 'album' in compiled.groupindex:
+                artist, album = compiled.groupindex['artist'], compiled.groupindex['album']
+            elif compiled.groups >= 2:
+                artist, album = 1, 2
+            else:
+                raise ValueError(f"Format {name!r} needs artist and album groups")
+
+            # Group names must be unique across the combined expression
+            prefix = f"f{i}_"
+            body = _NAMED_GROUP.sub(lambda m: f"(?P<{prefix}{m.group(1)}>", pattern)
+            body = _NAMED_BACKREF.sub(lambda m: f"(?P={prefix}{m.group(1)})", body)
+
+            # The wrapping group closes last, so it is match.lastindex when
+            # this alternative matched
+            outer = group_count + 1
+            self.alternatives[outer] = (name, outer + artist, outer + album)
+            group_count = outer + compiled.groups
+            alternatives.append(f"({body})")
+
+        self.formats = [name for name, pattern in formats]
+        self.signature = '|'.join(alternatives)
+        try:
+            self.regex = re.compile(self.signature, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Could not combine formats: {e}")
+
+    def match(self, filename):
+        """Return (artist, album, format name) for an archive name, or None"""
+        stem, suffix = split_archive_name(filename)
+        if not suffix:
+            return None
+        match = self.regex.match(stem)
+        if not match:
+            return None
+        name, artist, album = self.alternatives[match.lastindex]
+        return match.group(artist).strip(), match.group(album).strip(), name
@@ -0,0 +1,175 @@
+"""
+Music Library Extractor - nested archives
+
+Box sets often come as an outer zip holding one zip per disc:
+
+    Box Set.zip
+        Box Set/Disc 1.zip      ->  Artist/Box Set/Disc 1/01 ....flac
+        Box Set/Disc 2.zip      ->  Artist/Box Set/Disc 2/01 ....flac
+
+The inner archives are read straight out of the outer one rather than
+being extracted to disk and opened again. A stored inner zip (the usual
+case, zips hardly compress) is opened through a read-only window onto its
+byte range of the outer file, so zipfile seeks around in it without
+anything being copied. A compressed inner zip has to be inflated into
+something seekable first; it is kept in memory up to SPOOL_SIZE and
+spills to a temporary file beyond that.
+
+Each inner archive becomes a subfolder named after it, with its own
+single top-level folder, if it has one, stripped.
+"""
+
+import io
+import shutil
+import struct
+import zipfile
+import tempfile
+from contextlib import contextmanager
+
+NESTED_SUFFIXES = ('.zip',)
+
+# Compressed inner archives larger than this are spooled to disk
+SPOOL_SIZE = 64 * 1024 * 1024
+
+# Buffer size used when inflating a compressed inner archive
+COPY_BUFSIZE = 1024 * 1024
+
+# Local file header: signature, ..., file name length, extra field length
+_LOCAL_HEADER = struct.Struct('<4s22xHH')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+
+
+def is_nested_archive(name):
+    """Return True if an archive member name is itself an archive"""
+    return not name.endswith('/') and name.lower().endswith(NESTED_SUFFIXES)
+
+
+def nested_folder_name(name):
+    """Return the folder a nested archive is extracted into: its name without suffix"""
+    lower = name.lower()
+    for suffix in NESTED_SUFFIXES:
+        if lower.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class MemberWindow(io.RawIOBase):
+    """Seekable read-only view of a byte range of a file"""
+
+    def __init__(self, path, offset, size):
+        super().__init__()
+        self.file = open(path, 'rb')
+        self.offset = offset
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            pos += self.size
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self.pos = pos
+        return self.pos
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), self.size - self.pos))
+        if n == 0:
+            return 0
+        self.file.seek(self.offset + self.pos)
+        n = self.file.readinto(memoryview(buffer)[:n])
+        self.pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
+
+
+def member_data_offset(path, info):
+    """Return the offset of a member's data in the archive at path"""
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = f.read(_LOCAL_HEADER.size)
+    if len(header) != _LOCAL_HEADER.size:
+        raise zipfile.BadZipFile(f"Truncated file header for {info.filename!r}")
+    signature, name_length, extra_length = _LOCAL_HEADER.unpack(header)
+    if signature != _LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad magic number for file header of {info.filename!r}")
+    return info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+
+
+@contextmanager
+def open_nested(zip_ref, info, spool_dir=None):
+    """Open a member of zip_ref that is a zip archive and yield it as a ZipFile"""
+    if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1 \
+            and isinstance(zip_ref.filename, str):
+        fileobj = MemberWindow(zip_ref.filename, member_data_offset(zip_ref.filename, info),
+                               info.file_size)
+    else:
+        fileobj = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, dir=spool_dir)
+        try:
+            with zip_ref.open(info) as source:
+                shutil.copyfileobj(source, fileobj, COPY_BUFSIZE)
+            fileobj.seek(0)
+        except Exception:
+            fileobj.close()
+            raise
+    try:
+        with zipfile.ZipFile(fileobj, 'r') as inner:
+            yield inner
+    finally:
+        fileobj.close()
+
+
+def nested_size(zip_ref, info):
+    """Return the bytes an inner archive's members take once expanded"""
+    with open_nested(zip_ref, info) as inner:
+        return sum(inner_info.file_size for inner_info in inner.infolist())
+
+
+def inner_root(inner):
+    """Return the prefix of an inner archive's single top-level folder, or ''"""
+    folders = set()
+    for name in inner.namelist():
+        parts = name.split('/')
+        if len(parts) == 1 or not parts[0]:
+            # A loose file at the top: keep the layout as it is
+            return ''
+        folders.add(parts[0])
+    return f"{folders.pop()}/" if len(folders) == 1 else ''
+
+
+def album_members(zip_ref, prefix, spool_dir=None):
+    """Yield (path in album, archive, ZipInfo) for the members below prefix
+
+    Nested archives are expanded in place: the members of 'Disc 1.zip' are
+    yielded as 'Disc 1/...' with archive set to the opened inner ZipFile.
+    Inner archives are only open while their members are being yielded.
+    """
+    for info in zip_ref.infolist():
+        if not info.filename.startswith(prefix):
+            continue
+        name = info.filename[len(prefix):]
+        if not is_nested_archive(name):
+            yield name, zip_ref, info
+            continue
+
+        folder = nested_folder_name(name)
+        with open_nested(zip_ref, info, spool_dir) as inner:
+            strip = inner_root(inner)
+            for inner_info in inner.infolist():
+                inner_name = inner_info.filename[len(strip):]
+                if inner_name:
+                    yield f"{folder}/{inner_name}", inner, inner_info
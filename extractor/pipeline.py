@@ -0,0 +1,231 @@
+"""
+Music Library Extractor - staged ingest pipeline
+
+find_music_zips() followed by extract_all() lists the whole downloads
+folder, reads every archive and only then starts extracting. ingest() runs
+the same steps as stages connected by bounded queues under an asyncio
+event loop instead, so the first albums are written while the folder is
+still being listed, and a stage that falls behind holds the earlier ones
+back rather than letting found archives pile up in memory:
+
+    discover  list the downloads folder and match file names
+    screen    skip archives already in the library or claimed elsewhere
+    inspect   read the central directory: album size, compression, space
+    extract   stage, commit and clean up the album on the WorkerPool
+    record    report, ledger, claims and the on_done callback
+
+Blocking work runs on a thread pool (and, for deflate-heavy archives, the
+WorkerPool's processes); the event loop only moves archives between
+queues. Archives sharing a destination album are extracted one after the
+other, in the order they were found.
+"""
+
+import os
+import shutil
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from . import tarstream
+from .planner import existing_ancestor
+from .report import format_size
+
+# Archives waiting between two stages; extract only takes jobs at a time
+QUEUE_SIZE = 16
+
+# Seconds the discover thread waits for room in the queue before checking
+# whether the pipeline was stopped
+PUT_TIMEOUT = 0.5
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class IngestPipeline:
+    """Discover, screen, inspect, extract and record archives concurrently"""
+
+    def __init__(self, engine, pool, on_start=None, on_done=None, space_check=True,
+                 queue_size=QUEUE_SIZE):
+        self.engine = engine
+        self.pool = pool
+        self.logger = engine.logger
+        self.on_start = on_start
+        self.on_done = on_done
+        self.space_check = space_check
+        self.queue_size = queue_size
+        self.stop_event = threading.Event()
+        self.started = 0
+        self.processed = 0
+        self.failed = 0
+        # Devices each inspected archive still writes to, per zip path; the
+        # bytes it holds there are whatever progress has not counted yet
+        self.reservations = {}
+        self.destination_locks = {}
+
+    def run(self):
+        """Run the pipeline to completion and return (processed, failed)"""
+        # A loop of its own rather than asyncio.run(), which needs Python 3.7
+        self.loop = asyncio.new_event_loop()
+        try:
+            return self.loop.run_until_complete(self._run())
+        finally:
+            self.loop.close()
+
+    async def _run(self):
+        engine = self.engine
+        # One thread for discover, the rest for the per-archive stages
+        self.executor = ThreadPoolExecutor(max_workers=engine.scan_workers + 1,
+                                           thread_name_prefix='ingest')
+        found = asyncio.Queue(self.queue_size)
+        screened = asyncio.Queue(self.queue_size)
+        inspected = asyncio.Queue(engine.jobs)
+        extracted = asyncio.Queue(self.queue_size)
+        try:
+            await asyncio.gather(
+                self.loop.run_in_executor(self.executor, self._discover, found),
+                self._stage(found, screened, self._screen, 1),
+                self._stage(screened, inspected, self._inspect, engine.scan_workers),
+                self._stage(inspected, extracted, self._extract, engine.jobs),
+                self._stage(extracted, None, self._record, 1))
+        finally:
+            self.stop_event.set()
+            self.pool.shutdown()
+            self.executor.shutdown(wait=True)
+        return self.processed, self.failed
+
+    async def _stage(self, source, sink, work, workers):
+        """Feed items from source through work on workers consumers into sink
+
+        work(item) returns the item to pass on, or None to drop it.
+        """
+        async def consume():
+            while True:
+                item = await source.get()
+                if item is _DONE:
+                    # Let the other consumers of this stage see it too
+                    source.put_nowait(_DONE)
+                    return
+                result = await work(item)
+                if result is not None and sink is not None:
+                    await sink.put(result)
+
+        await asyncio.gather(*(consume() for _ in range(workers)))
+        if sink is not None:
+            await sink.put(_DONE)
+
+    def _blocking(self, func, *args):
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    def _discover(self, found):
+        """List the downloads folder, feeding matches into found (own thread)"""
+        try:
+            for zip_info in self.engine.iter_music_zips():
+                if not self._put_threadsafe(found, zip_info):
+                    return
+        except Exception as e:
+            self.logger.error(f"Error scanning {self.engine.downloads_folder}: {e}")
+        finally:
+            self._put_threadsafe(found, _DONE)
+
+    def _put_threadsafe(self, queue, item):
+        """Put item on an event loop queue from another thread, waiting for room"""
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), self.loop)
+        while not self.stop_event.is_set():
+            try:
+                future.result(PUT_TIMEOUT)
+                return True
+            except FutureTimeoutError:
+                continue
+        future.cancel()
+        return False
+
+    async def _screen(self, zip_info):
+        engine = self.engine
+        await self._blocking(engine.mark_processed, [zip_info], False)
+        if engine.skip_processed and zip_info['in_library']:
+            engine.skip_in_library(zip_info)
+            return None
+        reason = await self._blocking(engine.claim_archive, zip_info)
+        if reason:
+            engine.skip_claimed(zip_info, reason)
+            return None
+        return zip_info
+
+    async def _inspect(self, zip_info):
+        engine = self.engine
+        zip_path = zip_info['zip_path']
+        try:
+            size, deflate_heavy, space = await self._blocking(self._read_archive, zip_info)
+        except Exception as e:
+            self.logger.error(f"Error reading {zip_path}: {e}")
+            return zip_info, False
+        engine.progress.add(zip_path, size)
+        if self.space_check:
+            for dev, free in space.items():
+                reserved = self._reserved(dev)
+                if size + reserved > free:
+                    self.logger.error(f"Not enough free space for {zip_info['filename']}: needs "
+                                      f"{format_size(size)}, "
+                                      f"{format_size(max(0, free - reserved))} left")
+                    return zip_info, False
+        self.reservations[zip_path] = set(space)
+        zip_info['deflate_heavy'] = deflate_heavy
+        return zip_info, None
+
+    def _reserved(self, dev):
+        """Bytes still to be written to device dev by archives already inspected"""
+        progress = self.engine.progress
+        return sum(progress.remaining(zip_path)
+                   for zip_path, devices in self.reservations.items() if dev in devices)
+
+    def _read_archive(self, zip_info):
+        """Return (uncompressed size, deflate heavy, free bytes per target device)"""
+        engine = self.engine
+        size = engine.archive_size(zip_info['zip_path'])
+        deflate_heavy = engine.is_deflate_heavy(zip_info['zip_path'])
+        space = {}
+        for path in self._targets(zip_info):
+            try:
+                path = existing_ancestor(path)
+                space[os.stat(path).st_dev] = shutil.disk_usage(path).free
+            except OSError:
+                continue
+        return size, deflate_heavy, space
+
+    def _targets(self, zip_info):
+        """Folders the album is written to: the library, plus the temp folder"""
+        engine = self.engine
+        targets = [engine.album_destination(zip_info)]
+        if not (engine.streaming or engine.existing_album == 'sync'
+                or tarstream.is_tar_archive(zip_info['zip_path'])):
+            # process_music_zip_tempdir extracts next to the archive first
+            targets.append(engine.downloads_folder)
+        return targets
+
+    async def _extract(self, item):
+        zip_info, ok = item
+        if ok is not None:
+            # Failed before extracting
+            return item
+        key = (zip_info['artist'].lower(), zip_info['album'].lower())
+        lock = self.destination_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if self.on_start:
+                self.on_start(self.started, None, zip_info)
+            self.started += 1
+            future = self.pool.submit(zip_info, zip_info.pop('deflate_heavy', None))
+            await asyncio.wait([asyncio.wrap_future(future)])
+            ok = self.pool.result(zip_info, future)
+        return zip_info, ok
+
+    async def _record(self, item):
+        zip_info, ok = item
+        await self._blocking(self.engine.report_result, zip_info, ok)
+        self.reservations.pop(zip_info['zip_path'], None)
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+        if self.on_done:
+            self.on_done(zip_info, ok, self.processed, self.failed)
+        return None
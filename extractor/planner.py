@@ -0,0 +1,256 @@
+"""
+Music Library Extractor - pre-flight extraction plan
+
+Before extracting, plan_extraction() reads the central directory of every
+archive (in parallel, nothing is decompressed) and works out what the run
+would do:
+
+    - the bytes each archive writes and the action taken (extract, replace
+      or sync an existing album, skip one already in the library)
+    - destination conflicts: albums already in the library and archives
+      in the batch that share a destination
+    - archives that would fail the single album folder check
+    - the bytes needed on each filesystem, against shutil.disk_usage
+    - an estimated duration, from the throughput of earlier runs
+
+Tar archives have no central directory; their file size stands in for
+their contents and their layout is only checked while extracting. Inner
+zips of box sets are counted at the size of their expanded members, which
+means inflating the inner zips that are compressed.
+"""
+
+import os
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from . import tarstream
+from .nested import is_nested_archive, nested_size
+from .report import format_size
+from .progress import format_rate, format_eta
+
+# Assumed extraction throughput until a run has been measured
+DEFAULT_THROUGHPUT = 50 * 1024 * 1024
+
+# What a run does with each archive
+ACTION_EXTRACT = 'extract'
+ACTION_REPLACE = 'replace'
+ACTION_SYNC = 'sync'
+ACTION_SKIP = 'skip'
+
+
+def album_root(file_list, nested_archives=True):
+    """Return (album folder, top-level folders) of an archive listing
+
+    The album folder is None when the archive does not hold exactly one
+    top-level folder, or '' for an archive of per-disc zips with no
+    folders (see nested).
+    """
+    folders = set()
+    top_level_archives = 0
+    for file_path in file_list:
+        parts = file_path.split('/')
+        if len(parts) > 1 and parts[0]:
+            folders.add(parts[0])
+        elif is_nested_archive(file_path):
+            top_level_archives += 1
+
+    if len(folders) == 1:
+        return next(iter(folders)), folders
+    if not folders and top_level_archives and nested_archives:
+        return '', folders
+    return None, folders
+
+
+def read_archive(zip_path, nested_archives=True):
+    """Return (album bytes, estimated, problem) from an archive's central directory"""
+    if tarstream.is_tar_archive(zip_path):
+        return os.path.getsize(zip_path), True, None
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        infos = zip_ref.infolist()
+        root, folders = album_root([info.filename for info in infos], nested_archives)
+        if root is None:
+            found = ', '.join(sorted(folders)) or 'none'
+            return 0, False, f"no single album folder (top-level folders: {found})"
+        prefix = f"{root}/" if root else ''
+        total = 0
+        for info in infos:
+            if not info.filename.startswith(prefix):
+                continue
+            if nested_archives and is_nested_archive(info.filename[len(prefix):]):
+                # Written as the inner archive's members, not as the zip
+                total += nested_size(zip_ref, info)
+            else:
+                total += info.file_size
+    return total, False, None
+
+
+def existing_ancestor(path):
+    """Return path or its nearest parent that exists"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+class ExtractionPlan:
+    """What an extraction run would do, and whether it fits"""
+
+    def __init__(self, archives, filesystems, throughput, measured):
+        self.archives = archives
+        self.filesystems = filesystems
+        self.throughput = throughput
+        self.throughput_measured = measured
+
+    @property
+    def total_bytes(self):
+        return sum(entry['bytes'] for entry in self.archives
+                   if entry['action'] != ACTION_SKIP and not entry['problem'])
+
+    @property
+    def estimated_seconds(self):
+        return self.total_bytes / self.throughput if self.throughput else None
+
+    @property
+    def conflicts(self):
+        return [entry for entry in self.archives if entry['conflict']]
+
+    @property
+    def root_failures(self):
+        return [entry for entry in self.archives if entry['problem']]
+
+    @property
+    def short_filesystems(self):
+        return [fs for fs in self.filesystems if not fs['fits']]
+
+    @property
+    def fits(self):
+        """True if every filesystem has room for what is written to it"""
+        return not self.short_filesystems
+
+    def to_dict(self):
+        """Return the plan as a JSON-serializable dictionary"""
+        return {
+            'archives': self.archives,
+            'filesystems': self.filesystems,
+            'total_bytes': self.total_bytes,
+            'estimated_seconds': round(self.estimated_seconds or 0.0, 1),
+            'throughput': round(self.throughput),
+            'throughput_measured': self.throughput_measured,
+            'conflicts': len(self.conflicts),
+            'root_failures': len(self.root_failures),
+            'fits': self.fits
+        }
+
+    def summary_lines(self):
+        """Return the plan as short human-readable lines"""
+        counts = {}
+        for entry in self.archives:
+            action = 'fail' if entry['problem'] else entry['action']
+            counts[action] = counts.get(action, 0) + 1
+        lines = [f"{len(self.archives)} archives: " +
+                 ", ".join(f"{n} {action}" for action, n in counts.items()),
+                 f"{format_size(self.total_bytes)} to write, about "
+                 f"{format_eta(self.estimated_seconds)} at {format_rate(self.throughput)}"
+                 + ("" if self.throughput_measured else " (assumed)")]
+        for fs in self.filesystems:
+            lines.append(f"{fs['path']}: needs {format_size(fs['required'])}, "
+                         f"{format_size(fs['free'])} free" + ("" if fs['fits'] else " - NOT ENOUGH SPACE"))
+        for entry in self.conflicts:
+            lines.append(f"Conflict: {entry['filename']}: {entry['conflict']}")
+        for entry in self.root_failures:
+            lines.append(f"Will fail: {entry['filename']}: {entry['problem']}")
+        return lines
+
+
+def plan_extraction(engine, music_zips, workers=None):
+    """Read every archive's central directory and return an ExtractionPlan"""
+    if any('in_library' not in zip_info for zip_info in music_zips):
+        engine.mark_processed(music_zips)
+
+    def read(zip_info):
+        try:
+            return read_archive(zip_info['zip_path'], engine.nested_archives)
+        except Exception as e:
+            return 0, False, f"unreadable: {e}"
+
+    with ThreadPoolExecutor(max_workers=workers or engine.scan_workers) as executor:
+        results = list(executor.map(read, music_zips))
+
+    archives = []
+    destinations = {}
+    for zip_info, (album_bytes, estimated, problem) in zip(music_zips, results):
+        destination = engine.album_destination(zip_info)
+        action = ACTION_EXTRACT
+        conflict = None
+        if engine.skip_processed and zip_info.get('in_library'):
+            action = ACTION_SKIP
+        else:
+            earlier = destinations.get(os.path.normcase(destination))
+            if earlier:
+                conflict = f"same destination as {earlier}, extracted after it"
+            elif os.path.isdir(destination):
+                conflict = "album already in the library"
+            if os.path.isdir(destination) or earlier:
+                syncable = engine.existing_album == 'sync' and \
+                    not tarstream.is_tar_archive(zip_info['zip_path'])
+                action = ACTION_SYNC if syncable else ACTION_REPLACE
+            if not problem:
+                destinations.setdefault(os.path.normcase(destination), zip_info['filename'])
+        archives.append({
+            'filename': zip_info['filename'],
+            'artist': zip_info['artist'],
+            'album': zip_info['album'],
+            'destination': destination,
+            'bytes': album_bytes,
+            'estimated': estimated,
+            'action': action,
+            'conflict': conflict,
+            'problem': problem
+        })
+
+    throughput = engine.ledger.throughput()
+    return ExtractionPlan(archives, _filesystem_needs(engine, music_zips, archives),
+                          throughput or DEFAULT_THROUGHPUT, throughput is not None)
+
+
+def _filesystem_needs(engine, music_zips, archives):
+    """Return the bytes needed and free on each filesystem written to"""
+    needs = {}
+
+    def need(path, nbytes):
+        path = existing_ancestor(path)
+        try:
+            device = os.stat(path).st_dev
+        except OSError:
+            device = path
+        entry = needs.setdefault(device, {'path': path, 'required': 0})
+        entry['required'] += nbytes
+
+    temp_sizes = []
+    for zip_info, entry in zip(music_zips, archives):
+        if entry['action'] == ACTION_SKIP or entry['problem']:
+            continue
+        # A replaced album is only removed once its new copy is in place
+        need(entry['destination'], entry['bytes'])
+        if not engine.streaming and engine.existing_album != 'sync' and \
+                not tarstream.is_tar_archive(zip_info['zip_path']):
+            temp_sizes.append(entry['bytes'])
+
+    if temp_sizes:
+        # Without streaming each archive is unpacked in the downloads folder
+        # first; at most jobs of those exist at a time
+        need(engine.downloads_folder, sum(sorted(temp_sizes, reverse=True)[:engine.jobs]))
+
+    filesystems = []
+    for entry in needs.values():
+        try:
+            usage = shutil.disk_usage(entry['path'])
+            free, total = usage.free, usage.total
+        except OSError:
+            free, total = 0, 0
+        filesystems.append(dict(entry, free=free, total=total, fits=entry['required'] <= free))
+    return filesystems
@@ -0,0 +1,120 @@
+"""
+Music Library Extractor - byte-based extraction progress
+
+Progress is measured in uncompressed bytes, with each archive's total taken
+from the ZipInfo.file_size values in its central directory, so a large box
+set moves the bar further than a short EP. The engine advances it as each
+member is written; throughput is averaged over the last few seconds so it
+reflects the current disk speed rather than the whole run.
+"""
+
+import time
+import threading
+import collections
+
+from .report import format_size
+
+# Seconds of history the rolling throughput is computed over
+RATE_WINDOW = 10.0
+
+# Minimum spacing of throughput samples, in seconds
+SAMPLE_INTERVAL = 0.25
+
+
+def format_rate(rate):
+    """Return a bytes-per-second figure as MB/s"""
+    return f"{rate / (1024 * 1024):.1f} MB/s"
+
+
+def format_eta(seconds):
+    """Return a duration in seconds as H:MM:SS or M:SS"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds + 0.5)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class ByteProgress:
+    """Thread-safe byte counter over a set of archives"""
+
+    def __init__(self, archive_totals):
+        """archive_totals maps zip path to its uncompressed size in bytes"""
+        self.lock = threading.Lock()
+        self.archive_totals = dict(archive_totals)
+        self.archive_done = dict.fromkeys(self.archive_totals, 0)
+        self.total = sum(self.archive_totals.values())
+        self.done = 0
+        self.started = time.monotonic()
+        self.samples = collections.deque([(self.started, 0)])
+
+    def advance(self, zip_path, nbytes):
+        """Count nbytes of zip_path as extracted"""
+        with self.lock:
+            self._advance(zip_path, nbytes)
+
+    def finish(self, zip_path):
+        """Count whatever is left of an archive once it has been handled
+
+        Covers members outside the album folder, archives extracted without
+        per-member updates (worker processes, the temp folder path) and
+        archives that failed part way.
+        """
+        with self.lock:
+            self._advance(zip_path, self._remaining(zip_path))
+
+    def add(self, zip_path, total):
+        """Add an archive found after the run started"""
+        with self.lock:
+            self.total += total - self.archive_totals.get(zip_path, 0)
+            self.archive_totals[zip_path] = total
+            self.archive_done.setdefault(zip_path, 0)
+
+    def drop(self, zip_path):
+        """Take an archive that will not be extracted out of the total"""
+        with self.lock:
+            total = self.archive_totals.pop(zip_path, 0)
+            self.total -= total - self.archive_done.pop(zip_path, 0)
+
+    def remaining(self, zip_path):
+        """Bytes of zip_path not extracted yet"""
+        with self.lock:
+            return self._remaining(zip_path)
+
+    def _remaining(self, zip_path):
+        return self.archive_totals.get(zip_path, 0) - self.archive_done.get(zip_path, 0)
+
+    def _advance(self, zip_path, nbytes):
+        # Never run past the archive's total
+        nbytes = max(0, min(nbytes, self._remaining(zip_path)))
+        self.archive_done[zip_path] = self.archive_done.get(zip_path, 0) + nbytes
+        self.done += nbytes
+        self._sample(time.monotonic())
+
+    def _sample(self, now):
+        if now - self.samples[-1][0] >= SAMPLE_INTERVAL:
+            self.samples.append((now, self.done))
+            while len(self.samples) > 2 and now - self.samples[0][0] > RATE_WINDOW:
+                self.samples.popleft()
+
+    def snapshot(self):
+        """Return (done, total, bytes per second, seconds remaining or None)"""
+        with self.lock:
+            now = time.monotonic()
+            self._sample(now)
+            then, done_then = self.samples[0]
+            done, total = self.done, self.total
+        elapsed = now - then
+        rate = (done - done_then) / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else None
+        return done, total, rate, eta
+
+    def describe(self):
+        """Return a one-line summary such as '1.2 GB of 6.0 GB (20%), 110.3 MB/s, ETA 0:43'"""
+        done, total, rate, eta = self.snapshot()
+        percent = done * 100 // total if total else 100
+        return (f"{format_size(done)} of {format_size(total)} ({percent}%), "
+                f"{format_rate(rate)}, ETA {format_eta(eta)}")
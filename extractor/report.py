@@ -0,0 +1,92 @@
+"""
+Music Library Extractor - extraction report
+
+Collects one row per archive handled by an extraction run (status, bytes
+written to the library, time taken and destination album folder) so the
+GUI can show it in a single list and runs can be exported as JSON or CSV
+for auditing.
+"""
+
+import csv
+import json
+import threading
+
+from .timing import merge_stages
+
+# Columns of a report row, in export order
+REPORT_FIELDS = ('filename', 'artist', 'album', 'status', 'bytes', 'duration', 'destination')
+
+# Row status values
+STATUS_EXTRACTED = 'extracted'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'
+
+
+def format_size(size):
+    """Return a byte count as a short human-readable string"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class ExtractionReport:
+    """Per-archive results of one extraction run"""
+
+    def __init__(self):
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def add(self, zip_info, status, destination):
+        """Add the result for one archive
+
+        Bytes, duration and stage timings come from zip_info, except for
+        skipped archives, which may carry them from an earlier run.
+        """
+        processed = status != STATUS_SKIPPED
+        row = {
+            'filename': zip_info['filename'],
+            'artist': zip_info['artist'],
+            'album': zip_info['album'],
+            'status': status,
+            'bytes': zip_info.get('bytes', 0) if processed else 0,
+            'duration': round(zip_info.get('duration', 0.0), 3) if processed else 0.0,
+            'destination': destination,
+            'stages': dict(zip_info.get('stages', {})) if processed else {}
+        }
+        with self.lock:
+            self.rows.append(row)
+        return row
+
+    def count(self, status):
+        """Return how many archives ended with status"""
+        return sum(1 for row in self.rows if row['status'] == status)
+
+    def stage_summary(self):
+        """Return {stage: {'seconds', 'bytes', 'archives'}} summed over all rows"""
+        total = {}
+        for row in self.rows:
+            merge_stages(total, row['stages'])
+        return total
+
+    def total_bytes(self):
+        """Return the bytes written to the library by the whole run"""
+        return sum(row['bytes'] for row in self.rows if row['status'] == STATUS_EXTRACTED)
+
+    def export(self, path):
+        """Write the report to path, as CSV if it ends in .csv and JSON otherwise"""
+        if path.lower().endswith('.csv'):
+            self.write_csv(path)
+        else:
+            self.write_json(path)
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.rows, f, indent=2, ensure_ascii=False)
+
+    def write_csv(self, path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            # Stage timings are only in the JSON export
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.rows)
@@ -0,0 +1,113 @@
+"""
+Music Library Extractor - persistent scan index
+
+Remembers, per downloads folder, how every zip file name was parsed. An
+entry is reused as long as the file's (size, mtime, inode) are unchanged,
+so a rescan of a large folder only stats each file and parses the names
+that are new or changed.
+"""
+
+import os
+import json
+import logging
+
+SCAN_INDEX_FILE = os.path.join(os.path.expanduser("~"), ".music_extractor_scan_index.json")
+
+# Bump when the on-disk layout changes; older indexes are discarded
+INDEX_VERSION = 1
+
+
+class ScanIndex:
+    """On-disk cache of zip file name parses, keyed by folder"""
+
+    def __init__(self, index_file=SCAN_INDEX_FILE, logger=None):
+        self.index_file = index_file
+        self.logger = logger or logging.getLogger(__name__)
+        self.folders = None
+        self.dirty = False
+
+    def load(self):
+        """Read the index file; a missing or unreadable index starts empty"""
+        self.folders = {}
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r') as f:
+                    data = json.load(f)
+                if data.get('version') == INDEX_VERSION:
+                    self.folders = data.get('folders', {})
+        except Exception as e:
+            self.logger.warning(f"Could not read scan index, rebuilding it: {e}")
+
+    def save(self):
+        """Write the index back if it changed, replacing the file atomically"""
+        if not self.dirty:
+            return
+        tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'folders': self.folders}, f,
+                          separators=(',', ':'))
+            os.replace(tmp_file, self.index_file)
+            self.dirty = False
+        except Exception as e:
+            self.logger.error(f"Could not save scan index: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def entries_for(self, folder, signature):
+        """Return the mutable entry dict for folder
+
+        signature identifies the name parser; when it differs from the one
+        the entries were built with, the cached parses are dropped.
+        """
+        if self.folders is None:
+            self.load()
+        folder = os.path.abspath(folder)
+        cached = self.folders.get(folder)
+        if cached is None or cached.get('signature') != signature:
+            cached = {'signature': signature, 'entries': {}}
+            self.folders[folder] = cached
+            self.dirty = True
+        return cached['entries']
+
+    def scan(self, folder, signature, parse, suffixes=('.zip',), listing=None):
+        """Scan folder and yield (name, stat_result, parsed, is_new)
+
+        parse(name) returns a JSON-serializable parse result (or None for
+        names that do not match); it is only called for names that are new
+        or whose (size, mtime, inode) changed. Entries for files that are
+        gone are removed from the index. listing, a list of (relative path,
+        stat_result) from a recursive scan, replaces the listing of folder
+        itself; parse is then given the file name without its folders.
+        """
+        entries = self.entries_for(folder, signature)
+        seen = set()
+        for name, st in (listing if listing is not None else self._list(folder, suffixes)):
+            seen.add(name)
+
+            key = [st.st_size, st.st_mtime_ns, st.st_ino]
+            cached = entries.get(name)
+            if cached is not None and cached[0] == key:
+                yield name, st, cached[1], False
+                continue
+
+            parsed = parse(os.path.basename(name))
+            entries[name] = [key, parsed]
+            self.dirty = True
+            yield name, st, parsed, True
+
+        for name in list(entries):
+            if name not in seen:
+                del entries[name]
+                self.dirty = True
+
+    def _list(self, folder, suffixes):
+        """Yield (name, stat_result) for the matching files directly in folder"""
+        with os.scandir(folder) as it:
+            for entry in it:
+                if not entry.name.lower().endswith(suffixes):
+                    continue
+                try:
+                    yield entry.name, entry.stat()
+                except OSError:
+                    continue
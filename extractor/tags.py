@@ -0,0 +1,467 @@
+"""
+Music Library Extractor - artist and album from audio tags
+
+File names that match no format are dropped, and names the format splits
+wrongly (hyphenated artists, albums with ' - ' in them) end up in the
+wrong folders. probe_archive() reads the artist and album from the tags of
+the first audio tracks in a zip instead, without extracting anything:
+
+    ID3v2    MP3 (and other files starting with an ID3 tag)
+    FLAC     Vorbis comments in the metadata blocks before the audio
+    MP4      iTunes-style atoms in moov/udta/meta/ilst (M4A, ALAC)
+
+Only the tag headers are read: at most PROBE_LIMIT bytes of a member, of
+which large frames such as cover art are skipped. Stored members are read
+through a window onto the zip file, so skipping costs a seek; compressed
+ones are read through the zip stream. The album artist is preferred over
+the track artist, so compilations stay in one folder.
+
+Results are cached by archive fingerprint (see ledger) in TAG_CACHE_FILE,
+per downloads folder, so a repeat scan probes nothing; entries of archives
+a complete scan no longer looks up are dropped. Tar archives are not
+probed: their members can only be reached by decompressing the stream up
+to them.
+"""
+
+import io
+import os
+import json
+import struct
+import zipfile
+import logging
+import threading
+
+from .nested import MemberWindow, member_data_offset
+
+TAG_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".music_extractor_tag_cache.json")
+
+# Bump when the on-disk layout or what is read from tags changes
+TAG_CACHE_VERSION = 2
+
+# How tags are used: not at all, for names no format matches, or first
+TAG_PROBE_MODES = ('off', 'fallback', 'prefer')
+
+# Format name reported for archives named from their tags
+TAG_FORMAT = 'tags'
+
+# Archives that are probed
+PROBE_SUFFIXES = ('.zip',)
+
+AUDIO_SUFFIXES = ('.mp3', '.flac', '.m4a', '.mp4', '.alac', '.aac')
+
+# Audio members tried per archive
+PROBE_MEMBERS = 2
+
+# Bytes of a member that may be read or skipped while looking for tags
+PROBE_LIMIT = 1024 * 1024
+
+# Largest single tag field read into memory
+MAX_FIELD_SIZE = 64 * 1024
+
+# Characters that cannot appear in a folder name
+_UNSAFE = str.maketrans({c: '_' for c in '/\\\0' + ''.join(map(chr, range(1, 32)))})
+
+
+class _Reader:
+    """Read from the start of a member, within a byte budget"""
+
+    def __init__(self, fileobj, limit=PROBE_LIMIT):
+        self.fileobj = fileobj
+        self.limit = limit
+        self.pos = 0
+        # Bytes handed back with unread()
+        self.buffer = b''
+
+    def read(self, n):
+        n = min(n, self.limit - self.pos)
+        if n <= 0:
+            return b''
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        if len(data) < n:
+            data += self.fileobj.read(n - len(data))
+        self.pos += len(data)
+        return data
+
+    def exact(self, n):
+        """Read exactly n bytes, or return None"""
+        data = self.read(n)
+        return data if len(data) == n else None
+
+    def unread(self, data):
+        """Put data read last back in front of the stream"""
+        self.buffer = data + self.buffer
+        self.pos -= len(data)
+
+    def skip(self, n):
+        """Skip n bytes; False when that passes the budget"""
+        if n < 0 or self.pos + n > self.limit:
+            return False
+        buffered = min(n, len(self.buffer))
+        self.buffer = self.buffer[buffered:]
+        self.pos += buffered
+        n -= buffered
+        if n and self.fileobj.seekable():
+            self.fileobj.seek(n, os.SEEK_CUR)
+            self.pos += n
+            return True
+        return len(self.read(n)) == n
+
+
+def clean_name(value):
+    """Return a tag value usable as a folder name, or None"""
+    if not value:
+        return None
+    value = value.split('\0')[0].translate(_UNSAFE).strip().rstrip('.').strip()
+    if value in ('', '.', '..'):
+        return None
+    return value
+
+
+def _pick(fields):
+    """Return (artist, album) from {'albumartist', 'artist', 'album'}"""
+    artist = clean_name(fields.get('albumartist')) or clean_name(fields.get('artist'))
+    album = clean_name(fields.get('album'))
+    return (artist, album) if artist and album else None
+
+
+# ID3v2 frames, by version: album artist, artist, album
+_ID3_FRAMES = {
+    2: {b'TP2': 'albumartist', b'TP1': 'artist', b'TAL': 'album'},
+    3: {b'TPE2': 'albumartist', b'TPE1': 'artist', b'TALB': 'album'},
+    4: {b'TPE2': 'albumartist', b'TPE1': 'artist', b'TALB': 'album'},
+}
+
+_ID3_ENCODINGS = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be', 3: 'utf-8'}
+
+
+def _syncsafe(data):
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7f)
+    return value
+
+
+def _resync(data):
+    """Undo ID3 unsynchronisation: drop the 0x00 inserted after every 0xff"""
+    return data.replace(b'\xff\x00', b'\xff')
+
+
+def _id3_text(data):
+    if not data:
+        return None
+    encoding = _ID3_ENCODINGS.get(data[0])
+    if encoding is None:
+        return None
+    text = data[1:].decode(encoding, 'replace')
+    # Several values are separated by NUL; keep the first
+    return text.split('\0')[0]
+
+
+def read_id3(reader, header):
+    """Return the fields of an ID3v2 tag whose 10-byte header was read"""
+    version, flags = header[3], header[5]
+    frames = _ID3_FRAMES.get(version)
+    if frames is None:
+        return {}
+    end = 10 + _syncsafe(header[6:10])
+    unsynchronised = flags & 0x80
+    if unsynchronised and version < 4:
+        # Before 2.4, frame sizes count the resynchronised bytes, so undo it
+        # on the whole tag up front; a tag larger than the budget is given up
+        body = reader.exact(end - 10)
+        if body is None:
+            return {}
+        body = _resync(body)
+        reader = _Reader(io.BytesIO(body), limit=10 + len(body))
+        reader.pos = 10
+        end = reader.limit
+    if flags & 0x40:
+        # Extended header
+        size_bytes = reader.exact(4)
+        if size_bytes is None:
+            return {}
+        size = _syncsafe(size_bytes) if version == 4 else struct.unpack('>I', size_bytes)[0]
+        if not reader.skip(size - 4 if version == 4 else size):
+            return {}
+
+    id_size, header_size = (3, 6) if version == 2 else (4, 10)
+    fields = {}
+    while reader.pos + header_size <= end and len(fields) < 3:
+        frame_header = reader.exact(header_size)
+        if frame_header is None or frame_header[0] == 0:
+            break  # padding
+        frame_id = frame_header[:id_size]
+        if version == 2:
+            size = int.from_bytes(frame_header[3:6], 'big')
+            frame_flags = 0
+        else:
+            size_bytes = frame_header[4:8]
+            size = _syncsafe(size_bytes) if version == 4 else struct.unpack('>I', size_bytes)[0]
+            frame_flags = frame_header[9]
+        # Compressed or encrypted frames are skipped
+        wanted = frames.get(frame_id) if not frame_flags & (0x0c if version == 4 else 0xc0) else None
+        if wanted and size <= MAX_FIELD_SIZE:
+            data = reader.exact(size)
+            if data is None:
+                break
+            if version == 4:
+                # Grouping byte and data length indicator before the text
+                data = data[(1 if frame_flags & 0x40 else 0) + (4 if frame_flags & 0x01 else 0):]
+                # 2.4 unsynchronises frame by frame, and counts the size as stored
+                if frame_flags & 0x02 or unsynchronised:
+                    data = _resync(data)
+            elif version == 3 and frame_flags & 0x20:
+                data = data[1:]
+            text = _id3_text(data)
+            if text:
+                fields.setdefault(wanted, text)
+        elif not reader.skip(size):
+            break
+    return fields
+
+
+_VORBIS_FIELDS = {'ALBUMARTIST': 'albumartist', 'ALBUM ARTIST': 'albumartist',
+                  'ARTIST': 'artist', 'ALBUM': 'album'}
+
+
+def read_flac(reader):
+    """Return the Vorbis comment fields of a FLAC stream after 'fLaC'"""
+    while True:
+        block_header = reader.exact(4)
+        if block_header is None:
+            return {}
+        last, block_type = block_header[0] & 0x80, block_header[0] & 0x7f
+        size = int.from_bytes(block_header[1:4], 'big')
+        if block_type == 4:
+            if size > MAX_FIELD_SIZE:
+                return {}
+            data = reader.exact(size)
+            return _vorbis_comments(data) if data is not None else {}
+        if last or not reader.skip(size):
+            return {}
+
+
+def _vorbis_comments(data):
+    fields = {}
+    try:
+        vendor_length = struct.unpack_from('<I', data, 0)[0]
+        pos = 4 + vendor_length
+        count = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        for _ in range(count):
+            length = struct.unpack_from('<I', data, pos)[0]
+            comment = data[pos + 4:pos + 4 + length].decode('utf-8', 'replace')
+            pos += 4 + length
+            key, _, value = comment.partition('=')
+            wanted = _VORBIS_FIELDS.get(key.upper())
+            if wanted and value:
+                fields.setdefault(wanted, value)
+    except struct.error:
+        pass
+    return fields
+
+
+# MP4 atoms on the way to the iTunes metadata list, and the items in it
+_MP4_PATH = (b'moov', b'udta', b'meta', b'ilst')
+_MP4_ITEMS = {b'aART': 'albumartist', b'\xa9ART': 'artist', b'\xa9alb': 'album'}
+
+
+def _atom_header(reader):
+    """Return (type, payload size) of the next atom, or None"""
+    header = reader.exact(8)
+    if header is None:
+        return None
+    size, atom_type = struct.unpack('>I4s', header)
+    if size == 1:
+        large = reader.exact(8)
+        if large is None:
+            return None
+        return atom_type, struct.unpack('>Q', large)[0] - 16
+    if size < 8:
+        # 0 means "to the end of the file": nothing follows it
+        return None
+    return atom_type, size - 8
+
+
+def _find_atom(reader, end, wanted):
+    """Skip sibling atoms up to end until one of type wanted; return its payload size"""
+    while end is None or reader.pos < end:
+        atom = _atom_header(reader)
+        if atom is None:
+            return None
+        atom_type, size = atom
+        if atom_type == wanted:
+            return size
+        if not reader.skip(size):
+            return None
+    return None
+
+
+def read_mp4(reader):
+    """Return the iTunes metadata fields of an MP4 file
+
+    Atoms off the path to the metadata (ftyp, mdat, ...) are skipped, as
+    long as the metadata starts within the probe budget.
+    """
+    end = None
+    for atom_type in _MP4_PATH:
+        size = _find_atom(reader, end, atom_type)
+        if size is None:
+            return {}
+        end = reader.pos + size
+        if atom_type == b'meta' and reader.exact(4) is None:
+            # Full box: version and flags before the children
+            return {}
+
+    fields = {}
+    while reader.pos < end:
+        item = _atom_header(reader)
+        if item is None:
+            break
+        item_type, item_size = item
+        wanted = _MP4_ITEMS.get(item_type)
+        if not wanted or item_size > MAX_FIELD_SIZE:
+            if not reader.skip(item_size):
+                break
+            continue
+        data = reader.exact(item_size)
+        if data is None:
+            break
+        # A 'data' atom: size, type, type indicator, locale, then the text
+        if len(data) >= 16 and data[4:8] == b'data':
+            data_end = min(len(data), struct.unpack_from('>I', data)[0])
+            fields.setdefault(wanted, data[16:data_end].decode('utf-8', 'replace'))
+    return fields
+
+
+def read_tags(fileobj):
+    """Return the artist/album fields of an audio file's tags, or {}"""
+    reader = _Reader(fileobj)
+    head = reader.exact(10)
+    if head is None:
+        return {}
+    fields = {}
+    if head[:3] == b'ID3':
+        fields = read_id3(reader, head)
+        # FLAC files sometimes carry an ID3 tag in front
+        if _pick(fields) or not reader.skip(10 + _syncsafe(head[6:10]) - reader.pos):
+            return fields
+        head = reader.exact(10)
+        if head is None:
+            return fields
+    reader.unread(head)
+    if head[:4] == b'fLaC':
+        reader.skip(4)
+        return read_flac(reader) or fields
+    if head[4:8] == b'ftyp':
+        return read_mp4(reader) or fields
+    return fields
+
+
+def audio_members(zip_ref):
+    """Return the audio members of an archive, in track order"""
+    infos = [info for info in zip_ref.infolist()
+             if not info.is_dir() and info.filename.lower().endswith(AUDIO_SUFFIXES)
+             and not os.path.basename(info.filename).startswith('._')]
+    return sorted(infos, key=lambda info: info.filename)
+
+
+def _open_member(zip_ref, info):
+    if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+        # Seekable window, so skipped frames are not read at all
+        return MemberWindow(zip_ref.filename,
+                            member_data_offset(zip_ref.filename, info), info.file_size)
+    return zip_ref.open(info)
+
+
+def probe_archive(zip_path, members=PROBE_MEMBERS):
+    """Return (artist, album) from the tags of the first audio tracks, or None"""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in audio_members(zip_ref)[:members]:
+            with _open_member(zip_ref, info) as fileobj:
+                found = _pick(read_tags(fileobj))
+            if found:
+                return found
+    return None
+
+
+class TagCache:
+    """On-disk cache of probe results, keyed by folder and archive fingerprint"""
+
+    def __init__(self, cache_file=TAG_CACHE_FILE, logger=None):
+        self.cache_file = cache_file
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.folders = None
+        # folder -> fingerprints looked up since the folder was last pruned
+        self.used = {}
+        self.dirty = False
+
+    def load(self):
+        """Read the cache file; a missing or unreadable cache starts empty"""
+        self.folders = {}
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r') as f:
+                    data = json.load(f)
+                if data.get('version') == TAG_CACHE_VERSION:
+                    self.folders = data.get('folders', {})
+        except Exception as e:
+            self.logger.warning(f"Could not read tag cache: {e}")
+
+    def _entries(self, folder, fingerprint):
+        if self.folders is None:
+            self.load()
+        folder = os.path.abspath(folder)
+        self.used.setdefault(folder, set()).add(fingerprint)
+        return self.folders.setdefault(folder, {})
+
+    def lookup(self, folder, fingerprint):
+        """Return (True, cached result) or (False, None) when not cached"""
+        with self.lock:
+            entries = self._entries(folder, fingerprint)
+            if fingerprint in entries:
+                cached = entries[fingerprint]
+                return True, tuple(cached) if cached else None
+        return False, None
+
+    def store(self, folder, fingerprint, result):
+        with self.lock:
+            self._entries(folder, fingerprint)[fingerprint] = list(result) if result else None
+            self.dirty = True
+
+    def prune(self, folder):
+        """Drop the entries of folder not looked up since it was last pruned
+
+        Called after a complete scan of folder, so entries of archives that
+        are gone do not pile up.
+        """
+        with self.lock:
+            if self.folders is None:
+                self.load()
+            folder = os.path.abspath(folder)
+            used = self.used.pop(folder, set())
+            entries = self.folders.get(folder, {})
+            for fingerprint in [fp for fp in entries if fp not in used]:
+                del entries[fingerprint]
+                self.dirty = True
+            if not entries and folder in self.folders:
+                del self.folders[folder]
+                self.dirty = True
+
+    def save(self):
+        """Write the cache back if it changed, replacing the file atomically"""
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_file, 'w') as f:
+                    json.dump({'version': TAG_CACHE_VERSION, 'folders': self.folders}, f,
+                              separators=(',', ':'), ensure_ascii=False)
+                os.replace(tmp_file, self.cache_file)
+                self.dirty = False
+            except Exception as e:
+                self.logger.error(f"Could not save tag cache: {e}")
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
@@ -0,0 +1,109 @@
+"""
+Music Library Extractor - single-pass tar archive extraction
+
+Tar archives (.tar, .tar.gz, .tar.bz2, .tar.xz) have no central directory,
+so the album root cannot be looked up before extracting. They are read
+once, front to back, with tarfile's stream mode ('r|*'): each member is
+written into the staging folder as it comes past, with the album folder
+stripped from its path, and the archive is rejected as soon as a second
+top-level folder shows up. The compressed stream is never rewound or
+read twice, and nothing is copied to a temporary file first.
+
+Loose files at the top of the archive are skipped, as they are for zips.
+Links, devices and other special members are skipped with a warning.
+"""
+
+import os
+import shutil
+import tarfile
+
+from .verify import copy_checked
+
+TAR_SUFFIXES = ('.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tbz', '.tar.xz', '.txz', '.tar')
+
+# Buffer size used when copying member data out of the stream
+COPY_BUFSIZE = 1024 * 1024
+
+
+class UnexpectedStructure(Exception):
+    """The archive does not hold exactly one top-level album folder"""
+
+
+def is_tar_archive(path):
+    """Return True if path has a tar-family suffix"""
+    return path.lower().endswith(TAR_SUFFIXES)
+
+
+def is_compressed_tar(path):
+    """Return True for tar archives that need decompressing"""
+    return is_tar_archive(path) and not path.lower().endswith('.tar')
+
+
+def split_member_name(name):
+    """Return (top-level folder, rest of the path) of a tar member name
+
+    Leading './' and empty components are dropped. Returns (None, '') for
+    a name with nothing left.
+    """
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts:
+        return None, ''
+    return parts[0], '/'.join(parts[1:])
+
+
+def stream_album(tar_path, staging_dir, member_target, advance=None, logger=None,
+                 member_check=None, hashes=None):
+    """Extract the album folder of a tar archive into staging_dir in one pass
+
+    member_target(base_dir, name) maps a member path to a safe target path
+    (or None to skip it). advance(nbytes) is called with the compressed
+    bytes read so far, as the uncompressed size is not known up front.
+    member_check(name, size), if given, returns a verify.MemberCheck each
+    written file is checked with; their records are appended to hashes.
+    Returns (album folder name, bytes written). Raises UnexpectedStructure
+    when the archive has no album folder or more than one.
+    """
+    root = None
+    bytes_written = 0
+    with open(tar_path, 'rb') as raw, tarfile.open(fileobj=raw, mode='r|*') as tar_ref:
+        position = 0
+        for member in tar_ref:
+            folder, rest = split_member_name(member.name)
+            if folder is not None and (rest or member.isdir()):
+                if root is None:
+                    root = folder
+                    if logger:
+                        logger.info(f"Found album folder in archive: {root}")
+                elif folder != root:
+                    raise UnexpectedStructure(f"Unexpected archive structure in {tar_path}. "
+                                              f"Found folders: {{{root!r}, {folder!r}}}")
+
+                target = member_target(staging_dir, rest) if rest else None
+                if target is None:
+                    pass
+                elif member.isdir():
+                    os.makedirs(target, exist_ok=True)
+                elif member.isfile():
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    check = member_check(rest, member.size) if member_check else None
+                    with tar_ref.extractfile(member) as source, open(target, 'wb') as dest:
+                        if check is None:
+                            shutil.copyfileobj(source, dest, COPY_BUFSIZE)
+                        else:
+                            copy_checked(source, dest, check, COPY_BUFSIZE)
+                    if check is not None:
+                        check.verify()
+                        if hashes is not None:
+                            hashes.append(check.record())
+                    bytes_written += member.size
+                elif logger:
+                    logger.warning(f"Skipping link or special file in {tar_path}: {member.name}")
+
+            if advance is not None:
+                current = raw.tell()
+                advance(current - position)
+                position = current
+
+    if root is None:
+        raise UnexpectedStructure(f"Unexpected archive structure in {tar_path}. Found folders: set()")
+    return root, bytes_written
@@ -0,0 +1,49 @@
+"""
+Music Library Extractor - per-stage timing
+
+Each archive records how long its extraction stages took and how many
+bytes they handled, so a slow batch can be traced to the central
+directory read, the extraction itself, the move into the library, the
+removal of an old album or the deletion of the zip. The numbers are kept
+in a plain dict on zip_info['stages'] so they survive the trip back from
+worker processes and can be written into reports as they are:
+
+    {'extract': {'seconds': 1.25, 'bytes': 734003200}, ...}
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Accumulate seconds and bytes per stage into a stages dict"""
+
+    def __init__(self, stages=None):
+        self.stages = {} if stages is None else stages
+
+    @contextmanager
+    def stage(self, name, nbytes=0):
+        """Time the body of a with block as stage name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, nbytes)
+
+    def add(self, name, seconds=0.0, nbytes=0):
+        entry = self.stages.setdefault(name, {'seconds': 0.0, 'bytes': 0})
+        entry['seconds'] += seconds
+        entry['bytes'] += nbytes
+
+    def add_bytes(self, name, nbytes):
+        self.add(name, 0.0, nbytes)
+
+
+def merge_stages(total, stages):
+    """Add one archive's stages into a run total, counting archives per stage"""
+    for name, entry in stages.items():
+        run = total.setdefault(name, {'seconds': 0.0, 'bytes': 0, 'archives': 0})
+        run['seconds'] += entry['seconds']
+        run['bytes'] += entry['bytes']
+        run['archives'] += 1
+    return total
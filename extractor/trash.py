@@ -0,0 +1,173 @@
+"""
+Music Library Extractor - deferred deletion
+
+Removing a replaced album or a consumed zip can take longer than the
+extraction itself on a slow disk or a network mount. Instead of deleting
+them on the spot, discard() renames them into a trash folder on the same
+filesystem, which is a single atomic metadata operation, and a background
+thread deletes the trash at idle I/O priority.
+
+Each folder the extractor writes to (the library, the downloads folder)
+gets its own TRASH_DIR_NAME folder, so the rename never crosses
+filesystems; a path on another filesystem than its folder is deleted
+right away instead. Whatever is still in a trash folder when the program
+exits is deleted by reclaim() on the next start.
+"""
+
+import os
+import sys
+import uuid
+import queue
+import shutil
+import logging
+import platform
+import threading
+
+TRASH_DIR_NAME = '.music_extractor_trash'
+
+# ioprio_set(2) syscall numbers; the I/O priority is left alone elsewhere
+_IOPRIO_SET = {'x86_64': 251, 'amd64': 251, 'aarch64': 30, 'arm64': 30,
+               'i386': 289, 'i686': 289, 'armv7l': 314}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+
+# SetThreadPriority mode that also lowers a thread's I/O priority
+_THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+
+
+def lower_thread_priority():
+    """Give the calling thread idle I/O priority and the lowest CPU priority"""
+    if sys.platform.startswith('linux'):
+        try:
+            # threading.get_native_id() needs Python 3.8; on Linux, who=0 is
+            # the calling thread too, not the whole process
+            tid = threading.get_native_id() if hasattr(threading, 'get_native_id') else 0
+            os.setpriority(os.PRIO_PROCESS, tid, 19)
+        except (AttributeError, OSError):
+            pass
+        # Set on its own, so a failed nice value still leaves the I/O idle
+        try:
+            import ctypes
+            number = _IOPRIO_SET.get(platform.machine().lower())
+            if number is not None:
+                # who=0 is the calling thread
+                ctypes.CDLL(None, use_errno=True).syscall(
+                    number, _IOPRIO_WHO_PROCESS, 0, _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT)
+        except (AttributeError, OSError):
+            pass
+    elif sys.platform == 'win32':
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), _THREAD_MODE_BACKGROUND_BEGIN)
+        except (AttributeError, OSError):
+            pass
+
+
+def delete_path(path):
+    """Delete a file or a folder tree, ignoring paths that are already gone"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class Trash:
+    """Move doomed paths aside and delete them on a low-priority thread
+
+    With background=False nothing is deleted here: discarded paths are
+    collected for take_pending(), so a worker process can hand them to its
+    parent's trash instead of deleting them on the extraction path.
+    """
+
+    def __init__(self, background=True, logger=None):
+        self.background = background
+        self.logger = logger or logging.getLogger(__name__)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pending = []
+
+    def trash_dir(self, root):
+        return os.path.join(root, TRASH_DIR_NAME)
+
+    def discard(self, path, root):
+        """Move path out of the way and delete it later
+
+        root is the folder path belongs under (the library or the
+        downloads folder); its trash folder must be on the same filesystem.
+        Falls back to deleting path right away when it cannot be moved.
+        """
+        trash_dir = self.trash_dir(root)
+        try:
+            os.makedirs(trash_dir, exist_ok=True)
+            trashed = os.path.join(trash_dir, f"{os.getpid()}_{uuid.uuid4().hex[:8]}_"
+                                              f"{os.path.basename(path)}")
+            os.rename(path, trashed)
+        except OSError as e:
+            self.logger.debug(f"Deleting {path} right away: {e}")
+            delete_path(path)
+            return
+        self.delete_later([trashed])
+
+    def delete_later(self, paths):
+        """Queue trashed paths for background deletion"""
+        if not self.background:
+            with self.lock:
+                self.pending.extend(paths)
+            return
+        for path in paths:
+            self.queue.put(path)
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='trash', daemon=True)
+                self.thread.start()
+
+    def take_pending(self):
+        """Return and forget the paths collected with background=False"""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        return pending
+
+    def reclaim(self, roots):
+        """Queue whatever earlier runs left in the trash folders of roots"""
+        leftovers = []
+        for root in roots:
+            trash_dir = self.trash_dir(root)
+            try:
+                names = os.listdir(trash_dir)
+            except OSError:
+                continue
+            leftovers.extend(os.path.join(trash_dir, name) for name in names)
+        if leftovers:
+            self.logger.info(f"Deleting {len(leftovers)} leftover items from earlier runs "
+                             f"in the background")
+            self.delete_later(leftovers)
+        return len(leftovers)
+
+    def wait(self):
+        """Block until everything queued so far has been deleted"""
+        self.queue.join()
+
+    def _run(self):
+        lower_thread_priority()
+        while True:
+            try:
+                path = self.queue.get(timeout=5)
+            except queue.Empty:
+                with self.lock:
+                    # Exit when idle; delete_later starts a new thread
+                    if self.queue.empty():
+                        self.thread = None
+                        return
+                continue
+            try:
+                delete_path(path)
+            except Exception as e:
+                self.logger.error(f"Could not delete {path}: {e}")
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,116 @@
+"""
+Music Library Extractor - parallel recursive folder scan
+
+Download clients often file completed downloads into per-source
+subfolders several levels deep. walk_archives() finds the archives in such
+a tree with a pool of threads, each listing one folder with os.scandir and
+handing the subfolders it finds back to the pool, so on a network mount
+the round trips for many folders overlap instead of running one by one.
+
+Paths are matched against include and exclude globs relative to the
+scanned folder, using '/' as the separator on every platform:
+
+    exclude 'incomplete'      skips every folder or file named incomplete
+    exclude 'private/*'       skips everything below the private folder
+    include 'flac/**'         only picks up archives below the flac folder
+
+A glob without a '/' is matched against the name alone. Excluded folders
+are not descended into. Symlinked folders are not followed.
+"""
+
+import os
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Threads listing folders at once
+DEFAULT_SCAN_WORKERS = 8
+
+# Folders the extractor itself creates in the downloads folder
+WORK_DIR_PREFIXES = ('temp_extract_', '.staging_', '.replaced_', '.music_extractor_trash',
+                     '.music_extractor_claims')
+
+
+def glob_matches(rel_path, patterns):
+    """Return True if rel_path (with '/' separators) matches any of patterns"""
+    name = rel_path.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        pattern = pattern.replace('\\', '/').strip('/')
+        if '/' in pattern:
+            # fnmatch's '*' already crosses '/', so 'a/**' works as 'a/*'
+            if fnmatch.fnmatch(rel_path, pattern.replace('**', '*')):
+                return True
+        elif fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def walk_archives(root, suffixes, max_depth=None, include=(), exclude=(),
+                  workers=DEFAULT_SCAN_WORKERS, skip_dirs=(), on_error=None):
+    """Return [(rel_path, stat_result)] for the archives below root
+
+    rel_path uses the platform's separator and is sorted. max_depth is the
+    number of subfolder levels to descend (0 lists root only, None has no
+    limit). Archives must match an include glob when any are given and no
+    exclude glob. skip_dirs are absolute folder paths that are never
+    entered. on_error(path, exc) is called for folders that cannot be
+    listed; they are skipped.
+    """
+    root = os.path.abspath(root)
+    skip_dirs = {os.path.normcase(os.path.abspath(path)) for path in skip_dirs}
+    found = []
+
+    def list_folder(path, rel, depth):
+        """List one folder; return (archives, [(path, rel) of subfolders])"""
+        archives = []
+        subfolders = []
+        with os.scandir(path) as it:
+            for entry in it:
+                entry_rel = f"{rel}/{entry.name}" if rel else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if (max_depth is not None and depth >= max_depth) or \
+                            entry.name.startswith(WORK_DIR_PREFIXES) or \
+                            os.path.normcase(entry.path) in skip_dirs or \
+                            glob_matches(entry_rel, exclude):
+                        continue
+                    subfolders.append((entry.path, entry_rel))
+                    continue
+                if not entry.name.lower().endswith(suffixes):
+                    continue
+                if (include and not glob_matches(entry_rel, include)) or \
+                        glob_matches(entry_rel, exclude):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                archives.append((entry_rel, st))
+        return archives, subfolders
+
+    with ThreadPoolExecutor(max_workers=max(1, workers),
+                            thread_name_prefix='scan') as executor:
+        running = {executor.submit(list_folder, root, '', 0): (root, 0)}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, depth = running.pop(future)
+                try:
+                    archives, subfolders = future.result()
+                except OSError as e:
+                    if path == root:
+                        raise
+                    if on_error:
+                        on_error(path, e)
+                    continue
+                found.extend(archives)
+                for sub_path, sub_rel in subfolders:
+                    sub = executor.submit(list_folder, sub_path, sub_rel, depth + 1)
+                    running[sub] = (sub_path, depth + 1)
+
+    found.sort(key=lambda item: item[0])
+    if os.sep != '/':
+        found = [(rel.replace('/', os.sep), st) for rel, st in found]
+    return found
@@ -0,0 +1,327 @@
+"""
+Music Library Extractor - watch mode
+
+Watches the downloads folder and extracts music zips as soon as they have
+finished downloading. On Linux the folder is watched with inotify (through
+ctypes, so no extra dependency); elsewhere, or with use_inotify=False for
+network mounts where inotify does not see remote writes, the folder is
+polled with os.scandir.
+
+A file is only handed to the extractor once its size and modification time
+have stayed the same for settle_seconds. At most engine.jobs archives are
+extracted at once; when all workers are busy the watcher stops picking up
+new files until one finishes, leaving further events queued in the kernel.
+Archives bound for an album that is already being extracted wait until
+that extraction is done.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+
+from .engine import WorkerPool
+from .matching import ARCHIVE_SUFFIXES
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+_EVENT_HEADER = struct.Struct('iIII')
+
+DEFAULT_SETTLE_SECONDS = 5.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+# The ledger is written back after this many results or seconds, whichever
+# comes first, rather than after every archive
+LEDGER_SAVE_EVERY = 20
+LEDGER_SAVE_INTERVAL = 30.0
+
+
+class _Inotify:
+    """Minimal ctypes wrapper around a single inotify watch"""
+
+    def __init__(self, folder):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {folder}")
+
+    def read(self, timeout):
+        """Wait up to timeout seconds and return (names, overflowed, gone)"""
+        names = []
+        overflowed = False
+        gone = False
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return names, overflowed, gone
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return names, overflowed, gone
+            raise
+
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                gone = True
+            if name:
+                names.append(os.fsdecode(name))
+        return names, overflowed, gone
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Report files in a folder once they have stopped changing"""
+
+    def __init__(self, folder, suffixes=ARCHIVE_SUFFIXES, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True, logger=None):
+        self.folder = folder
+        self.suffixes = suffixes
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith('linux')
+        self.logger = logger or logging.getLogger(__name__)
+        # name -> ((size, mtime_ns), time the signature was first seen)
+        self.pending = {}
+
+    def run(self, on_ready, stop_event):
+        """Call on_ready(name, signature) for settled files until stop_event is set
+
+        on_ready may block; the watcher does not look for new files while it
+        does, which is what applies back-pressure.
+        """
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify(self.folder)
+                self.logger.info(f"Watching {self.folder} with inotify")
+            except OSError as e:
+                self.logger.warning(f"inotify unavailable ({e}), polling {self.folder} instead")
+        if inotify is None:
+            self.logger.info(f"Polling {self.folder} every {self.poll_interval:g}s")
+
+        try:
+            # Files that were already there when the watch started
+            self.rescan()
+            last_rescan = time.monotonic()
+            while not stop_event.is_set():
+                # Wake up often enough to notice files settling
+                timeout = min(self.poll_interval, max(self.settle_seconds / 2, 0.1))
+                if inotify is not None:
+                    names, overflowed, gone = inotify.read(timeout)
+                    if gone:
+                        self.logger.error(f"Watched folder disappeared: {self.folder}")
+                        return
+                    if overflowed:
+                        self.logger.warning("inotify queue overflowed, rescanning folder")
+                        self.rescan()
+                    for name in names:
+                        if name.lower().endswith(self.suffixes):
+                            self.pending.setdefault(name, None)
+                else:
+                    stop_event.wait(timeout)
+                    if time.monotonic() - last_rescan >= self.poll_interval:
+                        self.rescan()
+                        last_rescan = time.monotonic()
+
+                for name, signature in self.settled():
+                    if stop_event.is_set():
+                        break
+                    on_ready(name, signature)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def rescan(self):
+        """Add every matching file in the folder to the pending set"""
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if entry.name.lower().endswith(self.suffixes):
+                        self.pending.setdefault(entry.name, None)
+        except OSError as e:
+            self.logger.error(f"Could not scan {self.folder}: {e}")
+
+    def settled(self):
+        """Return [(name, signature)] for pending files that stopped changing"""
+        now = time.monotonic()
+        ready = []
+        for name, state in list(self.pending.items()):
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                # Renamed away or deleted before it settled
+                del self.pending[name]
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            if state is None or state[0] != signature:
+                self.pending[name] = (signature, now)
+            elif now - state[1] >= self.settle_seconds:
+                del self.pending[name]
+                ready.append((name, signature))
+        return ready
+
+
+class WatchService:
+    """Feed settled zips from the downloads folder to an engine's workers"""
+
+    def __init__(self, engine, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True, on_done=None):
+        self.engine = engine
+        self.logger = engine.logger
+        self.on_done = on_done
+        self.stop_event = threading.Event()
+        self.watcher = FolderWatcher(engine.downloads_folder, settle_seconds=settle_seconds,
+                                     poll_interval=poll_interval, use_inotify=use_inotify,
+                                     logger=engine.logger)
+        self.slots = threading.BoundedSemaphore(engine.jobs)
+        self.lock = threading.Lock()
+        # name -> signature of archives in flight or already handled, so an
+        # unchanged file is not extracted twice
+        self.seen = {}
+        # destination album -> name of the archive being extracted into it
+        self.active = {}
+        self.processed = 0
+        self.failed = 0
+        # Results not yet written back to the ledger
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+
+    def run(self):
+        """Watch and extract until stop() is called"""
+        self.engine.ensure_music_library_exists()
+        pool = WorkerPool(self.engine)
+        try:
+            self.watcher.run(lambda name, sig: self.submit(pool, name, sig), self.stop_event)
+        finally:
+            pool.shutdown()
+            self.save_ledger()
+            if self.engine.journal is not None:
+                self.engine.journal.close()
+            if self.engine.coordinator is not None:
+                self.engine.coordinator.close()
+            self.logger.info(f"Watch stopped. Successfully processed: {self.processed}, "
+                             f"Failed: {self.failed}")
+
+    def stop(self):
+        """Ask run() to return once the running extractions finish"""
+        self.stop_event.set()
+
+    def submit(self, pool, name, signature):
+        """Start extracting a settled file, waiting for a free worker"""
+        with self.lock:
+            if self.seen.get(name) == signature:
+                return
+            self.seen[name] = signature
+
+        zip_info = self.engine.match_archive(name, self.engine.parse_filename(name))
+        if not zip_info:
+            self.logger.info(f"Ignoring {name}: does not match format {self.engine.current_pattern}")
+            return
+        self.engine.save_tag_cache()
+        self.engine.mark_processed([zip_info])
+        if self.engine.skip_processed and zip_info['in_library']:
+            self.logger.info(f"Skipping {name}: already in library, unchanged")
+            return
+
+        # Back-pressure: block the watcher until a worker is free
+        while not self.slots.acquire(timeout=0.5):
+            if self.stop_event.is_set():
+                with self.lock:
+                    self.seen.pop(name, None)
+                return
+        destination = self.engine.album_destination(zip_info)
+        with self.lock:
+            busy_with = self.active.get(destination)
+            if busy_with is None:
+                self.active[destination] = name
+        if busy_with is not None:
+            # Two jobs must never commit the same album at once
+            self.slots.release()
+            self.logger.info(f"Deferring {name}: {destination} is being extracted "
+                             f"from {busy_with}")
+            self.retry_later(name)
+            return
+        reason = self.engine.claim_archive(zip_info)
+        if reason:
+            with self.lock:
+                del self.active[destination]
+            self.slots.release()
+            self.logger.info(f"Skipping {name}: {reason}")
+            if zip_info.get('claimed_by'):
+                # Busy elsewhere: look at it again once it has settled anew
+                self.retry_later(name)
+            return
+        future = pool.submit(zip_info)
+        future.add_done_callback(lambda f: self.finished(pool, zip_info, destination, f))
+
+    def retry_later(self, name):
+        """Hand a file back to the watcher, to be submitted once it settles again"""
+        with self.lock:
+            self.seen.pop(name, None)
+        self.watcher.pending.setdefault(name, None)
+
+    def finished(self, pool, zip_info, destination, future):
+        """Record the outcome of one archive"""
+        try:
+            ok = pool.result(zip_info, future)
+        finally:
+            self.slots.release()
+
+        with self.lock:
+            self.engine.report_result(zip_info, ok)
+            self.active.pop(destination, None)
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+            processed, failed = self.processed, self.failed
+            recorded = ok and zip_info.get('fingerprint') and self.engine.skip_processed
+            if recorded or not os.path.exists(zip_info['zip_path']):
+                # Deleted after extraction, so a new file may reuse the name,
+                # or kept and skipped through the ledger from now on
+                self.seen.pop(zip_info['filename'], None)
+            self.unsaved += 1
+            due = (self.unsaved >= LEDGER_SAVE_EVERY
+                   or time.monotonic() - self.last_save >= LEDGER_SAVE_INTERVAL)
+        if due:
+            self.save_ledger()
+        if self.on_done:
+            self.on_done(zip_info, ok, processed, failed)
+
+    def save_ledger(self):
+        """Write back the ledger and forget files that left the folder"""
+        with self.lock:
+            self.unsaved = 0
+            self.last_save = time.monotonic()
+            for name in [name for name in self.seen
+                         if not os.path.exists(os.path.join(self.engine.downloads_folder, name))]:
+                del self.seen[name]
+        self.engine.ledger.save()
+
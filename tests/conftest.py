@@ -0,0 +1,38 @@
+import os
+import atexit
+import shutil
+import tempfile
+import zipfile
+
+import pytest
+
+# The extractor keeps its settings, ledger, journal and caches in the home
+# folder, with paths fixed at import time: give the tests (and the
+# processes they start) one of their own before extractor is imported
+HOME = tempfile.mkdtemp(prefix='music_extractor_tests_')
+os.environ['HOME'] = os.environ['USERPROFILE'] = HOME
+atexit.register(shutil.rmtree, HOME, True)
+
+
+def write_album_zip(path, album, tracks=3, size=20000):
+    """Write a zip holding an album folder of random 'tracks'; return its path"""
+    with zipfile.ZipFile(path, 'w') as zf:
+        for number in range(1, tracks + 1):
+            zf.writestr(f"{album}/{number:02d} Track.mp3", os.urandom(size))
+    return str(path)
+
+
+@pytest.fixture
+def album_zip():
+    """write_album_zip, for tests that need archives"""
+    return write_album_zip
+
+
+@pytest.fixture
+def folders(tmp_path):
+    """A downloads folder, a library and a settings file that does not exist"""
+    downloads = tmp_path / 'downloads'
+    library = tmp_path / 'library'
+    downloads.mkdir()
+    library.mkdir()
+    return str(downloads), str(library), str(tmp_path / 'settings.json')
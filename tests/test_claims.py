@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import subprocess
+
+import pytest
+
+from extractor.claims import Coordinator, LostClaim, STATE_DONE, claim_key
+from extractor.engine import ExtractorEngine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def age(path, seconds):
+    """Set back the mtime of path as if its holder had stopped refreshing it"""
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def zip_info_key(zip_info):
+    """Return the key of the claim engine.claim_archive takes on the archive"""
+    st = os.stat(zip_info['zip_path'])
+    return claim_key(zip_info['filename'].replace(os.sep, '/'), st.st_size, st.st_mtime_ns)
+
+
+def test_two_processes_extract_each_archive_once(folders, album_zip):
+    downloads, library, settings = folders
+    names = [f"Artist {i} - Album {i}" for i in range(12)]
+    for name in names:
+        album_zip(os.path.join(downloads, name + '.zip'), name.split(' - ')[1])
+    command = [sys.executable, '-m', 'extractor.cli', 'extract', '--settings', settings,
+               '--downloads', downloads, '--library', library, '--coordinate', '--keep-zips']
+    runs = [subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, universal_newlines=True)
+            for _ in range(2)]
+    output = ''.join(run.communicate(timeout=120)[0] for run in runs)
+    assert all(run.returncode == 0 for run in runs), output
+    for name in names:
+        assert output.count(f"Successfully processed: {name}.zip") == 1, output
+    for i in range(12):
+        album = os.path.join(library, f"Artist {i}", f"Album {i}")
+        assert sorted(os.listdir(album)) == ['01 Track.mp3', '02 Track.mp3', '03 Track.mp3']
+
+
+def test_stale_claim_is_taken_over(tmp_path):
+    claims_dir = str(tmp_path / 'claims')
+    dead = Coordinator(claims_dir, lease=30)
+    assert dead.claim('key', archive='a.zip') == (True, None)
+    # The holder dies without releasing: no more heartbeats
+    dead.stop_event.set()
+    age(dead._path('key'), 60)
+
+    live = Coordinator(claims_dir, lease=30)
+    assert live.claim('key', archive='a.zip') == (True, None)
+    assert live.holds('key', live.token('key'))
+    assert not dead.holds('key', dead.token('key'))
+    live.close()
+
+
+def test_live_claim_is_not_taken_over(tmp_path):
+    claims_dir = str(tmp_path / 'claims')
+    holder = Coordinator(claims_dir, lease=30)
+    holder.claim('key', archive='a.zip')
+    ok, record = Coordinator(claims_dir, lease=30).claim('key', archive='a.zip')
+    assert not ok
+    assert record['token'] == holder.token('key')
+    holder.close()
+
+
+def test_lost_claim_aborts_before_commit(folders, album_zip):
+    downloads, library, _ = folders
+    zip_path = album_zip(os.path.join(downloads, 'Artist - Album.zip'), 'Album')
+    engine = ExtractorEngine(downloads, library, auto_delete=False, coordinate=True,
+                             claim_lease=30)
+    zip_info = engine.find_music_zips()[0]
+    assert engine.claim_archive(zip_info) is None
+    engine.check_claims(zip_info)
+
+    # Another extractor breaks the claims after this one stalled
+    engine.coordinator.stop_event.set()
+    other = Coordinator(engine.coordinator.claims_dir, lease=30)
+    for key, _ in zip_info['claims']:
+        age(engine.coordinator._path(key), 60)
+        assert other.claim(key)[0]
+    with pytest.raises(LostClaim):
+        engine.check_claims(zip_info)
+
+    assert not engine.process_music_zip(zip_info)
+    assert not os.path.exists(os.path.join(library, 'Artist', 'Album'))
+    assert os.path.exists(zip_path)
+    # The outcome is left to the extractor that took the claim over
+    engine.report_result(zip_info, False)
+    archive_key = zip_info_key(zip_info)
+    assert engine.coordinator.finished(archive_key) is None
+    other.close()
+    engine.coordinator.close()
+
+
+def test_force_ignores_done_marker(folders, album_zip):
+    downloads, library, _ = folders
+    album_zip(os.path.join(downloads, 'Artist - Album.zip'), 'Album')
+    engine = ExtractorEngine(downloads, library, auto_delete=False, coordinate=True)
+    zip_info = engine.find_music_zips()[0]
+    key = zip_info_key(zip_info)
+    engine.coordinator.claim(key)
+    engine.coordinator.finish(key, STATE_DONE, archive=zip_info['filename'])
+
+    assert engine.claim_archive(zip_info).startswith('already done by')
+    engine.skip_processed = False
+    assert engine.claim_archive(zip_info) is None
+    engine.coordinator.close()
@@ -0,0 +1,161 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from extractor.engine import ExtractorEngine
+from extractor.journal import Journal
+from extractor.ledger import Ledger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Extracts the one archive in the downloads folder with a journal, killing
+# the process (no cleanup, no finally blocks) at the step named in argv
+CRASH_SCRIPT = '''
+import os
+import sys
+from extractor.engine import ExtractorEngine
+from extractor.journal import Journal
+from extractor.ledger import Ledger
+
+downloads, library, journal_dir, ledger_file, point, streaming = sys.argv[1:]
+engine = ExtractorEngine(downloads, library, streaming=streaming == 'streaming',
+                         deferred_delete=False)
+engine.journal = Journal(journal_dir)
+engine.ledger = Ledger(ledger_file)
+rename = os.rename
+
+
+def crash(*args, **kwargs):
+    os._exit(9)
+
+
+def stage_partly(zip_ref, album_folder_name, staging_dir, hashes):
+    with open(os.path.join(staging_dir, '01 Track.mp3'), 'wb') as f:
+        f.write(b'half')
+    crash()
+
+
+def rename_until(moving):
+    def patched(src, dst):
+        if moving(src):
+            crash()
+        rename(src, dst)
+    return patched
+
+
+def fail_staging(*args):
+    raise OSError('disk full')
+
+
+if point == 'stage':
+    engine.stage_album = stage_partly
+elif point == 'commit':
+    engine.commit_album = crash
+elif point == 'aside':
+    os.rename = rename_until(lambda src: os.path.basename(src) == 'Album')
+elif point == 'swap':
+    os.rename = rename_until(lambda src: os.path.basename(src).startswith('.staging_'))
+elif point == 'delete':
+    engine.remove_source = crash
+elif point == 'report':
+    engine.report_result = crash
+elif point == 'failed':
+    engine.stage_album = fail_staging
+    engine.report_result = crash
+
+zip_info = engine.find_music_zips()[0]
+engine.mark_processed([zip_info], False)
+ok = engine.process_music_zip(zip_info)
+engine.report_result(zip_info, ok)
+'''
+
+
+@pytest.fixture
+def interrupted(folders, album_zip, tmp_path):
+    """Run CRASH_SCRIPT against 'Artist - Album.zip', replacing an older copy"""
+    downloads, library, _ = folders
+    zip_path = album_zip(os.path.join(downloads, 'Artist - Album.zip'), 'Album')
+    old = os.path.join(library, 'Artist', 'Album')
+    os.makedirs(old)
+    with open(os.path.join(old, 'old.mp3'), 'wb') as f:
+        f.write(b'old')
+    journal_dir = str(tmp_path / 'journal')
+    ledger_file = str(tmp_path / 'ledger.json')
+
+    def run(point, streaming='streaming'):
+        result = subprocess.run([sys.executable, '-c', CRASH_SCRIPT, downloads, library,
+                                 journal_dir, ledger_file, point, streaming],
+                                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True)
+        assert result.returncode == 9, result.stdout
+        assert os.listdir(journal_dir), "the killed run left no journal"
+        engine = ExtractorEngine(downloads, library, deferred_delete=False)
+        engine.journal = Journal(journal_dir)
+        engine.ledger = Ledger(ledger_file)
+        completed = engine.recover()
+        assert os.listdir(journal_dir) == []
+        saved = Ledger(ledger_file)
+        saved.load()
+        return completed, saved.archives
+
+    return run, zip_path, os.path.join(library, 'Artist')
+
+
+def album_files(artist_dir):
+    return sorted(os.listdir(os.path.join(artist_dir, 'Album')))
+
+
+def leftovers(artist_dir):
+    return [name for name in os.listdir(artist_dir) if name.startswith('.')]
+
+
+NEW_ALBUM = ['01 Track.mp3', '02 Track.mp3', '03 Track.mp3']
+
+
+@pytest.mark.parametrize('point', ['stage', 'failed'])
+def test_unfinished_extraction_is_undone(interrupted, point):
+    # planned (killed while staging) and failed: the old album stays, the
+    # archive is extracted again next run
+    run, zip_path, artist_dir = interrupted
+    completed, recorded = run(point)
+    assert completed == 0
+    assert album_files(artist_dir) == ['old.mp3']
+    assert leftovers(artist_dir) == []
+    assert os.path.exists(zip_path)
+    assert recorded == {}
+
+
+def test_unfinished_temp_folder_is_removed(interrupted):
+    # planned in the temp folder mode
+    run, zip_path, artist_dir = interrupted
+    completed, _ = run('stage', 'tempdir')
+    assert completed == 0
+    assert album_files(artist_dir) == ['old.mp3']
+    assert not [name for name in os.listdir(os.path.dirname(zip_path))
+                if name.startswith('temp_extract_')]
+    assert os.path.exists(zip_path)
+
+
+@pytest.mark.parametrize('point', ['commit', 'aside', 'swap', 'delete'])
+def test_staged_or_committed_album_is_rolled_forward(interrupted, point):
+    # staged (killed before, or at each rename of, the commit) and
+    # committed (killed before deleting the zip)
+    run, zip_path, artist_dir = interrupted
+    completed, recorded = run(point)
+    assert completed == 1
+    assert album_files(artist_dir) == NEW_ALBUM
+    assert leftovers(artist_dir) == []
+    assert not os.path.exists(zip_path)
+    assert len(recorded) == 1
+
+
+def test_deleted_source_needs_nothing(interrupted):
+    # source_deleted: every step was done before the kill
+    run, zip_path, artist_dir = interrupted
+    completed, _ = run('report')
+    assert completed == 0
+    assert album_files(artist_dir) == NEW_ALBUM
+    assert leftovers(artist_dir) == []
+    assert not os.path.exists(zip_path)
@@ -0,0 +1,90 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from extractor import nested
+from extractor.engine import ExtractorEngine
+from extractor.nested import MemberWindow, open_nested
+
+
+def inner_zip(disc, tracks=2, size=5000):
+    """Return the bytes of a disc zip with its own top-level folder"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for number in range(1, tracks + 1):
+            zf.writestr(f"Disc {disc}/{number:02d} Track.flac", bytes([disc, number]) * size)
+    return buffer.getvalue()
+
+
+def box_set(path, prefix='', compression=zipfile.ZIP_STORED, discs=2):
+    """Write an outer zip holding one zip per disc below prefix"""
+    with zipfile.ZipFile(path, 'w') as zf:
+        for disc in range(1, discs + 1):
+            zf.writestr(zipfile.ZipInfo(f"{prefix}Disc {disc}.zip"), inner_zip(disc),
+                        compress_type=compression)
+    return str(path)
+
+
+def test_member_window_reads_its_range_only(tmp_path):
+    path = tmp_path / 'data'
+    path.write_bytes(b'0123456789abcdef')
+    with MemberWindow(str(path), 4, 8) as window:
+        assert window.read() == b'456789ab'
+        assert window.read() == b''
+        assert window.seek(-3, io.SEEK_END) == 5
+        assert window.read(2) == b'9a'
+        window.seek(1)
+        window.seek(2, io.SEEK_CUR)
+        assert window.tell() == 3
+        assert window.read(100) == b'789ab'
+        # Past the end reads nothing rather than the bytes that follow
+        window.seek(20)
+        assert window.read(4) == b''
+        with pytest.raises(ValueError):
+            window.seek(-1)
+    assert window.closed
+
+
+def test_stored_inner_zip_is_read_in_place(tmp_path):
+    with zipfile.ZipFile(box_set(tmp_path / 'box.zip')) as outer:
+        info = outer.getinfo('Disc 1.zip')
+        with open_nested(outer, info) as inner:
+            assert isinstance(inner.fp, MemberWindow)
+            assert inner.read('Disc 1/02 Track.flac') == bytes([1, 2]) * 5000
+
+
+@pytest.mark.parametrize('spool_size, rolled', [(nested.SPOOL_SIZE, False), (1024, True)])
+def test_compressed_inner_zip_spools(tmp_path, monkeypatch, spool_size, rolled):
+    monkeypatch.setattr(nested, 'SPOOL_SIZE', spool_size)
+    path = box_set(tmp_path / 'box.zip', compression=zipfile.ZIP_DEFLATED)
+    with zipfile.ZipFile(path) as outer:
+        info = outer.getinfo('Disc 2.zip')
+        with open_nested(outer, info, str(tmp_path)) as inner:
+            # Kept in memory, or spilled to a temporary file once too large
+            assert inner.fp._rolled is rolled
+            assert inner.read('Disc 2/01 Track.flac') == bytes([2, 1]) * 5000
+        assert nested.nested_size(outer, info) == 2 * 10000
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+@pytest.mark.parametrize('prefix', ['', 'Box/'])
+def test_box_set_is_unpacked_per_disc(folders, monkeypatch, streaming, prefix):
+    downloads, library, _ = folders
+    # Spill the compressed discs to disk, as large ones would
+    monkeypatch.setattr(nested, 'SPOOL_SIZE', 1024)
+    box_set(os.path.join(downloads, 'Artist - Box.zip'), prefix, zipfile.ZIP_DEFLATED)
+    engine = ExtractorEngine(downloads, library, streaming=streaming, journal=False,
+                             deferred_delete=False, auto_delete=False)
+    zip_info = engine.find_music_zips()[0]
+    assert engine.process_music_zip(zip_info)
+
+    album = os.path.join(library, 'Artist', 'Box')
+    assert sorted(os.listdir(album)) == ['Disc 1', 'Disc 2']
+    for disc in (1, 2):
+        with open(os.path.join(album, f"Disc {disc}", '02 Track.flac'), 'rb') as f:
+            assert f.read() == bytes([disc, 2]) * 5000
+    assert zip_info['bytes'] == 4 * 10000
+    # Nothing is left behind in the downloads folder
+    assert os.listdir(downloads) == ['Artist - Box.zip']
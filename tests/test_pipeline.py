@@ -0,0 +1,66 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from extractor.engine import ExtractorEngine, WorkerPool
+from extractor.pipeline import IngestPipeline
+from extractor.progress import ByteProgress
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_ingest_extracts_every_archive(folders, album_zip, streaming):
+    downloads, library, _ = folders
+    for i in range(6):
+        album_zip(os.path.join(downloads, f"Artist {i} - Album {i}.zip"), f"Album {i}")
+    engine = ExtractorEngine(downloads, library, streaming=streaming, jobs=2,
+                             journal=False, deferred_delete=False)
+    assert engine.ingest() == (6, 0)
+    for i in range(6):
+        assert len(os.listdir(os.path.join(library, f"Artist {i}", f"Album {i}"))) == 3
+    assert os.listdir(downloads) == []
+
+
+class Inspector:
+    """Run IngestPipeline._inspect on archives of a given size and free space"""
+
+    def __init__(self, folders):
+        downloads, library, _ = folders
+        self.engine = ExtractorEngine(downloads, library, journal=False)
+        self.engine.progress = ByteProgress({})
+        self.pipeline = IngestPipeline(self.engine, WorkerPool(self.engine))
+        self.pipeline.loop = asyncio.new_event_loop()
+        self.pipeline.executor = ThreadPoolExecutor(max_workers=1)
+
+    def inspect(self, name, size, space):
+        zip_info = {'zip_path': name, 'filename': name}
+        self.pipeline._read_archive = lambda zip_info: (size, False, space)
+        _, ok = self.pipeline.loop.run_until_complete(self.pipeline._inspect(zip_info))
+        # None: passed on to be extracted; False: failed
+        return ok is None
+
+    def close(self):
+        self.pipeline.executor.shutdown()
+        self.pipeline.loop.close()
+        self.pipeline.pool.shutdown()
+
+
+def test_reservations_are_per_device_and_shrink_as_albums_land(folders):
+    inspector = Inspector(folders)
+    try:
+        assert inspector.inspect('a.zip', 100, {1: 150})
+        # a.zip still has 100 bytes to write to device 1
+        assert not inspector.inspect('b.zip', 100, {1: 150})
+        # Another filesystem has its own budget
+        assert inspector.inspect('c.zip', 100, {2: 150})
+        # Written bytes already left the free space: only the rest is held
+        inspector.engine.progress.advance('a.zip', 60)
+        assert inspector.inspect('d.zip', 100, {1: 150})
+        # A temp folder extraction needs room on both devices
+        assert not inspector.inspect('e.zip', 20, {1: 500, 2: 100})
+        # Finished archives hold nothing
+        inspector.engine.progress.finish('c.zip')
+        assert inspector.inspect('f.zip', 20, {1: 500, 2: 100})
+    finally:
+        inspector.close()
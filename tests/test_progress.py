@@ -0,0 +1,63 @@
+import threading
+
+from extractor import progress
+from extractor.progress import ByteProgress, format_eta
+
+
+def test_advance_never_runs_past_an_archive():
+    bar = ByteProgress({'a.zip': 100, 'b.zip': 50})
+    bar.advance('a.zip', 60)
+    bar.advance('a.zip', 60)
+    assert bar.remaining('a.zip') == 0
+    bar.finish('b.zip')
+    bar.finish('b.zip')
+    assert (bar.done, bar.total) == (150, 150)
+
+
+def test_add_and_drop_adjust_the_total():
+    bar = ByteProgress({'a.zip': 100})
+    bar.add('b.zip', 40)
+    bar.advance('b.zip', 10)
+    assert bar.remaining('b.zip') == 30
+    bar.drop('b.zip')
+    # What b.zip already wrote stays done; its remainder leaves the total
+    assert (bar.done, bar.total) == (10, 110)
+    assert bar.remaining('b.zip') == 0
+
+
+def test_concurrent_advances_are_counted_once():
+    bar = ByteProgress({f"{n}.zip": 10000 for n in range(8)})
+
+    def write(name):
+        for _ in range(10000):
+            bar.advance(name, 1)
+
+    threads = [threading.Thread(target=write, args=(f"{n}.zip",)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert bar.done == bar.total == 80000
+
+
+def test_rate_and_eta_use_recent_samples(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(progress.time, 'monotonic', lambda: now[0])
+    bar = ByteProgress({'a.zip': 1000})
+    for _ in range(5):
+        now[0] += 1
+        bar.advance('a.zip', 100)
+    done, total, rate, eta = bar.snapshot()
+    assert (done, total) == (500, 1000)
+    assert rate == 100
+    assert eta == 5
+    assert bar.describe().endswith('ETA 0:05')
+    # Samples older than the window stop counting: nothing was written since
+    now[0] += progress.RATE_WINDOW * 3
+    assert bar.snapshot()[2:] == (0, None)
+
+
+def test_format_eta():
+    assert format_eta(None) == '--:--'
+    assert format_eta(59.6) == '1:00'
+    assert format_eta(3725) == '1:02:05'
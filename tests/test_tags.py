@@ -0,0 +1,125 @@
+import io
+import struct
+import zipfile
+
+import pytest
+
+from extractor import tags
+from extractor.tags import read_tags, probe_archive
+
+FIELDS = {'albumartist': 'Various Ärtists', 'artist': 'Someone', 'album': 'Ÿes – Live'}
+
+
+def syncsafe(n):
+    return bytes([(n >> 21) & 0x7f, (n >> 14) & 0x7f, (n >> 7) & 0x7f, n & 0x7f])
+
+
+def unsync(data):
+    """Insert a 0x00 after every 0xff, as an ID3 writer may"""
+    return data.replace(b'\xff', b'\xff\x00')
+
+
+def text_frame(version, frame_id, text, flags=0, extra=b''):
+    # UTF-16 with a byte order mark (0xff 0xfe), so unsynchronisation applies
+    data = extra + b'\x01' + text.encode('utf-16')
+    if version == 4:
+        if flags & 0x02:
+            data = extra + unsync(data[len(extra):])
+        return frame_id + syncsafe(len(data)) + b'\x00' + bytes([flags]) + data
+    return frame_id + struct.pack('>I', len(data)) + b'\x00' + bytes([flags]) + data
+
+
+def id3(version, frames, flags=0, padding=64):
+    body = b''.join(frames)
+    # A large frame that is skipped, full of bytes needing unsynchronisation
+    body = (b'APIC' + (syncsafe if version == 4 else lambda n: struct.pack('>I', n))(3000)
+            + b'\x00\x00' + b'\xff\xe0' * 1500) + body + b'\x00' * padding
+    if flags & 0x80 and version < 4:
+        body = unsync(body)
+    return b'ID3' + bytes([version, 0, flags]) + syncsafe(len(body)) + body
+
+
+def id3_frames(version, flags=0, extra=b''):
+    return [text_frame(version, b'TPE2', FIELDS['albumartist'], flags, extra),
+            text_frame(version, b'TPE1', FIELDS['artist'], flags, extra),
+            text_frame(version, b'TALB', FIELDS['album'], flags, extra)]
+
+
+def flac(comments=FIELDS, count=None):
+    stream_info = b'\x00' + (34).to_bytes(3, 'big') + b'\x00' * 34
+    picture = b'\x06' + (5000).to_bytes(3, 'big') + b'\xff' * 5000
+    vendor = b'reference'
+    entries = [f"{key.upper()}={value}".encode('utf-8') for key, value in comments.items()]
+    data = (struct.pack('<I', len(vendor)) + vendor
+            + struct.pack('<I', len(entries) if count is None else count)
+            + b''.join(struct.pack('<I', len(entry)) + entry for entry in entries))
+    block = b'\x84' + len(data).to_bytes(3, 'big') + data
+    return b'fLaC' + stream_info + picture + block + b'\xff\xf8' * 100
+
+
+def atom(kind, payload):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def mp4():
+    items = b''.join(atom(kind, atom(b'data', b'\x00\x00\x00\x01\x00\x00\x00\x00'
+                                     + FIELDS[name].encode('utf-8')))
+                     for kind, name in ((b'aART', 'albumartist'), (b'\xa9ART', 'artist'),
+                                        (b'\xa9alb', 'album')))
+    meta = atom(b'meta', b'\x00' * 4 + atom(b'hdlr', b'\x00' * 25) + atom(b'ilst', items))
+    return (atom(b'ftyp', b'M4A \x00\x00\x00\x00') + atom(b'free', b'\x00' * 2000)
+            + atom(b'moov', atom(b'mvhd', b'\x00' * 100) + atom(b'udta', meta)))
+
+
+@pytest.mark.parametrize('data', [
+    id3(3, id3_frames(3)),
+    id3(4, id3_frames(4)),
+    # Whole-tag unsynchronisation (2.3), frame by frame with a data length
+    # indicator (2.4), and the 2.4 tag flag meaning every frame
+    id3(3, id3_frames(3), flags=0x80),
+    id3(4, id3_frames(4, 0x02 | 0x01, syncsafe(40))),
+    id3(4, id3_frames(4, 0x02), flags=0x80),
+    # Grouping identity bytes before the text
+    id3(3, id3_frames(3, 0x20, b'\x07')),
+    id3(4, id3_frames(4, 0x40, b'\x07')),
+    flac(),
+    # FLAC behind an ID3 tag that names nothing useful, unsynchronised
+    id3(3, [], flags=0x80) + flac(),
+    mp4(),
+], ids=['id3v2.3', 'id3v2.4', 'v2.3-unsync', 'v2.4-frame-unsync', 'v2.4-tag-unsync',
+        'v2.3-group', 'v2.4-group', 'flac', 'id3-then-flac', 'mp4'])
+def test_tags_are_read(data):
+    assert read_tags(io.BytesIO(data)) == FIELDS
+
+
+@pytest.mark.parametrize('data', [id3(3, id3_frames(3)), id3(3, id3_frames(3), flags=0x80),
+                                  id3(4, id3_frames(4, 0x03, syncsafe(40))), flac(), mp4()],
+                         ids=['id3v2.3', 'v2.3-unsync', 'v2.4-frame-unsync', 'flac', 'mp4'])
+def test_truncated_tags_give_whole_fields_or_none(data):
+    for length in range(len(data) + 1):
+        fields = read_tags(io.BytesIO(data[:length]))
+        # Nothing half-read: every field found is complete and correct
+        assert set(fields.items()) <= set(FIELDS.items()), length
+
+
+def test_sizes_beyond_the_data_are_harmless():
+    # Frame claiming more than the tag holds
+    broken = bytearray(id3(3, id3_frames(3)))
+    start = broken.index(b'TPE1')
+    broken[start + 4:start + 8] = struct.pack('>I', 0x7fffffff)
+    assert read_tags(io.BytesIO(bytes(broken))) == {'albumartist': FIELDS['albumartist']}
+    # Vorbis comment count larger than the comments present
+    assert read_tags(io.BytesIO(flac(count=1000))) == FIELDS
+    # Tag larger than the probe budget
+    huge = b'ID3\x03\x00\x80' + syncsafe(tags.PROBE_LIMIT * 2) + b'\xff' * 100
+    assert read_tags(io.BytesIO(huge)) == {}
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_probe_skips_a_truncated_track(tmp_path, compression):
+    path = str(tmp_path / 'album.zip')
+    data = id3(3, id3_frames(3), flags=0x80)
+    with zipfile.ZipFile(path, 'w', compression) as zf:
+        zf.writestr('Album/01 Track.mp3', data[:len(data) // 2])
+        zf.writestr('Album/02 Track.mp3', data)
+    assert probe_archive(path) == (FIELDS['albumartist'], FIELDS['album'])
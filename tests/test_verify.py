@@ -0,0 +1,129 @@
+import os
+import json
+import zlib
+import struct
+import hashlib
+import zipfile
+
+import pytest
+
+from extractor import verify
+from extractor.engine import ExtractorEngine
+from extractor.verify import HashLog, MemberCheck, VerifyError, HASH_LOG_NAME
+
+TRACK = bytes(range(256)) * 40
+
+
+def checked(data, expected_size, expected_crc=None, algorithm=None):
+    check = MemberCheck('01 Track.flac', expected_size, expected_crc, algorithm)
+    for start in range(0, len(data), 1000):
+        check.update(data[start:start + 1000])
+    return check
+
+
+def test_member_check_accepts_what_the_archive_holds():
+    check = checked(TRACK, len(TRACK), zlib.crc32(TRACK), 'sha256')
+    check.verify()
+    assert check.record() == {'path': '01 Track.flac', 'size': len(TRACK),
+                              'crc32': f"{zlib.crc32(TRACK):08x}",
+                              'sha256': hashlib.sha256(TRACK).hexdigest()}
+
+
+def test_member_check_rejects_short_writes():
+    with pytest.raises(VerifyError, match='Wrote 10239 bytes'):
+        checked(TRACK[:-1], len(TRACK), zlib.crc32(TRACK)).verify()
+
+
+def test_member_check_rejects_corrupt_data():
+    corrupt = b'\xff' + TRACK[1:]
+    with pytest.raises(VerifyError, match='CRC-32'):
+        checked(corrupt, len(TRACK), zlib.crc32(TRACK)).verify()
+    # Tar members have no CRC-32 to compare: only the size is checked
+    checked(corrupt, len(TRACK)).verify()
+
+
+def test_check_algorithm():
+    assert verify.check_algorithm('SHA256') == 'sha256'
+    assert verify.check_algorithm(None) is None
+    with pytest.raises(ValueError):
+        verify.check_algorithm('nosuchhash')
+
+
+def test_hash_log_appends_library_relative_paths(tmp_path):
+    log = HashLog(str(tmp_path))
+    album = os.path.join(str(tmp_path), 'Artist', 'Album')
+    log.append('Artist - Album.zip', album, [])
+    assert not os.path.exists(log.path)
+
+    log.append('Artist - Album.zip', album, [{'path': '01.flac', 'size': 1, 'crc32': '00'},
+                                             {'path': 'CD2/01.flac', 'size': 2, 'crc32': '01'}])
+    log.append('Other - Album.zip', os.path.join(str(tmp_path), 'Other', 'Album'),
+               [{'path': '01.flac', 'size': 3, 'crc32': '02'}])
+    with open(log.path, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert [(line['path'], line['archive'], line['size']) for line in lines] == [
+        ('Artist/Album/01.flac', 'Artist - Album.zip', 1),
+        ('Artist/Album/CD2/01.flac', 'Artist - Album.zip', 2),
+        ('Other/Album/01.flac', 'Other - Album.zip', 3)]
+
+
+def album_zip_with(path, data, compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(path, 'w', compression) as zf:
+        zf.writestr('Album/01 Track.flac', data)
+        zf.writestr('Album/02 Track.flac', data[::-1])
+    return str(path)
+
+
+def corrupt_crc(path, data):
+    """Change the recorded CRC-32 of data's member, leaving the data alone"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    crc = struct.pack('<I', zlib.crc32(data))
+    # Local file header and central directory entry
+    assert raw.count(crc) == 2
+    with open(path, 'wb') as f:
+        f.write(raw.replace(crc, struct.pack('<I', zlib.crc32(data) ^ 1)))
+
+
+@pytest.mark.parametrize('zero_copy', [True, False])
+@pytest.mark.parametrize('streaming', [True, False])
+def test_written_files_are_logged(folders, zero_copy, streaming):
+    downloads, library, _ = folders
+    album_zip_with(os.path.join(downloads, 'Artist - Album.zip'), TRACK)
+    engine = ExtractorEngine(downloads, library, streaming=streaming, zero_copy=zero_copy,
+                             verify_hash='sha256', journal=False, deferred_delete=False)
+    assert engine.process_music_zip(engine.find_music_zips()[0])
+
+    with open(os.path.join(library, HASH_LOG_NAME), encoding='utf-8') as f:
+        lines = sorted((json.loads(line) for line in f), key=lambda line: line['path'])
+    assert [line['path'] for line in lines] == ['Artist/Album/01 Track.flac',
+                                                'Artist/Album/02 Track.flac']
+    assert lines[0]['sha256'] == hashlib.sha256(TRACK).hexdigest()
+    assert lines[1]['crc32'] == f"{zlib.crc32(TRACK[::-1]):08x}"
+
+
+@pytest.mark.parametrize('zero_copy', [True, False])
+@pytest.mark.parametrize('mode', ['streaming', 'tempdir', 'sync'])
+def test_mismatch_keeps_the_zip_and_the_old_album(folders, caplog, zero_copy, mode):
+    downloads, library, _ = folders
+    zip_path = album_zip_with(os.path.join(downloads, 'Artist - Album.zip'), TRACK)
+    corrupt_crc(zip_path, TRACK)
+    old = os.path.join(library, 'Artist', 'Album')
+    os.makedirs(old)
+    with open(os.path.join(old, '01 Track.flac'), 'wb') as f:
+        f.write(b'old')
+    engine = ExtractorEngine(downloads, library, streaming=mode != 'tempdir',
+                             zero_copy=zero_copy, journal=False, deferred_delete=False,
+                             existing_album='sync' if mode == 'sync' else 'replace')
+
+    assert not engine.process_music_zip(engine.find_music_zips()[0])
+    # From the check on written data, or zipfile's own while reading
+    assert "CRC-32" in caplog.text
+    assert os.path.exists(zip_path)
+    with open(os.path.join(old, '01 Track.flac'), 'rb') as f:
+        assert f.read() == b'old'
+    # No staging, temp or partial files are left, and nothing is logged
+    assert [name for name in os.listdir(os.path.dirname(old)) if name != 'Album'] == []
+    assert all(not name.startswith('.') for name in os.listdir(old))
+    assert os.listdir(downloads) == ['Artist - Album.zip']
+    assert not os.path.exists(os.path.join(library, HASH_LOG_NAME))